@@ -1,159 +1,266 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
-import pandas as pd
+from flask import Flask, render_template, request, jsonify, send_from_directory, Response, g
 import os
+import sys
 import json
-from datetime import datetime
-from source.heatmap_generator import generate_heatmap
-import math
+import time
+import logging
+from source.heatmap_cache import HeatmapCache
+from source.render_pool import RenderPool, RenderUnavailable
+from source.player_store import serialise
+from source.snapshot import SnapshotManager
+from source.similarity import MAX_QUERY_K
+from source.name_index import DEFAULT_LIMIT, MAX_LIMIT
+from source.serving_metrics import ServingMetrics
+from source.sampling_profiler import RequestProfiler
+
+# Development server. Render workers re-run a script __main__ when they
+# start, so `python app.py` serves this file as the importable `app` module
+# instead of loading everything again in each worker. In production serve
+# asgi.py with uvicorn (see README)
+if __name__ == '__main__':
+    os.execv(sys.executable, [sys.executable, '-m', 'flask', '--app', 'app', 'run',
+                              '--host', '0.0.0.0', '--port', os.environ.get('PORT', '5000')])
+
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING').upper())
+logger = logging.getLogger('pocket_scout')
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 
-def clean_nan_values(obj):
-    """Recursively replace NaN values with None"""
-    if isinstance(obj, dict):
-        return {k: clean_nan_values(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [clean_nan_values(v) for v in obj]
-    elif pd.isna(obj) or (isinstance(obj, float) and math.isnan(obj)):
-        return None
-    else:
-        return obj
+# Cold heatmaps are rendered by a pool of lower-priority worker processes,
+# started by a forkserver so they share nothing with this process.
+# HEATMAP_RENDER_WORKERS=0 renders inline instead.
+render_pool = RenderPool.from_env()
+
+# Player profiles, neighbour lists, name and similarity indexes and heatmap
+# features, built together as one snapshot. A newer snapshot published with
+# `python -m source.snapshot publish` is built in the background and swapped
+# in atomically; handlers read `snapshots.current` once per request.
+snapshots = SnapshotManager.from_env()
+snapshots.load()
+snapshots.watch(float(os.environ.get('SNAPSHOT_POLL_SECONDS', 30)))
 
-# Load data from data/ folder
-df = pd.read_csv('data/final_player_df.csv')
-df.set_index('id', inplace=True)
+# Rendered heatmaps are content-addressed, so the cache survives snapshot swaps
+heatmap_cache = HeatmapCache(
+    cache_dir=os.environ.get('HEATMAP_CACHE_DIR', 'data/heatmap_cache'),
+    max_items=int(os.environ.get('HEATMAP_CACHE_SIZE', 256)),
+    render=render_pool.render
+)
 
-# Load heatmap data from data/ folder
-with open('data/player_heatmap_features.json', 'r') as f:
-    heatmap_data = json.load(f)
+# Per-worker Prometheus metrics served at /metrics, and the opt-in sampling
+# profiler (X-Profile: $PROFILE_TOKEN, or PROFILE_SAMPLE_RATE of requests)
+metrics = ServingMetrics(heatmap_cache, render_pool, snapshots)
+profiler = RequestProfiler.from_env()
 
-# Create dictionaries for quick lookup
-player_dict = {row['full_name']: idx for idx, row in df.iterrows()}
-heatmap_dict = {item['playerId']: item['features'] for item in heatmap_data}
+@app.before_request
+def start_request():
+    g.request_start = time.perf_counter()
+    g.profile = profiler.begin(request.headers.get('X-Profile'))
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    if g.profile is not None:
+        path = profiler.end(g.profile, route)
+        if path is not None:
+            response.headers['X-Profile-Output'] = path
+    metrics.observe(route, response.status_code, time.perf_counter() - g.request_start)
+    return response
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.exposition(), content_type=metrics.content_type)
 
 @app.route("/")
 def home():
-    return render_template('index.html', player_names=list(player_dict.keys()))
+    # Names are looked up through /search as the user types, not embedded in the page
+    return render_template('index.html')
+
+# -----------------------------
+# JSON endpoints. Each *_response builds (status, body bytes) from parsed
+# arguments, so the Flask routes below and the ASGI fast path in asgi.py
+# serve identical responses.
+# -----------------------------
+def _error(message, status, **extra):
+    return status, serialise({'error': message, **extra})
+
+def parse_ids(value):
+    """Unique ids from "1,2,3" in request order, or None when malformed"""
+    try:
+        return list(dict.fromkeys(int(pid) for pid in (value or '').split(',') if pid.strip()))
+    except ValueError:
+        return None
+
+def clamp_k(k):
+    """Optional neighbour count, clamped to what the table holds"""
+    return None if k is None else max(0, min(k, snapshots.current.neighbour_table.k))
+
+def player_response(player_id):
+    with metrics.stage('/player/<int:player_id>', 'lookup'):
+        player_store = snapshots.current.player_store
+        found = player_id in player_store
+    if not found:
+        return _error('Player not found', 404)
+    with metrics.stage('/player/<int:player_id>', 'serialise'):
+        return 200, player_store.get_json(player_id)
+
+def players_response(player_ids):
+    """Profiles for many players at once: /players?ids=1,2,3"""
+    if player_ids is None:
+        return _error('ids must be a comma-separated list of integers', 400)
+
+    player_store = snapshots.current.player_store
+    missing = [pid for pid in player_ids if pid not in player_store]
+    return 200, b'{"missing":' + json.dumps(missing, separators=(',', ':')).encode() + b',"players":' + player_store.many_json(player_ids) + b'}'
+
+def similar_response(player_id, k=None):
+    neighbour_table = snapshots.current.neighbour_table
+    if player_id not in neighbour_table:
+        return _error('Player not found', 404)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Similar players for %s (k=%s): %s", player_id, k, neighbour_table.neighbour_ids(player_id, k))
+    return 200, b'{"similar_players":' + neighbour_table.similar_json(player_id, k) + b'}'
+
+def similar_batch_response(player_ids, k=None):
+    """Neighbour lists for many players at once: /similar_players?ids=1,2,3&k=5"""
+    if player_ids is None:
+        return _error('ids must be a comma-separated list of integers', 400)
+
+    neighbour_table = snapshots.current.neighbour_table
+    found = [pid for pid in player_ids if pid in neighbour_table]
+    missing = [pid for pid in player_ids if pid not in neighbour_table]
+    logger.debug("Batch similar players for %d ids (k=%s), %d missing", len(player_ids), k, len(missing))
+
+    results = b','.join(b'"%d":' % pid + neighbour_table.similar_json(pid, k) for pid in found)
+    return 200, b'{"missing":' + json.dumps(missing, separators=(',', ':')).encode() + b',"similar_players":{' + results + b'}}'
+
+def compare_response(player_a, player_b=None, k=None):
+    """
+    Everything the comparison view needs in one response:
+    /compare?a=1&b=2&k=5 returns both profiles, b's stats minus a's, and
+    a's similar players. Without b, only a's profile and similar players.
+    """
+    if player_a is None:
+        return _error('a must be a player id', 400)
+    snapshot = snapshots.current
+    player_store, neighbour_table = snapshot.player_store, snapshot.neighbour_table
+    missing = [pid for pid in (player_a, player_b) if pid is not None and pid not in player_store]
+    if missing:
+        return _error('Player not found', 404, missing=missing)
+
+    with metrics.stage('/compare', 'lookup'):
+        similar = neighbour_table.similar_json(player_a, k) if player_a in neighbour_table else b'[]'
+        diff = None if player_b is None else player_store.stat_diff(player_a, player_b)
+    with metrics.stage('/compare', 'serialise'):
+        profile_b = b'null' if player_b is None else player_store.get_json(player_b)
+        return 200, (b'{"a":' + player_store.get_json(player_a) + b',"b":' + profile_b + b',"diff":' + serialise(diff) +
+                     b',"similar_players":' + similar + b'}')
+
+MAX_SIMILAR_K = MAX_QUERY_K
+
+def similar_live_response(player_id, k=None, role=None, max_age=None, max_market_value=None, exclude_club=None):
+    """
+    Live top-k search with optional filters:
+    /similar/<id>?k=10&role=CB&max_age=25&max_value=5000000&exclude_club=fc barcelona
+    """
+    snapshot = snapshots.current
+    similarity_index, neighbour_table = snapshot.similarity_index, snapshot.neighbour_table
+    if player_id not in similarity_index:
+        return _error('Player not found', 404)
+
+    k = max(0, min(10 if k is None else k, MAX_SIMILAR_K))
+    with metrics.stage('/similar/<int:player_id>', 'lookup'):
+        ids, distances = similarity_index.query(player_id, k, role=role, max_age=max_age,
+                                                max_market_value=max_market_value, exclude_club=exclude_club)
+        # Snapshot.build rejects indexes with unknown players; never 500 on one that slips through
+        found = [(sid, distance) for sid, distance in zip(ids, distances) if sid in neighbour_table]
+        ids, distances = [sid for sid, _ in found], [distance for _, distance in found]
+    logger.debug("Live similar players for %s (k=%s): %s", player_id, k, ids)
+
+    with metrics.stage('/similar/<int:player_id>', 'serialise'):
+        players = b','.join(neighbour_table.summaries[neighbour_table.offsets[sid]] for sid in ids)
+        return 200, b'{"distances":' + json.dumps(distances, separators=(',', ':')).encode() + b',"similar_players":[' + players + b']}'
+
+def search_response(query, limit=None):
+    """
+    Ranked player-name search for the autocomplete:
+    /search?q=odegaard&limit=10. Accents and case are ignored, every word
+    matches as a prefix, and a typo-tolerant match is used when nothing
+    matches exactly ("fuzzy": true).
+    """
+    limit = max(1, min(DEFAULT_LIMIT if limit is None else limit, MAX_LIMIT))
+    with metrics.stage('/search', 'lookup'):
+        return 200, snapshots.current.name_index.search_json(query or '', limit)
+
+def _json(result):
+    status, body = result
+    return Response(body, status=status, mimetype='application/json')
 
 @app.route('/player/<int:player_id>')
 def get_player(player_id):
-    if player_id not in df.index:
-        return jsonify({'error': 'Player not found'}), 404
-    
-    # Get row and convert to dict, handling potential DataFrame case
-    row_data = df.loc[player_id]
-    if isinstance(row_data, pd.DataFrame):
-        row_data = row_data.iloc[0]
-    
-    # Drop top_knn_ids if it exists and convert to dict
-    if 'top_knn_ids' in row_data:
-        row = row_data.drop('top_knn_ids').to_dict()
-    else:
-        row = row_data.to_dict()
-    
-    # Clean NaN values
-    row = clean_nan_values(row)
-    
-    # Generate heatmap on the fly using the density data
-    if player_id in heatmap_dict:
-        player_name = row.get('full_name', 'Unknown Player')
-        density_features = heatmap_dict[player_id]
-        row['density_plot_url'] = generate_heatmap(density_features, player_name)
-    else:
-        row['density_plot_url'] = None
-    
-    # Handle date formatting safely
-    contract_date = row.get('contract_expiration_date')
-    if contract_date and contract_date != 'NaN':
-        try:
-            row['contract_expiration_date'] = datetime.strptime(
-                str(contract_date), '%Y-%m-%d %H:%M:%S'
-            ).strftime('%Y-%m-%d')
-        except:
-            row['contract_expiration_date'] = "Unknown"
-    else:
-        row['contract_expiration_date'] = "Unknown"
-    
-    # Format market value safely
-    market_value = row.get('market_value_in_eur')
-    if market_value and market_value != 'NaN':
-        try:
-            row['market_value_in_eur'] = "€{:,.0f}".format(float(market_value))
-        except:
-            row['market_value_in_eur'] = "Unknown"
-    else:
-        row['market_value_in_eur'] = "Unknown"
-    
-    return jsonify(row)
+    return _json(player_response(player_id))
+
+@app.route('/players')
+def get_players():
+    return _json(players_response(parse_ids(request.args.get('ids'))))
 
 @app.route('/similar_players/<int:player_id>')
 def get_similar(player_id):
-    print(f"🔍 DEBUG: Getting similar players for player_id: {player_id}")
-    
-    if player_id not in df.index:
-        return jsonify({'error': 'Player not found'}), 404
-
-    top_knn_ids_value = df.loc[player_id]['top_knn_ids']
-    print(f"🔍 DEBUG: top_knn_ids_value: {top_knn_ids_value}")
-    print(f"🔍 DEBUG: Type: {type(top_knn_ids_value)}")
-    
-    # Handle the top_knn_ids
-    if isinstance(top_knn_ids_value, str) and top_knn_ids_value.strip():
-        print(f"🔍 DEBUG: Processing as string")
-        try:
-            # Better cleaning: remove brackets, split by spaces, filter out empty strings
-            cleaned = top_knn_ids_value.strip('[] ')  # Remove brackets and spaces
-            print(f"🔍 DEBUG: After removing brackets: {cleaned}")
-            
-            # Split and filter
-            number_strings = [s for s in cleaned.split() if s.strip()]
-            print(f"🔍 DEBUG: Number strings: {number_strings}")
-            
-            # Convert to integers
-            top_ids = [int(num) for num in number_strings]
-            print(f"🔍 DEBUG: Parsed IDs: {top_ids}")
-            
-        except Exception as e:
-            print(f"❌ Error parsing string: {e}")
-            top_ids = []
-    elif hasattr(top_knn_ids_value, '__iter__') and not isinstance(top_knn_ids_value, str):
-        top_ids = list(top_knn_ids_value)
-        print(f"🔍 DEBUG: Converted iterable to list: {top_ids}")
+    return _json(similar_response(player_id, clamp_k(request.args.get('k', type=int))))
+
+@app.route('/similar_players')
+def get_similar_batch():
+    return _json(similar_batch_response(parse_ids(request.args.get('ids')), clamp_k(request.args.get('k', type=int))))
+
+@app.route('/compare')
+def compare_players():
+    return _json(compare_response(request.args.get('a', type=int), request.args.get('b', type=int),
+                                  clamp_k(request.args.get('k', type=int))))
+
+@app.route('/similar/<int:player_id>')
+def get_similar_live(player_id):
+    return _json(similar_live_response(
+        player_id, request.args.get('k', type=int),
+        role=request.args.get('role'),
+        max_age=request.args.get('max_age', type=float),
+        max_market_value=request.args.get('max_value', type=float),
+        exclude_club=request.args.get('exclude_club')
+    ))
+
+@app.route('/search')
+def search_players():
+    return _json(search_response(request.args.get('q', ''), request.args.get('limit', type=int)))
+
+@app.route('/heatmap/<int:player_id>.png')
+def get_heatmap(player_id):
+    snapshot = snapshots.current
+    if player_id not in snapshot.heatmap_dict:
+        return jsonify({'error': 'Heatmap not found'}), 404
+
+    etag = snapshot.heatmap_etags[player_id]
+    if etag in request.if_none_match:
+        metrics.not_modified.inc()
+        response = Response(status=304)
     else:
-        print(f"❌ Unhandled type or empty: {type(top_knn_ids_value)}")
-        top_ids = []
-
-    print(f"🔍 DEBUG: Final top_ids: {top_ids}")
-    
-    players = []
-    for sid in top_ids:
-        # Skip the player themselves and check if ID is valid
-        if sid != player_id and sid in df.index:
-            row = df.loc[sid]
-            if isinstance(row, pd.DataFrame):
-                row = row.iloc[0]
-
-            player_data = {
-                'id': int(sid),
-                'full_name': str(row.get('full_name', 'Unknown')),
-                'club': str(row.get('club', 'Unknown')),
-                'role': str(row.get('role', 'Unknown')),
-                'image_url': str(row.get('image_url', ''))
-            }
-            players.append(player_data)
-            print(f"✅ Added similar player: {player_data['full_name']} (ID: {sid})")
-
-    print(f"🔍 DEBUG: Returning {len(players)} similar players")
-    return jsonify({'similar_players': players})
+        try:
+            # Cache lookup, and the render itself on a miss
+            with metrics.stage('/heatmap/<int:player_id>.png', 'render'):
+                _, png = heatmap_cache.get(snapshot.heatmap_dict[player_id], key=etag)
+        except RenderUnavailable as e:
+            # Backpressure: the render queue is full or the render timed out
+            logger.warning("Heatmap for %s not rendered: %s", player_id, e)
+            response = jsonify({'error': 'Heatmap is being rendered, retry shortly'})
+            response.status_code = 503
+            response.headers['Retry-After'] = '1'
+            return response
+        response = Response(png, mimetype='image/png')
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
 
 @app.route('/get_player_id', methods=['POST'])
 def get_player_id():
     name = request.json.get("name")
-    player_id = player_dict.get(name)
+    player_id = snapshots.current.player_dict.get(name)
     return jsonify({"player_id": player_id})
-
-if __name__ == '__main__':
-    port = int(os.environ.get("PORT", 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
-
-
@@ -0,0 +1,186 @@
+"""
+ASGI entry point for production serving, one app process per worker:
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 4 --no-access-log
+
+uvicorn also reads the worker count from WEB_CONCURRENCY. Each worker loads
+its own copy of the data (the heatmap arrays are memory-mapped and shared)
+and its own heatmap render pool.
+
+The read-only JSON endpoints are answered directly on the event loop from
+the prebuilt stores, through the same *_response functions the Flask routes
+use. Everything else (the page, heatmaps, POSTs, static files) runs the
+Flask app on a pool of WSGI_THREADS threads, so a heatmap waiting on the
+render pool holds one thread and never the event loop.
+
+Fast-path requests are timed and profiled under the same route names as the
+Flask routes, so /metrics and the profiles cover both.
+"""
+import io
+import os
+import sys
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import app as serving
+
+_JSON_HEADERS = [(b'content-type', b'application/json')]
+
+# -----------------------------
+# WSGI fallback
+# -----------------------------
+# The Flask responses are small and never streamed, so each one is run to
+# completion on a thread and sent in one piece
+_wsgi_threads = ThreadPoolExecutor(max_workers=int(os.environ.get('WSGI_THREADS', 8)), thread_name_prefix='wsgi')
+
+def _environ(scope, body):
+    """The WSGI environ of an ASGI http scope"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        key = {'content-type': 'CONTENT_TYPE', 'content-length': 'CONTENT_LENGTH'}.get(
+            name, 'HTTP_' + name.upper().replace('-', '_'))
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def _run_wsgi(environ):
+    """(status, headers, body) of the Flask app for one request"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'], response['headers'] = int(status.split(' ', 1)[0]), headers
+
+    iterable = serving.app(environ, start_response)
+    try:
+        body = b''.join(iterable)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response['headers']]
+    return response['status'], headers, body
+
+async def _wsgi(scope, receive, send):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+
+    status, headers, body = await asyncio.get_running_loop().run_in_executor(
+        _wsgi_threads, _run_wsgi, _environ(scope, b''.join(chunks)))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+# -----------------------------
+# Fast path
+# -----------------------------
+
+def _number(value, cast=int):
+    """Like Flask's args.get(type=...): None when absent or malformed"""
+    try:
+        return None if value is None else cast(value)
+    except ValueError:
+        return None
+
+def _player_id(path, prefix):
+    """The trailing id of /prefix/<id>, or None when the path does not match Flask's <int:...> rule"""
+    value = path[len(prefix):]
+    return int(value) if value.isascii() and value.isdigit() else None
+
+def route(path, args):
+    """
+    (rule, thunk) for a fast-path GET, where rule is the matching Flask rule
+    and thunk() returns (status, body); None to hand the request to Flask
+    """
+    arg = lambda name: args.get(name, [None])[0]
+    if path.startswith('/player/') and (player_id := _player_id(path, '/player/')) is not None:
+        return '/player/<int:player_id>', lambda: serving.player_response(player_id)
+    if path == '/players':
+        return '/players', lambda: serving.players_response(serving.parse_ids(arg('ids')))
+    if path == '/compare':
+        return '/compare', lambda: serving.compare_response(
+            _number(arg('a')), _number(arg('b')), serving.clamp_k(_number(arg('k'))))
+    if path == '/similar_players':
+        return '/similar_players', lambda: serving.similar_batch_response(
+            serving.parse_ids(arg('ids')), serving.clamp_k(_number(arg('k'))))
+    if path.startswith('/similar_players/') and (player_id := _player_id(path, '/similar_players/')) is not None:
+        return '/similar_players/<int:player_id>', lambda: serving.similar_response(
+            player_id, serving.clamp_k(_number(arg('k'))))
+    if path.startswith('/similar/') and (player_id := _player_id(path, '/similar/')) is not None:
+        return '/similar/<int:player_id>', lambda: serving.similar_live_response(
+            player_id, _number(arg('k')), role=arg('role'), max_age=_number(arg('max_age'), float),
+            max_market_value=_number(arg('max_value'), float), exclude_club=arg('exclude_club'))
+    if path == '/search':
+        return '/search', lambda: serving.search_response(arg('q') or '', _number(arg('limit')))
+    return None
+
+def _header(scope, name):
+    for key, value in scope.get('headers', []):
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            serving.snapshots.close()
+            serving.profiler.flush()
+            serving.render_pool.close()
+            _wsgi_threads.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        start = time.perf_counter()
+        matched = route(scope['path'], parse_qs(scope['query_string'].decode('latin-1')))
+        if matched is not None:
+            rule, respond = matched
+            headers = _JSON_HEADERS
+            # A handler that raises is answered 500 by the server; record it as such
+            status = 500
+            try:
+                profile = serving.profiler.begin(_header(scope, b'x-profile'))
+                try:
+                    status, body = respond()
+                finally:
+                    if profile is not None:
+                        output = serving.profiler.end(profile, rule)
+                        if output is not None:
+                            headers = headers + [(b'x-profile-output', output.encode('latin-1'))]
+                await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+                await send({'type': 'http.response.body', 'body': body})
+            finally:
+                serving.metrics.observe(rule, status, time.perf_counter() - start)
+            return
+
+    if scope['type'] == 'http':
+        await _wsgi(scope, receive, send)
@@ -1,18 +1,29 @@
+import os
+import sys
 import pandas as pd
 import asyncio
 import time
 import statsbombapi
 from prometheus_client import Counter, start_http_server, Gauge, Histogram
 
+# Make the source package importable when this file is run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from source.event_store import DEFAULT_EVENTS_DIR, write_event_partition
+from source.fetch_scheduler import FetchScheduler
+from source.ingest_log import IngestLog
+
 # -----------------------------
 # Global State
 # -----------------------------
 api = statsbombapi.StatsbombPublic()
-MATCH_BUFFER = []
-all_event_dfs = []  # Store all processed events
-PROCESSED_MATCH_IDS = set()
-BUFFER_SIZE = 5
-SLEEP_TIME = 0.2  # simulate I/O delay
+EVENTS_DIR = os.environ.get("EVENTS_DIR", DEFAULT_EVENTS_DIR)  # one Parquet partition per batch
+INGEST_LOG = IngestLog(EVENTS_DIR)  # durable record of ingested match ids, survives restarts
+BUFFER_SIZE = 5  # matches per written batch
+MAX_BATCH_AGE = float(os.environ.get("MAX_BATCH_AGE", 30))  # seconds before a partial batch is written anyway
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", 8))
+RATE_LIMIT = float(os.environ.get("FETCH_RATE_LIMIT", 5))  # requests per second to the StatsBomb API
+FETCH_TIMEOUT = float(os.environ.get("FETCH_TIMEOUT", 30))  # seconds per attempt
+POLL_INTERVAL = 5
 
 dataframe_decoder = statsbombapi.decoders.CompositeDecoder(
     statsbombapi.decoders.JsonDecoder(),
@@ -29,8 +40,9 @@ matches_processed = Counter('matches_processed_total', 'Total matches processed
 batches_processed = Counter('batches_processed_total', 'Total batches processed')
 match_buffer_size = Gauge('match_buffer_size', 'Current size of the match buffer')
 processing_duration = Histogram('match_batch_processing_seconds', 'Time spent processing a batch of matches')
-
-match_buffer_size.set(len(MATCH_BUFFER))
+match_fetch_duration = Histogram('match_fetch_seconds', 'Per-match event fetch latency, per attempt', ['outcome'],
+                                 buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+match_fetch_failures = Counter('match_fetch_failures_total', 'Matches abandoned after exhausting retries')
 
 # Start Prometheus metrics server on port 8000
 start_http_server(8000)
@@ -84,44 +96,39 @@ start_http_server(8000)
 #         MATCH_BUFFER = []
 
 @processing_duration.time()
-async def process_match_batch(batch):
-    await asyncio.sleep(SLEEP_TIME)
-    match_ids = [m.id for m in batch]
+def process_match_batch(batch):
+    """Write one flushed batch of ``(match_id, events)`` pairs as a partition"""
+    match_ids = [match_id for match_id, _ in batch]
     print(f"Processing batch: {match_ids}")
-    
-    batch_dfs = []
 
-    for match_id in match_ids:
-        try:
-            df = df_client.events(match_id=match_id)
-            df['match_id'] = match_id
-            batch_dfs.append(df)
-        except Exception as e:
-            print(f"Error processing match {match_id}: {e}")
-
-    if batch_dfs:
-        combined_df = pd.concat(batch_dfs, ignore_index=True)
-        all_event_dfs.append(combined_df)
-        print(f"Combined events from {len(match_ids)} matches. Final shape: {combined_df.shape}")
-    else:
-        print("No events processed in this batch.")
+    batch_dfs = [df.assign(match_id=match_id) for match_id, df in batch]
+    combined_df = pd.concat(batch_dfs, ignore_index=True)
+    partition = f"batch-{int(time.time() * 1000)}-{match_ids[0]}"
+    path = write_event_partition(combined_df, EVENTS_DIR, partition)
+    INGEST_LOG.commit_batch(partition, match_ids, len(combined_df))
+    print(f"Combined events from {len(match_ids)} matches. Final shape: {combined_df.shape}. Written to {path}")
 
     matches_processed.inc(len(match_ids))
     batches_processed.inc()
 
-async def stream_matches(matches):
-    global MATCH_BUFFER
-    for match in matches:
-        if match.id not in PROCESSED_MATCH_IDS:
-            MATCH_BUFFER.append(match)
-            PROCESSED_MATCH_IDS.add(match.id)
+def record_fetch(match_id, seconds, outcome):
+    match_fetch_duration.labels(outcome=outcome).observe(seconds)
+
+def record_failure(match_id, error):
+    match_fetch_failures.inc()
 
-        match_buffer_size.set(len(MATCH_BUFFER))
+def make_scheduler(client=None):
+    """Fetch scheduler wired to the DataFrame client, the partition writer and the metrics"""
+    client = client or df_client
+    scheduler = FetchScheduler(client.events, process_match_batch, workers=FETCH_WORKERS, rate=RATE_LIMIT,
+                               timeout=FETCH_TIMEOUT, batch_size=BUFFER_SIZE, max_batch_age=MAX_BATCH_AGE,
+                               on_fetch=record_fetch, on_failure=record_failure)
+    match_buffer_size.set_function(lambda: len(scheduler.buffer))
+    return scheduler
 
-        if len(MATCH_BUFFER) >= BUFFER_SIZE:
-            await process_match_batch(MATCH_BUFFER)
-            MATCH_BUFFER = []
-            match_buffer_size.set(0)
+def stream_matches(scheduler, matches):
+    queued = scheduler.submit(INGEST_LOG.unprocessed(m.id for m in matches))
+    print(f"Queued {queued} matches for fetching.")
 
 # -----------------------------
 # Fetch New Matches Only
@@ -139,7 +146,8 @@ async def fetch_new_matches():
     for comp in comps:
         try:
             matches = await asyncio.to_thread(api.matches, comp.competition_id, comp.season_id)
-            new_matches = [m for m in matches if m.id not in PROCESSED_MATCH_IDS]
+            new_ids = set(INGEST_LOG.unprocessed(m.id for m in matches))
+            new_matches = [m for m in matches if m.id in new_ids]
             all_matches.extend(new_matches)
         except Exception as e:
             print(f"Failed to load matches for comp {comp.competition_id}, season {comp.season_id}: {e}")
@@ -150,14 +158,19 @@ async def fetch_new_matches():
 # Main Streaming Loop
 # -----------------------------
 async def main_streaming_loop():
-    while True:
-        new_matches = await fetch_new_matches()
-        if new_matches:
-            print(f"Found {len(new_matches)} new matches.")
-            await stream_matches(new_matches)
-        else:
-            print("No new matches. Sleeping...")
-        await asyncio.sleep(5)
+    adopted = INGEST_LOG.reconcile()
+    if adopted:
+        print(f"Adopted {len(adopted)} partitions written before the last shutdown.")
+    print(f"Resuming with {len(INGEST_LOG)} matches already ingested.")
+    async with make_scheduler() as scheduler:
+        while True:
+            new_matches = await fetch_new_matches()
+            if new_matches:
+                print(f"Found {len(new_matches)} new matches.")
+                stream_matches(scheduler, new_matches)
+            else:
+                print("No new matches. Sleeping...")
+            await asyncio.sleep(POLL_INTERVAL)
 
 # -----------------------------
 # Run
@@ -166,9 +179,5 @@ if __name__ == "__main__":
     try:
         asyncio.run(main_streaming_loop())
     except KeyboardInterrupt:
-        print("Streaming stopped.")
-        # Optional: Combine and save data
-        if all_event_dfs:
-            final_df = pd.concat(all_event_dfs, ignore_index=True)
-            final_df.to_csv("/mnt/block/data/final_datasets/streamed_data.csv", index=False)
-            print(f"Saved {len(final_df)} events to CSV.")
+        # Every completed batch is already on disk as its own partition
+        print(f"Streaming stopped. Events are in {EVENTS_DIR}")
@@ -1,11 +1,22 @@
+import os
+import sys
 import pandas as pd
 import json
 import numpy as np
 import ast
 from functools import reduce
 
-def process_data():
-    
+# Make the source package importable when this file is run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from source.event_stats import FLAT_COLUMNS, compute_player_stats
+from source.event_store import DEFAULT_EVENTS_DIR, read_events
+from source.stat_aggregator import DEFAULT_STATE_PATH, update_stats
+
+STREAMED_DATA_PATH = "/mnt/block/data/final_datasets/streamed_data.csv"
+
+def load_events_csv(path=STREAMED_DATA_PATH):
+    """Legacy importer: read the streamed events CSV back into nested dict columns"""
+
     # Columns to convert
     columns_to_convert = [
         "type", "possession_team", "play_pattern", "team", "tactics", "related_events", 
@@ -29,8 +40,31 @@ def process_data():
     converters = {col: safe_eval for col in columns_to_convert}
 
     # Load the CSV with the converters
-    df = pd.read_csv("/mnt/block/data/final_datasets/streamed_data.csv", converters=converters)
-    
+    return pd.read_csv(path, converters=converters)
+
+def process_data(path=DEFAULT_EVENTS_DIR):
+    """
+    Per-player stats from the streamed event partitions. Only the flat
+    columns the stats need are read, with no Python-level parsing. A path
+    ending in .csv goes through the legacy literal_eval importer instead.
+    """
+    if str(path).endswith('.csv'):
+        return compute_player_stats(load_events_csv(path))
+    return compute_player_stats(read_events(path, columns=FLAT_COLUMNS))
+
+def process_new_data(events_dir=DEFAULT_EVENTS_DIR, state_path=DEFAULT_STATE_PATH):
+    """
+    Same result as process_data(events_dir), but only the partitions ingested
+    since the last call are read; everything earlier comes from the saved
+    running totals in ``state_path``.
+    """
+    return update_stats(events_dir, state_path)
+
+def process_data_legacy(df):
+    """
+    Original per-metric implementation, kept as the reference for
+    source.event_stats.check_parity
+    """
     columns = ['Id', 'Matches Played',
                'Total Shots', 'Accurate Shots', 'Shot Accuracy', 'Goals', 'Shot Conversion', 'Penalties Taken', 'Penalties Scored', 'Penalty Conversion', 'Free Kick Shots',
                'Total Passes', 'Accurate Passes', 'Pass Accuracy', 'Key Passes', 'Assists', 'Crosses', 'Free Kick Crosses', 
@@ -218,4 +252,4 @@ def process_data():
     return final_df
 
 if __name__ == "__main__":
-    process_data()
\ No newline at end of file
+    process_new_data()
\ No newline at end of file
@@ -0,0 +1,85 @@
+import os
+import sys
+import argparse
+
+import pandas as pd
+
+# Make the source package importable when this file is run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from source.player_assignment import DRIFT_THRESHOLDS, PlayerMatcher
+from source.heatmap_features import load_heatmap_features
+from source.similarity import DEFAULT_INDEX_DIR
+
+PLAYERS_PATH = "data/final_player_df.csv"
+FEATURES_PATH = "data"  # heatmap feature arrays, or their JSON export
+
+def _format_knn_ids(ids):
+    # Same bracketed, space separated layout the notebook export writes
+    return '[' + ' '.join(str(pid) for pid in ids) + ']'
+
+def _write_players(players_df, path):
+    tmp_path = f"{path}.tmp"
+    players_df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+def assign_new_players(updates_path, players_path=PLAYERS_PATH, features_path=FEATURES_PATH,
+                       index_dir=DEFAULT_INDEX_DIR, thresholds=DRIFT_THRESHOLDS, force_rebuild=False):
+    """
+    Give the players in ``updates_path`` (new or changed rows in the
+    final_player_df layout) a cluster and top_knn_ids without re-running
+    notebook 4, and refresh the lists of the existing players they affect.
+    A full rebuild runs instead when the batch drifts past ``thresholds``.
+    """
+    players_df = pd.read_csv(players_path)
+    updates_df = pd.read_csv(updates_path)
+    heatmap_dict = load_heatmap_features(features_path)
+
+    fitted = not PlayerMatcher.exists(index_dir)
+    if not fitted:
+        matcher = PlayerMatcher.load(index_dir)
+    else:
+        print(f"No matching state in {index_dir}; building it from {players_path}")
+        matcher = PlayerMatcher.fit(players_df, heatmap_dict)
+
+    # Updated rows replace their old version; new ones go at the end
+    players_df = pd.concat([players_df[~players_df['id'].isin(updates_df['id'])], updates_df], ignore_index=True)
+
+    report = matcher.assign(updates_df, heatmap_dict, thresholds) if not force_rebuild else {'rebuild': True, 'exceeded': ['forced']}
+    if report['rebuild']:
+        print(f"Drift above threshold ({', '.join(report['exceeded'])}); rebuilding pipeline, clusters and neighbours")
+        matcher = PlayerMatcher.fit(players_df, heatmap_dict, n_clusters=len(matcher.cluster_ids), k=matcher.k)
+        refreshed = matcher.index.ids
+    else:
+        # A fresh fit recomputed every list, so the whole CSV is rewritten
+        refreshed = matcher.index.ids if fitted else sorted(set(report['changed']) | set(report['refreshed']))
+        print(f"Assigned {len(report['changed'])} players, refreshed {len(report['refreshed'])} neighbour lists "
+              f"(drift: {', '.join(f'{name} {value:.3f}' for name, value in report['drift'].items())})")
+        if report['skipped']:
+            print(f"Skipped {len(report['skipped'])} players without spatial features: {report['skipped']}")
+
+    offsets = [matcher.index.offsets[int(pid)] for pid in refreshed]
+    updates = pd.DataFrame({'id': matcher.index.ids[offsets],
+                            'cluster': matcher.labels[offsets],
+                            'top_knn_ids': [_format_knn_ids(ids) for ids in matcher.neighbour_ids(offsets)]})
+    players_df = players_df.set_index('id')
+    players_df['cluster'] = players_df['cluster'].astype('Int64')
+    players_df.loc[updates['id'], ['cluster', 'top_knn_ids']] = updates.set_index('id')[['cluster', 'top_knn_ids']]
+
+    # The index is saved first: a crash in between leaves the CSV one batch
+    # behind, and re-running the same batch is harmless
+    matcher.save(index_dir)
+    _write_players(players_df.reset_index(), players_path)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Assign clusters and nearest neighbours to new or updated players')
+    parser.add_argument('updates', help='CSV of new or updated players, in the final_player_df layout')
+    parser.add_argument('--players', default=PLAYERS_PATH)
+    parser.add_argument('--features', default=FEATURES_PATH)
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR)
+    parser.add_argument('--rebuild', action='store_true', help='always do a full rebuild')
+    for name, default in DRIFT_THRESHOLDS.items():
+        parser.add_argument(f"--max-{name.replace('_', '-')}", type=float, default=default, dest=name)
+    args = parser.parse_args()
+    thresholds = {name: getattr(args, name) for name in DRIFT_THRESHOLDS}
+    assign_new_players(args.updates, args.players, args.features, args.index_dir, thresholds, args.rebuild)
@@ -0,0 +1,376 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from datetime import datetime, timezone
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_RESULTS_DIR = os.path.join(ROOT, 'data', 'benchmarks')
+PLAYERS_PATH = os.path.join(ROOT, 'data', 'final_player_df.csv')
+
+# A run fails when a metric is this much worse than the run it is compared with
+REGRESSION_THRESHOLD = 0.25
+
+# Load test settings that change the numbers. Only runs that agree on all of
+# them are compared
+LOAD_CONFIG = ['server', 'connections', 'duration_s', 'synthetic', 'mix', 'cpu_count']
+
+# -----------------------------
+# Micro-benchmarks
+# -----------------------------
+def _time(fn, number, repeats=5):
+    """Per-call milliseconds of ``fn``: median and best of ``repeats`` runs of ``number`` calls"""
+    fn()  # warm-up: imports, cached pitch, page cache
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number * 1000)
+    return {'median_ms': float(np.median(samples)), 'min_ms': float(np.min(samples)), 'calls': number * repeats}
+
+def _load_script(filename):
+    """Import one of the numbered pipeline scripts, whose file names are not importable"""
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(filename.split('. ')[-1][:-3], os.path.join(ROOT, 'source', filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def _synthetic_record(rng, n_fields=60, nan_share=0.3):
+    """A raw player row as PlayerStore sees it: numbers, strings and NaN gaps"""
+    record = {}
+    for i in range(n_fields):
+        value = float(rng.random() * 100) if i % 3 else f"value {i}"
+        record[f"field_{i}"] = float('nan') if rng.random() < nan_share else value
+    return record
+
+def micro_benchmarks(n_events=200_000, seed=7):
+    """Time the hot functions of the serving and pipeline paths on synthetic inputs"""
+    import pandas as pd
+    from source.heatmap_generator import generate_heatmap
+    from source.player_store import clean_nan_values
+    from source.neighbour_table import NeighbourTable, parse_knn_ids
+    from source.event_store import write_event_partition
+    from source.synthetic_events import synthetic_events
+
+    rng = np.random.default_rng(seed)
+    results = {}
+
+    density = rng.random(100)
+    results['generate_heatmap'] = _time(lambda: generate_heatmap(density, 'Benchmark Player'), number=5)
+
+    record = _synthetic_record(rng)
+    results['clean_nan_values'] = _time(lambda: clean_nan_values(record), number=2000)
+
+    # top_knn_ids as the CSV export writes it: a NumPy repr of 10 ids
+    cell = str(rng.integers(1, 10**6, 10))
+    results['parse_knn_ids'] = _time(lambda: parse_knn_ids(cell), number=20_000)
+
+    # The /similar_players/<id> serve path over a 5k-player table
+    n_players = 5000
+    frame = pd.DataFrame({'id': np.arange(1, n_players + 1),
+                          'full_name': [f"Player {i}" for i in range(n_players)], 'club': 'Club', 'role': 'CM',
+                          'top_knn_ids': [str(rng.integers(1, n_players + 1, 10)) for _ in range(n_players)]})
+    table = NeighbourTable.from_frame(frame)
+    player_ids = rng.integers(1, n_players + 1, 1000).tolist()
+    results['similar_json'] = _time(lambda: [table.similar_json(pid) for pid in player_ids], number=10)
+    results['similar_json']['per_lookup_us'] = results['similar_json']['median_ms'] / len(player_ids) * 1000
+
+    # process_data over StatsBomb-shaped events written as event partitions
+    process_data = _load_script('2b. process_live_data.py').process_data
+    with tempfile.TemporaryDirectory() as events_dir:
+        write_event_partition(synthetic_events(n_events, seed=seed), events_dir, 'benchmark')
+        results['process_data'] = _time(lambda: process_data(events_dir), number=1, repeats=3)
+    results['process_data']['events'] = n_events
+
+    for name, result in results.items():
+        print(f"  {name:<18} median {result['median_ms']:9.3f}ms  best {result['min_ms']:9.3f}ms")
+    return results
+
+# -----------------------------
+# Load generator
+# -----------------------------
+# Request mix of one UI session: typing into the search box, loading a
+# player with its similar list, comparing against similar players, and the
+# heatmaps those panels show. Weights are relative.
+DEFAULT_MIX = [
+    {'route': 'search',          'weight': 30, 'path': '/search?q={prefix}&limit=10'},
+    {'route': 'compare_one',     'weight': 15, 'path': '/compare?a={id}'},
+    {'route': 'compare_two',     'weight': 20, 'path': '/compare?a={id}&b={other}'},
+    {'route': 'player',          'weight': 10, 'path': '/player/{id}'},
+    {'route': 'players',         'weight': 3,  'path': '/players?ids={id},{other}'},
+    {'route': 'similar_players', 'weight': 10, 'path': '/similar_players/{id}'},
+    {'route': 'heatmap',         'weight': 12, 'path': '/heatmap/{id}.png'},
+]
+
+def load_mix(path):
+    """A request mix from a JSONL file of {"route", "weight", "path"} objects; paths may use {id}, {other}, {prefix}"""
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def request_plan(mix, n_requests, players_path=PLAYERS_PATH, seed=7):
+    """``n_requests`` (route, path) pairs drawn from ``mix`` with ids and name prefixes from the players CSV"""
+    import pandas as pd
+
+    players = pd.read_csv(players_path, usecols=['id', 'full_name']).drop_duplicates('id')
+    ids = players['id'].astype(int).tolist()
+    prefixes = [str(name).split()[-1][:4] for name in players['full_name'].dropna()]
+
+    rng = random.Random(seed)
+    entries = rng.choices(mix, weights=[entry['weight'] for entry in mix], k=n_requests)
+    return [(entry['route'], entry['path'].format(id=rng.choice(ids), other=rng.choice(ids), prefix=rng.choice(prefixes)))
+            for entry in entries]
+
+def start_server(server, port, env, log_path):
+    """Start the app on ``port``, logging to ``log_path``, and wait until it answers"""
+    if server == 'uvicorn':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--no-access-log', '--log-level', 'warning']
+    else:
+        command = [sys.executable, 'app.py']
+    # A file rather than a pipe: nobody reads the pipe while the test runs
+    with open(log_path, 'wb') as log:
+        process = subprocess.Popen(command, cwd=ROOT, env={**env, 'PORT': str(port)},
+                                   stdout=subprocess.DEVNULL, stderr=log)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            with open(log_path, 'r', errors='replace') as log:
+                raise RuntimeError(f"{server} exited during startup:\n{log.read()}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/search?q=a')
+            connection.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{server} did not answer on port {port} within 120s")
+
+def _client(port, plan, start_index, stride, deadline, records):
+    """One keep-alive connection replaying every ``stride``-th request of the plan until ``deadline``"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    index = start_index
+    while time.perf_counter() < deadline:
+        route, path = plan[index % len(plan)]
+        start = time.perf_counter()
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            if response.will_close:
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        except (OSError, http.client.HTTPException):
+            status = 0
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        records.append((route, status, time.perf_counter() - start))
+        index += stride
+    connection.close()
+
+def _latency_summary(latencies_ms):
+    return {'requests': len(latencies_ms),
+            'p50_ms': float(np.percentile(latencies_ms, 50)),
+            'p95_ms': float(np.percentile(latencies_ms, 95)),
+            'p99_ms': float(np.percentile(latencies_ms, 99))}
+
+def load_test(server='uvicorn', connections=8, duration=10.0, mix=DEFAULT_MIX, synthetic=False, port=5099):
+    """
+    Replay ``mix`` against a freshly started app over ``connections``
+    keep-alive connections for ``duration`` seconds. The load generator runs
+    on the same machine, so throughput is per machine, not per server core.
+    """
+    from source.startup_benchmark import synthetic_features
+
+    plan = request_plan(mix, 20_000)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = {**os.environ, 'HEATMAP_CACHE_DIR': os.path.join(tmp_dir, 'heatmap_cache'),
+               'SNAPSHOT_POLL_SECONDS': '0',
+               'PYTHONPATH': os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')]))}
+        if synthetic:
+            synthetic_features(PLAYERS_PATH, tmp_dir)
+            env.update(HEATMAP_FEATURES_DIR=tmp_dir, SIMILARITY_INDEX_DIR=os.path.join(tmp_dir, 'similarity'),
+                       SNAPSHOT_DIR=os.path.join(tmp_dir, 'snapshots'))
+        process = start_server(server, port, env, os.path.join(tmp_dir, 'server.log'))
+        try:
+            records, threads = [], []
+            deadline = time.perf_counter() + duration
+            for i in range(connections):
+                threads.append(threading.Thread(target=_client, args=(port, plan, i, connections, deadline, records)))
+                threads[-1].start()
+            for thread in threads:
+                thread.join()
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    latencies = np.array([seconds for _, _, seconds in records]) * 1000
+    errors = sum(1 for _, status, _ in records if status == 0 or status >= 500)
+    result = {'server': server, 'connections': connections, 'duration_s': duration, 'synthetic': synthetic,
+              'mix': mix, 'cpu_count': os.cpu_count(),
+              'throughput_rps': len(records) / duration, 'errors': errors, **_latency_summary(latencies), 'routes': {}}
+    for route in sorted({route for route, _, _ in records}):
+        result['routes'][route] = _latency_summary(np.array([s for r, _, s in records if r == route]) * 1000)
+
+    print(f"  {server}: {result['throughput_rps']:.0f} req/s over {connections} connections, "
+          f"p50 {result['p50_ms']:.2f}ms  p95 {result['p95_ms']:.2f}ms  p99 {result['p99_ms']:.2f}ms, {errors} errors")
+    for route, summary in result['routes'].items():
+        print(f"    {route:<16} {summary['requests']:7d} req  p50 {summary['p50_ms']:7.2f}ms  "
+              f"p95 {summary['p95_ms']:7.2f}ms  p99 {summary['p99_ms']:7.2f}ms")
+    return result
+
+# -----------------------------
+# Results and regressions
+# -----------------------------
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_config(result):
+    """The LOAD_CONFIG settings of a stored run's load test, or None when it has none"""
+    load = result.get('load')
+    return {key: load.get(key) for key in LOAD_CONFIG} if load else None
+
+def _result_order(name):
+    # <timestamp>.json, then <timestamp>_1.json, _2.json... for runs within the same second
+    stem, _, suffix = name[:-len('.json')].partition('_')
+    return stem, int(suffix or 0)
+
+def save_result(result, results_dir=DEFAULT_RESULTS_DIR):
+    """Store ``result`` under its timestamp, suffixed when a run in the same second is already stored"""
+    os.makedirs(results_dir, exist_ok=True)
+    stem = os.path.join(results_dir, result['timestamp'].replace(':', ''))
+    tmp_path = f"{stem}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(result, f, indent=2)
+    try:
+        for n in range(1000):
+            path = f"{stem}_{n}.json" if n else f"{stem}.json"
+            try:
+                # Unlike os.replace, a link never overwrites another run's file
+                os.link(tmp_path, path)
+                return path
+            except FileExistsError:
+                continue
+        raise FileExistsError(f"too many results stored for {result['timestamp']}")
+    finally:
+        os.remove(tmp_path)
+
+def previous_result(results_dir=DEFAULT_RESULTS_DIR, exclude=None, result=None):
+    """
+    Path of the newest stored run, or None. Given ``result``, only runs
+    whose load test configuration matches it are considered.
+    """
+    if not os.path.isdir(results_dir):
+        return None
+    names = sorted((name for name in os.listdir(results_dir) if name.endswith('.json')), key=_result_order)
+    for path in reversed([os.path.join(results_dir, name) for name in names]):
+        if path == exclude:
+            continue
+        if result is not None:
+            with open(path, 'r') as f:
+                if load_config(json.load(f)) != load_config(result):
+                    continue
+        return path
+    return None
+
+def regressions(result, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Messages for every metric worse than ``baseline`` by more than
+    ``threshold``: slower micro-benchmark medians, higher load-test
+    percentiles, lower throughput. Metrics missing from either run are
+    skipped, and so are the load test's when the two were run with different
+    settings (see LOAD_CONFIG).
+    """
+    found = []
+
+    def check(name, value, reference, higher_is_worse=True):
+        if value is None or reference is None or reference == 0:
+            return
+        change = (value - reference) / reference
+        if (change if higher_is_worse else -change) > threshold:
+            found.append(f"{name}: {value:.3f} vs {reference:.3f} ({change:+.0%})")
+
+    for name, micro in result.get('micro', {}).items():
+        check(f"micro.{name}.median_ms", micro['median_ms'], baseline.get('micro', {}).get(name, {}).get('median_ms'))
+
+    load, reference = result.get('load'), baseline.get('load')
+    if load and reference and load_config(result) == load_config(baseline):
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            check(f"load.{metric}", load[metric], reference[metric])
+        check('load.throughput_rps', load['throughput_rps'], reference['throughput_rps'], higher_is_worse=False)
+        if load['errors'] > reference['errors']:
+            found.append(f"load.errors: {load['errors']} vs {reference['errors']}")
+    return found
+
+def run(micro=True, load=True, server='uvicorn', connections=8, duration=10.0, mix=DEFAULT_MIX, synthetic=False,
+        n_events=200_000):
+    result = {'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'), 'commit': _git_commit(),
+              'python': sys.version.split()[0], 'cpu_count': os.cpu_count()}
+    if micro:
+        print("Micro-benchmarks:")
+        result['micro'] = micro_benchmarks(n_events)
+    if load:
+        print("Load test:")
+        result['load'] = load_test(server, connections, duration, mix, synthetic)
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the serving and pipeline hot paths and flag regressions')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='run the suite, store the JSON result and compare with a previous run')
+    run_parser.add_argument('--skip-micro', action='store_true')
+    run_parser.add_argument('--skip-load', action='store_true')
+    run_parser.add_argument('--server', choices=['uvicorn', 'flask'], default='uvicorn')
+    run_parser.add_argument('--connections', type=int, default=8)
+    run_parser.add_argument('--duration', type=float, default=10.0, help='load test length in seconds')
+    run_parser.add_argument('--mix', default=None, help='JSONL request mix (default: one UI session)')
+    run_parser.add_argument('--events', type=int, default=200_000, help='synthetic events for process_data')
+    run_parser.add_argument('--synthetic', action='store_true', help='serve synthetic heatmap features (no real data needed)')
+    run_parser.add_argument('--results-dir', default=DEFAULT_RESULTS_DIR)
+    run_parser.add_argument('--baseline', default=None, help='result to compare with (default: the previous run)')
+    run_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    compare_parser = subparsers.add_parser('compare', help='compare two stored results')
+    compare_parser.add_argument('result')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        mix = load_mix(args.mix) if args.mix else DEFAULT_MIX
+        result = run(not args.skip_micro, not args.skip_load, args.server, args.connections, args.duration, mix,
+                     args.synthetic, args.events)
+        path = save_result(result, args.results_dir)
+        print(f"Saved {path}")
+        baseline_path = args.baseline or previous_result(args.results_dir, exclude=path, result=result)
+        if baseline_path is None:
+            print("No previous run with the same load test settings to compare with")
+            sys.exit(0)
+        threshold = args.threshold
+    else:
+        with open(args.result, 'r') as f:
+            result = json.load(f)
+        baseline_path, threshold = args.baseline, args.threshold
+
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    problems = regressions(result, baseline, threshold)
+    print(f"Compared with {baseline_path} (commit {baseline.get('commit')}), threshold {threshold:.0%}")
+    if result.get('load') and baseline.get('load') and load_config(result) != load_config(baseline):
+        print("Load test settings differ; only the micro-benchmarks were compared")
+    for problem in problems:
+        print(f"REGRESSION: {problem}")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,313 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_DIR = 'data/cluster_sweep'
+SEED = 7
+
+# Rows the silhouette is estimated on; the exact score is O(n^2) in the pool size
+SILHOUETTE_SAMPLE = 2000
+
+# Parameter a family's curve runs along, and the default grid of "4. Player Matching"
+FAMILIES = {
+    'kmeans':           ('n_clusters', {'n_clusters': list(range(2, 302))}),
+    'minibatch_kmeans': ('n_clusters', {'n_clusters': list(range(2, 302))}),
+    'gmm':              ('n_components', {'n_components': list(range(2, 61))}),
+    'dbscan':           ('eps', {'eps': [0.3, 0.4, 0.5, 0.6, 0.8, 1.0], 'min_samples': [5, 10, 25]}),
+}
+
+# Settings added to every grid point unless the grid sets them, so they are
+# part of the cache key. GMM uses scikit-learn's full covariance, like notebook 4.
+MODEL_DEFAULTS = {
+    'gmm': {'covariance_type': 'full'},
+}
+
+def make_model(family, params, seed=SEED):
+    """Unfitted estimator of ``family`` with ``params``"""
+    if family == 'kmeans':
+        from sklearn.cluster import KMeans
+        return KMeans(random_state=seed, n_init=1, **params)
+    if family == 'minibatch_kmeans':
+        from sklearn.cluster import MiniBatchKMeans
+        return MiniBatchKMeans(random_state=seed, n_init=3, batch_size=2048, **params)
+    if family == 'gmm':
+        from sklearn.mixture import GaussianMixture
+        return GaussianMixture(random_state=seed, **params)
+    if family == 'dbscan':
+        from sklearn.cluster import DBSCAN
+        return DBSCAN(**params)
+    raise ValueError(f"unknown model family {family!r}; expected one of {sorted(FAMILIES)}")
+
+def feature_hash(features):
+    """Content hash of a feature matrix, its shape and dtype"""
+    features = np.ascontiguousarray(features)
+    digest = hashlib.sha256(f"{features.dtype.str}{features.shape}".encode())
+    digest.update(features.data)
+    return digest.hexdigest()
+
+def expand_grid(grid):
+    """Every combination of a {param: [values]} grid, in order"""
+    from sklearn.model_selection import ParameterGrid
+    return [dict(sorted(params.items())) for params in ParameterGrid(grid)]
+
+def _key(params):
+    return json.dumps(params, sort_keys=True)
+
+# -----------------------------
+# One fit
+# -----------------------------
+def evaluate(features, family, params, silhouette_sample=SILHOUETTE_SAMPLE, seed=SEED):
+    """
+    Fit one model and score its labels: silhouette (estimated on a sample
+    of ``silhouette_sample`` rows), Davies-Bouldin and Calinski-Harabasz,
+    plus inertia for the k-means families and BIC for GMM. Noise points
+    (DBSCAN's -1 label) are left out of the scores.
+    """
+    from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score, silhouette_score
+
+    start = time.perf_counter()
+    model = make_model(family, dict(params), seed)
+    labels = model.fit_predict(features)
+    result = {'params': params, 'fit_seconds': time.perf_counter() - start}
+
+    if hasattr(model, 'inertia_'):
+        result['inertia'] = float(model.inertia_)
+    if family == 'gmm':
+        result['bic'] = float(model.bic(features))
+
+    clustered = labels >= 0  # DBSCAN marks noise with -1
+    n_clusters = len(np.unique(labels[clustered]))
+    result.update(clusters_found=n_clusters, noise=float(1 - clustered.mean()))
+    if 2 <= n_clusters < clustered.sum():
+        x, y = features[clustered], labels[clustered]
+        sample = min(silhouette_sample, len(x)) if silhouette_sample else None
+        result['silhouette'] = float(silhouette_score(x, y, sample_size=sample, random_state=seed))
+        result['davies_bouldin'] = float(davies_bouldin_score(x, y))
+        result['calinski_harabasz'] = float(calinski_harabasz_score(x, y))
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+# Worker processes receive the feature matrix once, through the initializer
+_worker = {}
+
+def _init_worker(features, family, silhouette_sample, seed):
+    from threadpoolctl import threadpool_limits
+    # One BLAS/OpenMP thread per process; the pool supplies the parallelism
+    _worker.update(limits=threadpool_limits(1), features=features, family=family,
+                   silhouette_sample=silhouette_sample, seed=seed)
+
+def _evaluate_in_worker(params):
+    return evaluate(_worker['features'], _worker['family'], params, _worker['silhouette_sample'], _worker['seed'])
+
+# -----------------------------
+# Sweep
+# -----------------------------
+class SweepCache:
+    """
+    Results of one family on one feature matrix, in
+    ``<cache_dir>/<hash>-<family>-s<silhouette_sample>-<seed>.json``. The
+    silhouette sample and the seed change the scores, so results scored
+    with other settings are kept apart rather than reused.
+    """
+
+    def __init__(self, cache_dir, digest, family, silhouette_sample=SILHOUETTE_SAMPLE, seed=SEED):
+        name = f"{digest[:16]}-{family}-s{silhouette_sample or 'all'}-{seed}.json"
+        self.path = os.path.join(cache_dir, name) if cache_dir else None
+        self.results = {}
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.results = json.load(f)['results']
+        self.digest = digest
+        self.settings = {'silhouette_sample': silhouette_sample, 'seed': seed}
+
+    def get(self, params):
+        return self.results.get(_key(params))
+
+    def put(self, result):
+        self.results[_key(result['params'])] = result
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'feature_hash': self.digest, **self.settings, 'results': self.results}, f)
+        os.replace(tmp_path, self.path)
+
+def sweep(features, family, grid=None, workers=None, silhouette_sample=SILHOUETTE_SAMPLE, patience=None,
+          cache_dir=DEFAULT_CACHE_DIR, seed=SEED):
+    """
+    Fit ``family`` at every point of ``grid`` (the family's default when
+    None) and return one row per point with its scores, in grid order.
+
+    Fits run across a process pool. Results are cached by feature-matrix
+    hash, silhouette sample and seed, so repeating or extending a sweep only
+    fits the new points. With ``patience``, the sweep stops once the
+    silhouette has not improved for that many consecutive grid points;
+    points already in flight still finish.
+    """
+    features = np.ascontiguousarray(features, dtype=np.float64)
+    grid = grid or FAMILIES[family][1]
+    points = [dict(sorted({**MODEL_DEFAULTS.get(family, {}), **point}.items())) for point in expand_grid(grid)]
+    cache = SweepCache(cache_dir, feature_hash(features), family, silhouette_sample, seed)
+
+    results, best, since_best = [], -np.inf, 0
+
+    def record(result):
+        nonlocal best, since_best
+        results.append(result)
+        score = result.get('silhouette', -np.inf)
+        if score > best:
+            best, since_best = score, 0
+        else:
+            since_best += 1
+        return patience is not None and since_best >= patience
+
+    todo = deque(points)
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(features, family, silhouette_sample, seed)) as pool:
+        # Keep a bounded window in flight and consume it in grid order, so
+        # early stopping sees the curve in order
+        in_flight = deque()
+        stopped = False
+        while todo or in_flight:
+            while todo and len(in_flight) < 2 * workers and not stopped:
+                params = todo.popleft()
+                cached = cache.get(params)
+                in_flight.append((params, cached if cached is not None else pool.submit(_evaluate_in_worker, params)))
+            if not in_flight:
+                break
+            params, pending = in_flight.popleft()
+            result = pending if isinstance(pending, dict) else pending.result()
+            cache.put(result)
+            if not stopped and record(result):
+                stopped = True
+                for _, other in in_flight:
+                    if not isinstance(other, dict):
+                        other.cancel()
+                in_flight.clear()
+                todo.clear()
+    cache.save()
+
+    frame = curves(results)
+    print(f"{family}: {len(frame)} of {len(points)} grid points in {time.perf_counter() - start:.1f}s"
+          f"{' (stopped early)' if len(frame) < len(points) else ''}")
+    return frame
+
+def curves(results):
+    """Sweep results as a frame: one column per parameter, then the scores"""
+    frame = pd.DataFrame(results)
+    if frame.empty:
+        return frame
+    params = pd.DataFrame(list(frame.pop('params')))
+    return pd.concat([params, frame], axis=1)
+
+def elbow(frame, x='n_clusters', y='inertia'):
+    """The point of a decreasing curve farthest below the chord between its ends (Kneedle)"""
+    curve = frame[[x, y]].dropna().sort_values(x)
+    xs, ys = curve[x].to_numpy(dtype=float), curve[y].to_numpy(dtype=float)
+    if len(xs) < 3:
+        return None
+    xs_n = (xs - xs[0]) / (xs[-1] - xs[0])
+    ys_n = (ys - ys.min()) / (ys.max() - ys.min() or 1)
+    chord = ys_n[0] + (ys_n[-1] - ys_n[0]) * xs_n
+    return curve[x].iloc[int(np.argmax(chord - ys_n))]
+
+def summarise(frame, family):
+    """Parameters of the elbow, lowest-BIC and best-silhouette points of a sweep"""
+    axis = FAMILIES[family][0]
+    known = set().union(*(FAMILIES[f][1] for f in FAMILIES), *MODEL_DEFAULTS.values())
+    param_columns = [col for col in frame.columns if col in known]
+
+    def point(row):
+        values = {col: frame.loc[row, col] for col in param_columns}
+        return {col: value.item() if hasattr(value, 'item') else value for col, value in values.items()}
+
+    summary = {}
+    if 'inertia' in frame:
+        knee = elbow(frame, axis, 'inertia')
+        if knee is not None:
+            summary['elbow'] = point(frame.index[frame[axis] == knee][0])
+    if 'bic' in frame:
+        summary['min_bic'] = point(frame['bic'].idxmin())
+    if 'silhouette' in frame and frame['silhouette'].notna().any():
+        summary['best_silhouette'] = point(frame['silhouette'].idxmax())
+    return summary
+
+# -----------------------------
+# Player features and benchmark
+# -----------------------------
+def player_features(players_path='data/final_player_df.csv', features_path='data'):
+    """The matching notebook's feature matrix for the current player pool"""
+    from source.heatmap_features import load_heatmap_features
+    from source.similarity import build_feature_matrix
+
+    players_df = pd.read_csv(players_path)
+    _, features, _ = build_feature_matrix(players_df, load_heatmap_features(features_path))
+    return np.asarray(features, dtype=np.float64)
+
+def benchmark(features, ks, workers=None):
+    """Time the notebook's serial loop (KMeans and exact silhouette per k) against a MiniBatch sweep"""
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+
+    start = time.perf_counter()
+    for k in ks:
+        labels = KMeans(n_clusters=k, random_state=SEED).fit_predict(features)
+        silhouette_score(features, labels)
+    serial = time.perf_counter() - start
+    print(f"Serial KMeans + exact silhouette over {len(ks)} values of k: {serial:.1f}s")
+
+    for family in ('kmeans', 'minibatch_kmeans'):
+        start = time.perf_counter()
+        sweep(features, family, {'n_clusters': list(ks)}, workers, cache_dir=None)
+        print(f"  {family} sweep: {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep clustering hyperparameters over the player feature matrix')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run = subparsers.add_parser('sweep', help='fit a model family over a grid and write its curves')
+    run.add_argument('family', choices=sorted(FAMILIES))
+    run.add_argument('--grid', type=json.loads, help='JSON {param: [values]} (default: the family grid)')
+    run.add_argument('--k-range', type=int, nargs=2, metavar=('START', 'STOP'),
+                     help='shorthand for a range of n_clusters / n_components')
+    run.add_argument('--patience', type=int, help='stop after this many points without a better silhouette')
+    run.add_argument('--silhouette-sample', type=int, default=SILHOUETTE_SAMPLE)
+    run.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    run.add_argument('--output', help='CSV for the curves (default: <cache-dir>/<family>.csv)')
+    bench = subparsers.add_parser('benchmark', help='time the notebook loop against the sweep')
+    bench.add_argument('--k-range', type=int, nargs=2, default=[2, 42], metavar=('START', 'STOP'))
+    bench.add_argument('--synthetic', type=int, help='time on this many synthetic players instead of the real pool')
+    for sub in (run, bench):
+        sub.add_argument('--players', default='data/final_player_df.csv')
+        sub.add_argument('--features', default='data')
+        sub.add_argument('--workers', type=int, default=None, help='processes (default: all CPUs)')
+    args = parser.parse_args()
+
+    if args.command == 'benchmark' and args.synthetic:
+        from sklearn.datasets import make_blobs
+        features, _ = make_blobs(args.synthetic, 138, centers=25, cluster_std=4, random_state=SEED)
+    else:
+        features = player_features(args.players, args.features)
+    print(f"Feature matrix: {features.shape[0]:,} players x {features.shape[1]} features")
+    if args.command == 'benchmark':
+        benchmark(features, range(*args.k_range), args.workers)
+    else:
+        grid = args.grid
+        if args.k_range:
+            grid = {FAMILIES[args.family][0]: list(range(*args.k_range))}
+        frame = sweep(features, args.family, grid, args.workers, args.silhouette_sample, args.patience, args.cache_dir)
+        output = args.output or os.path.join(args.cache_dir, f"{args.family}.csv")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        frame.to_csv(output, index=False)
+        print(f"{summarise(frame, args.family)} -> {output}")
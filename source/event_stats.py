@@ -0,0 +1,279 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+# Output columns of process_data, in order
+STATS_COLUMNS = ['Id', 'Matches Played',
+                 'Total Shots', 'Accurate Shots', 'Shot Accuracy', 'Goals', 'Shot Conversion', 'Penalties Taken', 'Penalties Scored', 'Penalty Conversion', 'Free Kick Shots',
+                 'Total Passes', 'Accurate Passes', 'Pass Accuracy', 'Key Passes', 'Assists', 'Crosses', 'Free Kick Crosses',
+                 'Run Attempts With Ball', 'Successful Runs With Ball', 'Perc Successful Runs With Ball', 'Dribbles',
+                 'Aerial Duels', 'Aerial Duels Won', 'Perc Aerial Duels Won', 'Ground Defensive duels Won', 'Loose Ball Duels', 'Loose Balls Won', 'Perc Loose Balls Won',
+                 'Sliding Tackles', 'Interceptions', 'Clearances', 'Blocks', 'Possession Regained', 'Own Goals',
+                 'GK Balls Attacked', 'GK Save Attempts', 'GK Successful Save Attempts', 'Perc GK Save Success'
+                ]
+
+# Nested column holding the outcome/type sub-dicts of each event type
+SUB_EVENT_COLUMNS = {'Shot': 'shot', 'Pass': 'pass', 'Duel': 'duel', 'Dribble': 'dribble', 'Goal Keeper': 'goalkeeper'}
+
+# Flat, typed event columns: everything the stats need from the nested dicts
+FLAT_COLUMNS = ['Id', 'match_id', 'type_name', 'outcome_name', 'sub_type_name', 'pass_height', 'pass_goal_assist']
+CATEGORICAL_COLUMNS = ['type_name', 'outcome_name', 'sub_type_name', 'pass_height']
+
+# Additive per-player counters. Every ratio in STATS_COLUMNS is derived from these.
+COUNT_COLUMNS = ['shots', 'accurate_shots', 'goals', 'penalties_taken', 'penalties_scored', 'free_kick_shots', 'own_goals',
+                 'passes', 'accurate_passes', 'key_passes', 'crosses', 'free_kick_crosses', 'assists',
+                 'carries', 'dribbles',
+                 'aerial_duels', 'aerial_duels_won', 'ground_defensive_duels_won', 'loose_ball_duels', 'loose_balls_won',
+                 'interceptions', 'blocks', 'clearances', 'recoveries',
+                 'gk_actions', 'gk_save_attempts', 'gk_successful_saves']
+
+def _dig(values, *keys):
+    """Follow ``keys`` through nested dicts, yielding None where a level is missing"""
+    out = []
+    for value in values:
+        for key in keys:
+            value = value.get(key) if isinstance(value, dict) else None
+        out.append(value)
+    return out
+
+# -----------------------------
+# Flatten nested events once
+# -----------------------------
+def flatten_events(df):
+    """
+    Flatten a nested StatsBomb event frame (dict columns, as decoded by
+    statsbombapi or read back from the legacy CSV) into FLAT_COLUMNS.
+
+    Each nested field is visited exactly once, and only on the rows of the
+    event type that owns it.
+    """
+    n = len(df)
+    type_name = np.array(_dig(df['type'], 'name'), dtype=object)
+    player_id = pd.array(_dig(df['player'], 'id') if 'player' in df else [None] * n, dtype='Int64')
+
+    outcome_name = np.full(n, None, dtype=object)
+    sub_type_name = np.full(n, None, dtype=object)
+    pass_height = np.full(n, None, dtype=object)
+    pass_goal_assist = np.zeros(n, dtype=bool)
+
+    for event_type, column in SUB_EVENT_COLUMNS.items():
+        rows = np.flatnonzero(type_name == event_type)
+        if column not in df or len(rows) == 0:
+            continue
+        bodies = df[column].to_numpy()[rows]
+        outcome_name[rows] = _dig(bodies, 'outcome', 'name')
+        sub_type_name[rows] = _dig(bodies, 'type', 'name')
+        if event_type == 'Pass':
+            pass_height[rows] = _dig(bodies, 'height', 'name')
+            pass_goal_assist[rows] = [bool(v) for v in _dig(bodies, 'goal_assist')]
+
+    flat = pd.DataFrame({
+        'Id': player_id,
+        'match_id': df['match_id'].to_numpy() if 'match_id' in df else np.zeros(n, dtype=np.int64),
+        'type_name': type_name,
+        'outcome_name': outcome_name,
+        'sub_type_name': sub_type_name,
+        'pass_height': pass_height,
+        'pass_goal_assist': pass_goal_assist,
+    })
+    for col in CATEGORICAL_COLUMNS:
+        flat[col] = flat[col].astype('category')
+    return flat
+
+# -----------------------------
+# Single-pass aggregation
+# -----------------------------
+def _indicators(flat):
+    """One boolean column per counter; summing them per player gives the counts"""
+    def _is(col, *names):
+        return flat[col].isin(names).to_numpy()
+
+    shot, pazz, duel = _is('type_name', 'Shot'), _is('type_name', 'Pass'), _is('type_name', 'Duel')
+    gk = _is('type_name', 'Goal Keeper')
+    goal = shot & _is('outcome_name', 'Goal')
+    penalty = shot & _is('sub_type_name', 'Penalty')
+    high_pass = pazz & _is('pass_height', 'High Pass')
+    won = _is('outcome_name', 'Won')
+    aerial = duel & _is('sub_type_name', 'Aerial Duel')
+    loose_ball = duel & _is('sub_type_name', 'Loose Ball')
+    block = _is('type_name', 'Block')
+
+    return {
+        'shots': shot,
+        'accurate_shots': shot & _is('outcome_name', 'Goal', 'On Target', 'Saved'),
+        'goals': goal,
+        'penalties_taken': penalty,
+        'penalties_scored': penalty & goal,
+        'free_kick_shots': shot & _is('sub_type_name', 'Free Kick'),
+        'own_goals': shot & _is('outcome_name', 'Own Goal'),
+        'passes': pazz,
+        'accurate_passes': pazz & flat['outcome_name'].isna().to_numpy(),
+        'key_passes': pazz & _is('sub_type_name', 'Key Pass'),
+        'crosses': high_pass,
+        'free_kick_crosses': high_pass & _is('sub_type_name', 'Free Kick'),
+        'assists': pazz & flat['pass_goal_assist'].to_numpy(dtype=bool),
+        'carries': _is('type_name', 'Carry'),
+        'dribbles': _is('type_name', 'Dribble') & _is('outcome_name', 'Complete'),
+        'aerial_duels': aerial,
+        'aerial_duels_won': aerial & won,
+        'ground_defensive_duels_won': duel & _is('sub_type_name', 'Ground defending duel') & won,
+        'loose_ball_duels': loose_ball,
+        'loose_balls_won': loose_ball & won,
+        'interceptions': _is('type_name', 'Interception'),
+        'blocks': block,
+        'clearances': _is('type_name', 'Clearance'),
+        'recoveries': _is('type_name', 'Ball Recovery'),
+        'gk_actions': gk,
+        'gk_save_attempts': gk & _is('sub_type_name', 'Shot Saved'),
+        'gk_successful_saves': gk & _is('outcome_name', 'Success'),
+    }
+
+def event_counts(flat):
+    """
+    Additive per-player state for a flat event frame: COUNT_COLUMNS summed in
+    one grouped pass, plus the distinct (Id, match_id) pairs behind
+    'Matches Played'.
+    """
+    has_player = flat['Id'].notna().to_numpy()
+    flat = flat[has_player]
+    ids = flat['Id'].to_numpy(dtype=np.int64)
+
+    indicators = pd.DataFrame({name: values.astype(np.int32) for name, values in _indicators(flat).items()})
+    counts = indicators.groupby(ids).sum()
+    counts.index.name = 'Id'
+
+    appearances = pd.DataFrame({'Id': ids, 'match_id': flat['match_id'].to_numpy()}).drop_duplicates()
+    return counts[COUNT_COLUMNS], appearances
+
+def _ratio(numerator, denominator, empty=0.0):
+    numerator = numerator.to_numpy(dtype=np.float64)
+    denominator = denominator.to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / denominator, empty)
+
+def derive_stats(counts, appearances):
+    """Turn additive counts into the STATS_COLUMNS frame returned by process_data"""
+    return stats_from_counts(counts, appearances.groupby('Id')['match_id'].nunique())
+
+def stats_from_counts(counts, matches_played):
+    """derive_stats with 'Matches Played' already counted per Id"""
+    counts = counts.sort_index()
+    matches_played = matches_played.reindex(counts.index, fill_value=0)
+
+    stats = pd.DataFrame({
+        'Id': counts.index.to_numpy(dtype=np.int64),
+        'Matches Played': matches_played.to_numpy(),
+        'Total Shots': counts['shots'].to_numpy(),
+        'Accurate Shots': counts['accurate_shots'].to_numpy(),
+        'Shot Accuracy': _ratio(counts['accurate_shots'], counts['shots']),
+        'Goals': counts['goals'].to_numpy(),
+        'Shot Conversion': _ratio(counts['goals'], counts['shots']),
+        'Penalties Taken': counts['penalties_taken'].to_numpy(),
+        'Penalties Scored': counts['penalties_scored'].to_numpy(),
+        'Penalty Conversion': _ratio(counts['penalties_scored'], counts['penalties_taken']),
+        'Free Kick Shots': counts['free_kick_shots'].to_numpy(),
+        'Total Passes': counts['passes'].to_numpy(),
+        'Accurate Passes': counts['accurate_passes'].to_numpy(),
+        'Pass Accuracy': _ratio(counts['accurate_passes'], counts['passes']),
+        'Key Passes': counts['key_passes'].to_numpy(),
+        'Assists': counts['assists'].to_numpy(),
+        'Crosses': counts['crosses'].to_numpy(),
+        'Free Kick Crosses': counts['free_kick_crosses'].to_numpy(),
+        'Run Attempts With Ball': counts['carries'].to_numpy(),
+        'Successful Runs With Ball': counts['carries'].to_numpy(),
+        # The legacy pipeline leaves this one undefined for players without carries
+        'Perc Successful Runs With Ball': _ratio(counts['carries'], counts['carries'], empty=np.nan),
+        'Dribbles': counts['dribbles'].to_numpy(),
+        'Aerial Duels': counts['aerial_duels'].to_numpy(),
+        'Aerial Duels Won': counts['aerial_duels_won'].to_numpy(),
+        'Perc Aerial Duels Won': _ratio(counts['aerial_duels_won'], counts['aerial_duels']),
+        'Ground Defensive duels Won': counts['ground_defensive_duels_won'].to_numpy(),
+        'Loose Ball Duels': counts['loose_ball_duels'].to_numpy(),
+        'Loose Balls Won': counts['loose_balls_won'].to_numpy(),
+        'Perc Loose Balls Won': _ratio(counts['loose_balls_won'], counts['loose_ball_duels']),
+        # The legacy pipeline counts 'Block' events for both of these
+        'Sliding Tackles': counts['blocks'].to_numpy(),
+        'Interceptions': counts['interceptions'].to_numpy(),
+        'Clearances': counts['clearances'].to_numpy(),
+        'Blocks': counts['blocks'].to_numpy(),
+        'Possession Regained': counts['recoveries'].to_numpy(),
+        'Own Goals': counts['own_goals'].to_numpy(),
+        'GK Balls Attacked': counts['gk_actions'].to_numpy(),
+        'GK Save Attempts': counts['gk_save_attempts'].to_numpy(),
+        'GK Successful Save Attempts': counts['gk_successful_saves'].to_numpy(),
+        'Perc GK Save Success': _ratio(counts['gk_successful_saves'], counts['gk_save_attempts']),
+    })
+    return stats[STATS_COLUMNS]
+
+def compute_player_stats(events):
+    """
+    Per-player stats for an event frame, nested or already flat.
+    Drop-in replacement for the body of process_data.
+    """
+    flat = events if 'type_name' in events else flatten_events(events)
+    return derive_stats(*event_counts(flat))
+
+# -----------------------------
+# Parity check and benchmark
+# -----------------------------
+# Columns where the engine deliberately differs from the legacy code. The
+# legacy code keys assists on the recipient *name* of the shot's pass, which
+# StatsBomb shots never carry, so it always reports 0. The engine counts
+# passes flagged goal_assist by their passer.
+LEGACY_DIFFERENCES = ['Assists']
+
+def _load_legacy():
+    import importlib.util
+    import os
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '2b. process_live_data.py')
+    spec = importlib.util.spec_from_file_location('process_live_data', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def check_parity(events):
+    """Compare the engine with the legacy process_data implementation on ``events``"""
+    legacy = _load_legacy().process_data_legacy(events.copy())
+    engine = compute_player_stats(events)
+
+    columns = [col for col in STATS_COLUMNS if col not in LEGACY_DIFFERENCES]
+    pd.testing.assert_frame_equal(
+        legacy[columns].reset_index(drop=True).astype(float),
+        engine[columns].reset_index(drop=True).astype(float),
+        check_exact=False
+    )
+    return engine
+
+def benchmark(n_events, n_legacy_events):
+    from source.synthetic_events import synthetic_events
+
+    events = synthetic_events(n_legacy_events)
+    check_parity(events)
+    print(f"Parity OK on {n_legacy_events:,} synthetic events")
+
+    start = time.perf_counter()
+    _load_legacy().process_data_legacy(events.copy())
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compute_player_stats(events)
+    engine_seconds = time.perf_counter() - start
+    print(f"{n_legacy_events:,} events: legacy {legacy_seconds:.2f}s, engine {engine_seconds:.2f}s ({legacy_seconds / engine_seconds:.1f}x)")
+
+    events = synthetic_events(n_events)
+    start = time.perf_counter()
+    flat = flatten_events(events)
+    flatten_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    stats = derive_stats(*event_counts(flat))
+    aggregate_seconds = time.perf_counter() - start
+    print(f"{n_events:,} events: flatten {flatten_seconds:.2f}s, aggregate {aggregate_seconds:.2f}s, {len(stats)} players")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the stats engine against process_data and time both')
+    parser.add_argument('--events', type=int, default=1_000_000)
+    parser.add_argument('--legacy-events', type=int, default=100_000)
+    args = parser.parse_args()
+    benchmark(args.events, args.legacy_events)
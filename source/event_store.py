@@ -0,0 +1,108 @@
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from source.event_stats import CATEGORICAL_COLUMNS, FLAT_COLUMNS, _dig, flatten_events
+
+DEFAULT_EVENTS_DIR = "/mnt/block/data/final_datasets/streamed_events"
+
+_CATEGORY = pa.dictionary(pa.int32(), pa.string())
+
+# Typed, flat layout of one streamed event. Everything the stats engine reads
+# is a plain or dictionary-encoded column, so reading it back needs no parsing.
+EVENT_SCHEMA = pa.schema([
+    ('event_id', pa.string()),
+    ('index', pa.int32()),
+    ('match_id', pa.int64()),
+    ('Id', pa.int64()),
+    ('player_name', pa.string()),
+    ('team_name', _CATEGORY),
+    ('type_name', _CATEGORY),
+    ('outcome_name', _CATEGORY),
+    ('sub_type_name', _CATEGORY),
+    ('pass_height', _CATEGORY),
+    ('pass_goal_assist', pa.bool_()),
+    ('location_x', pa.float32()),
+    ('location_y', pa.float32()),
+])
+
+def flatten_for_storage(events):
+    """Flatten a nested event frame into the EVENT_SCHEMA columns"""
+    n = len(events)
+    flat = flatten_events(events)
+
+    def _column(name, *keys):
+        return _dig(events[name], *keys) if name in events else [None] * n
+
+    location = _column('location')
+    flat['event_id'] = _column('id')
+    flat['index'] = events['index'].to_numpy() if 'index' in events else np.arange(n)
+    flat['player_name'] = _dig(_column('player'), 'name')
+    flat['team_name'] = pd.Categorical(_dig(_column('team'), 'name'))
+    flat['location_x'] = np.array([loc[0] if isinstance(loc, (list, tuple)) else np.nan for loc in location], dtype=np.float32)
+    flat['location_y'] = np.array([loc[1] if isinstance(loc, (list, tuple)) else np.nan for loc in location], dtype=np.float32)
+    return flat[EVENT_SCHEMA.names]
+
+def write_event_partition(events, events_dir, partition):
+    """
+    Write one batch of events to ``<events_dir>/<partition>.parquet``.
+
+    ``events`` may be the nested frame from the StatsBomb client or an
+    already-flat frame. The file appears atomically, so readers never pick up
+    a half-written partition.
+    """
+    flat = events if 'type_name' in events else flatten_for_storage(events)
+    table = pa.Table.from_pandas(flat, schema=EVENT_SCHEMA, preserve_index=False)
+
+    os.makedirs(events_dir, exist_ok=True)
+    path = os.path.join(events_dir, f"{partition}.parquet")
+    # Dot-prefixed so dataset scans skip it while it is being written
+    tmp_path = os.path.join(events_dir, f".{partition}.parquet.tmp")
+    pq.write_table(table, tmp_path, compression='zstd')
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+def read_events(source, columns=FLAT_COLUMNS, match_ids=None):
+    """
+    Read partitions back as a flat frame, loading only ``columns``.
+
+    ``source`` is a partition file, a list of them, or a directory of them.
+    Dictionary columns come back as pandas categoricals and nullable ids as
+    Int64, so the result feeds compute_player_stats directly.
+    """
+    dataset = ds.dataset(source, schema=EVENT_SCHEMA, format='parquet')
+    row_filter = ds.field('match_id').isin(list(match_ids)) if match_ids is not None else None
+    table = dataset.to_table(columns=list(columns), filter=row_filter)
+    frame = table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+    for col in CATEGORICAL_COLUMNS:
+        if col in frame and not isinstance(frame[col].dtype, pd.CategoricalDtype):
+            frame[col] = frame[col].astype('category')
+    return frame
+
+# -----------------------------
+# Legacy CSV importer
+# -----------------------------
+def import_legacy_csv(csv_path, events_dir=DEFAULT_EVENTS_DIR):
+    """Convert a streamed_data.csv dump into one partition per match"""
+    from source.event_stats import _load_legacy
+
+    events = _load_legacy().load_events_csv(csv_path)
+    flat = flatten_for_storage(events)
+    paths = [write_event_partition(match_events, events_dir, f"match-{match_id}")
+             for match_id, match_events in flat.groupby('match_id', sort=True)]
+    print(f"Imported {len(flat)} events from {csv_path} into {len(paths)} partitions in {events_dir}")
+    return paths
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert the legacy streamed_data.csv into Parquet partitions')
+    parser.add_argument('csv_path')
+    parser.add_argument('--events-dir', default=DEFAULT_EVENTS_DIR)
+    args = parser.parse_args()
+    import_legacy_csv(args.csv_path, args.events_dir)
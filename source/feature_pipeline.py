@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+# Same recipe as "4. Player Matching": min-max scaled event stats followed by
+# the 10x10 spatial density vector multiplied by weight_factor
+WEIGHT_FACTOR = 5.0
+
+STAT_COLUMNS = [
+    'matches_played', 'total_shots', 'accurate_shots', 'shot_accuracy', 'goals', 'shot_conversion',
+    'penalties_taken', 'penalties_scored', 'penalty_conversion', 'free_kick_shots',
+    'total_passes', 'accurate_passes', 'pass_accuracy', 'key_passes', 'assists', 'crosses', 'free_kick_crosses',
+    'run_attempts_with_ball', 'successful_runs_with_ball', 'perc_successful_runs_with_ball', 'dribbles',
+    'aerial_duels', 'aerial_duels_won', 'perc_aerial_duels_won', 'ground_defensive_duels_won',
+    'loose_ball_duels', 'loose_balls_won', 'perc_loose_balls_won',
+    'sliding_tackles', 'interceptions', 'clearances', 'blocks', 'possession_regained', 'own_goals',
+    'gk_balls_attacked', 'gk_save_attempts', 'gk_successful_save_attempts', 'perc_gk_save_success'
+]
+
+# Bumped whenever the saved layout or the transform changes meaning
+PIPELINE_VERSION = 1
+PIPELINE_FILE = 'pipeline.json'
+
+def _numeric(series):
+    """Stats columns in the final export are numbers or '12.5%' strings"""
+    import pandas as pd
+    if series.dtype == object or pd.api.types.is_string_dtype(series):
+        series = series.astype(str).str.rstrip('%').replace({'nan': None, 'None': None})
+    return pd.to_numeric(series, errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+def _value(value):
+    """One stat value from a player record, as _numeric reads a column"""
+    if isinstance(value, str):
+        value = value.rstrip('%')
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if np.isnan(value) else value
+
+class FeaturePipeline:
+    """
+    The similarity features of "4. Player Matching" as a fitted, saveable
+    object: the stat ``columns`` in a fixed order, min-max scaled with the
+    fitted ``data_min`` and ``data_range``, followed by the spatial density
+    vector times ``weight_factor``.
+
+    Fitting happens offline; ``transform`` is plain vectorised NumPy, so the
+    serving process can project a player or a batch without sklearn.
+    """
+
+    def __init__(self, columns, data_min, data_range, weight_factor=WEIGHT_FACTOR, spatial_dim=None,
+                 version=PIPELINE_VERSION):
+        if version > PIPELINE_VERSION:
+            raise ValueError(f"feature pipeline version {version} is newer than this code ({PIPELINE_VERSION}); upgrade first")
+        self.columns       = list(columns)
+        self.data_min      = np.asarray(data_min, dtype=np.float64)
+        self.data_range    = np.asarray(data_range, dtype=np.float64)
+        self.weight_factor = float(weight_factor)
+        self.spatial_dim   = spatial_dim
+        self.version       = version
+        self._divisor      = np.where(self.data_range == 0, 1, self.data_range)
+
+    @property
+    def n_stats(self):
+        return len(self.columns)
+
+    @property
+    def dim(self):
+        """Length of a transformed vector, when the spatial size is known"""
+        return None if self.spatial_dim is None else self.n_stats + self.spatial_dim
+
+    @classmethod
+    def fit(cls, stats, spatial, columns=STAT_COLUMNS, weight_factor=WEIGHT_FACTOR):
+        """Fit the min-max scaling on a (n_players, len(columns)) stats matrix"""
+        stats = np.asarray(stats, dtype=np.float64)
+        data_min = stats.min(axis=0)
+        return cls(columns, data_min, stats.max(axis=0) - data_min, weight_factor, int(np.shape(spatial)[1]))
+
+    def transform(self, stats, spatial):
+        """
+        Final feature vectors for a batch: ``stats`` is (n, n_stats) in
+        column order and ``spatial`` is (n, spatial_dim). A single player's
+        1-D ``stats`` and ``spatial`` give a single 1-D vector.
+        """
+        stats, spatial = np.asarray(stats, dtype=np.float64), np.asarray(spatial, dtype=np.float64)
+        single = stats.ndim == 1
+        stats, spatial = np.atleast_2d(stats), spatial.reshape(len(np.atleast_2d(stats)), -1)
+        if stats.shape[1] != self.n_stats:
+            raise ValueError(f"expected {self.n_stats} stat columns, got {stats.shape[1]}")
+        if self.spatial_dim is not None and spatial.shape[1] != self.spatial_dim:
+            raise ValueError(f"expected {self.spatial_dim} spatial values, got {spatial.shape[1]}")
+        features = np.hstack([(stats - self.data_min) / self._divisor, spatial * self.weight_factor]).astype(np.float32)
+        return features[0] if single else features
+
+    def stats_row(self, record):
+        """The stats of one player record (a mapping of column -> value) in column order"""
+        return np.array([_value(record.get(col)) for col in self.columns], dtype=np.float64)
+
+    def transform_record(self, record, spatial):
+        """Final feature vector of one player record"""
+        return self.transform(self.stats_row(record), spatial)
+
+    def transform_frame(self, players_df, heatmap_dict):
+        """
+        Project every player of a final_player_df frame that has spatial
+        data (first row per id). Returns (ids, features).
+        """
+        df = players_df.drop_duplicates(subset='id', keep='first')
+        df = df[df['id'].isin(heatmap_dict)]
+        stats = np.column_stack([_numeric(df[col]) for col in self.columns]) if len(df) else np.empty((0, self.n_stats))
+        spatial = np.array([heatmap_dict[pid] for pid in df['id']], dtype=np.float64).reshape(len(df), -1)
+        return df['id'].to_numpy(dtype=np.int64), self.transform(stats, spatial)
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+    def to_dict(self):
+        return {'version': self.version, 'columns': self.columns, 'min': self.data_min.tolist(),
+                'range': self.data_range.tolist(), 'weight_factor': self.weight_factor, 'spatial_dim': self.spatial_dim}
+
+    @classmethod
+    def from_dict(cls, data):
+        """From ``to_dict`` output, or the bare scaler dict older indexes kept in meta.json"""
+        return cls(data['columns'], data['min'], data['range'], data.get('weight_factor', WEIGHT_FACTOR),
+                   data.get('spatial_dim'), data.get('version', 1))
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, PIPELINE_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory):
+        """Load ``<directory>/pipeline.json``, falling back to the scaler in an older meta.json. None if neither exists."""
+        path = os.path.join(directory, PIPELINE_FILE)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return cls.from_dict(json.load(f))
+        meta_path = os.path.join(directory, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                scaler = json.load(f).get('scaler')
+            if scaler:
+                return cls.from_dict(scaler)
+        return None
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, PIPELINE_FILE))
+
+# -----------------------------
+# Parity check
+# -----------------------------
+def notebook_features(players_df, heatmap_dict, columns=STAT_COLUMNS, weight_factor=WEIGHT_FACTOR):
+    """The notebook cells: MinMaxScaler on the stat columns, spatial times weight_factor, np.hstack"""
+    from sklearn.preprocessing import MinMaxScaler
+
+    df = players_df.drop_duplicates(subset='id', keep='first')
+    df = df[df['id'].isin(heatmap_dict)]
+    scaled = MinMaxScaler().fit_transform(np.column_stack([_numeric(df[col]) for col in columns]))
+    spatial = np.array([heatmap_dict[pid] for pid in df['id']], dtype=np.float64) * weight_factor
+    return np.hstack([scaled, spatial])
+
+def check(players_path, features_path, repeats=10_000):
+    """Compare a fitted pipeline with the notebook recipe and time serving-side transforms"""
+    import pandas as pd
+    from source.heatmap_features import load_heatmap_features
+
+    players_df = pd.read_csv(players_path)
+    heatmap_dict = load_heatmap_features(features_path)
+    df = players_df.drop_duplicates(subset='id', keep='first')
+    df = df[df['id'].isin(heatmap_dict)]
+    pipeline = FeaturePipeline.fit(np.column_stack([_numeric(df[col]) for col in STAT_COLUMNS]),
+                                   np.array([heatmap_dict[pid] for pid in df['id']]))
+    ids, features = pipeline.transform_frame(players_df, heatmap_dict)
+    np.testing.assert_allclose(features, notebook_features(players_df, heatmap_dict), rtol=1e-6, atol=1e-6)
+    print(f"Pipeline matches the notebook recipe on {len(ids):,} players ({pipeline.dim} dims)")
+
+    restored = FeaturePipeline.from_dict(json.loads(json.dumps(pipeline.to_dict())))
+    record = df.iloc[0].to_dict()
+    single = restored.transform_record(record, heatmap_dict[int(record['id'])])
+    np.testing.assert_array_equal(single, features[0])
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        restored.transform_record(record, heatmap_dict[int(record['id'])])
+    single_us = (time.perf_counter() - start) / repeats * 1e6
+    stats = np.column_stack([_numeric(df[col]) for col in STAT_COLUMNS])
+    spatial = np.array([heatmap_dict[pid] for pid in df['id']])
+    start = time.perf_counter()
+    restored.transform(stats, spatial)
+    batch_ms = (time.perf_counter() - start) * 1000
+    print(f"transform_record: {single_us:.1f}us per player; batch of {len(stats):,}: {batch_ms:.2f}ms")
+
+def import_cost():
+    """Import time and the heavy modules a fresh interpreter pulls in to load a pipeline"""
+    import subprocess
+    code = ("import time, sys; t = time.perf_counter(); from source.feature_pipeline import FeaturePipeline; "
+            "print(time.perf_counter() - t, any(m.split('.')[0] in ('sklearn', 'umap', 'faiss', 'pandas') for m in sys.modules))")
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.split()
+    print(f"Importing FeaturePipeline: {float(out[0]) * 1000:.0f}ms, sklearn/umap/faiss/pandas imported: {out[1]}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the saved-feature pipeline against the notebook recipe')
+    parser.add_argument('--players', default='data/final_player_df.csv')
+    parser.add_argument('--features', default='data', help='directory with the heatmap feature arrays, or a JSON export')
+    args = parser.parse_args()
+    check(args.players, args.features)
+    import_cost()
@@ -0,0 +1,310 @@
+import time
+import random
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+FETCH_WORKERS = 8
+RATE_LIMIT = 10.0  # requests per second
+RATE_BURST = 10
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_MAX = 10.0
+FETCH_TIMEOUT = 30.0
+BATCH_SIZE = 5
+MAX_BATCH_AGE = 10.0  # seconds before a partial batch is flushed anyway
+
+class TokenBucket:
+    """
+    Async token bucket: ``rate`` tokens per second, holding at most ``burst``.
+    Only ever touched from the event loop thread, so it needs no lock.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate    = float(rate)
+        self.burst   = float(burst)
+        self.tokens  = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX, rng=random):
+    """Exponential backoff with full jitter: uniform in [0, min(cap, base * 2**attempt)]"""
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+class FetchScheduler:
+    """
+    Fetch match events concurrently and hand them on in batches.
+
+    ``fetch(match_id)`` is the blocking client call (``df_client.events``).
+    It runs on a pool of ``workers`` threads. Calls are paced by a token
+    bucket, retried with jittered exponential backoff and abandoned after
+    ``timeout`` seconds per attempt. Fetched matches are buffered and passed
+    to ``on_batch([(match_id, events), ...])`` once ``batch_size`` have
+    arrived or the oldest has waited ``max_batch_age`` seconds.
+
+    ``on_fetch(match_id, seconds, outcome)`` is called after every attempt,
+    with outcome 'ok', 'error' or 'timeout'. ``on_failure(match_id, error)``
+    is called when a match runs out of retries. A failed match is dropped
+    from ``pending``, so it can be submitted again on the next poll.
+    """
+
+    def __init__(self, fetch, on_batch, workers=FETCH_WORKERS, rate=RATE_LIMIT, burst=RATE_BURST,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 timeout=FETCH_TIMEOUT, batch_size=BATCH_SIZE, max_batch_age=MAX_BATCH_AGE,
+                 on_fetch=None, on_failure=None, seed=None):
+        self.fetch         = fetch
+        self.on_batch      = on_batch
+        self.on_fetch      = on_fetch
+        self.on_failure    = on_failure
+        self.workers       = workers
+        self.bucket        = TokenBucket(rate, burst)
+        self.max_retries   = max_retries
+        self.backoff_base  = backoff_base
+        self.backoff_max   = backoff_max
+        self.timeout       = timeout
+        self.batch_size    = batch_size
+        self.max_batch_age = max_batch_age
+        self.rng           = random.Random(seed)
+
+        self.pending = set()  # submitted and not yet flushed or failed
+        self.buffer  = []     # fetched, waiting for the next flush
+        self.failed  = []
+        self._oldest = None
+        self._tasks  = []
+        self._executor = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._results = asyncio.Queue()
+        self._flush_lock = asyncio.Lock()
+        # Timed-out calls keep their thread until the client returns, so leave
+        # headroom beyond the worker count
+        self._executor = ThreadPoolExecutor(max_workers=2 * self.workers, thread_name_prefix='fetch')
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._batcher()))
+
+    def submit(self, match_ids):
+        """Queue matches for fetching, skipping any already in flight. Returns the number queued."""
+        queued = 0
+        for match_id in match_ids:
+            if match_id not in self.pending:
+                self.pending.add(match_id)
+                self._queue.put_nowait(match_id)
+                queued += 1
+        return queued
+
+    async def drain(self):
+        """Wait for every submitted match to be fetched or failed, then flush the remainder"""
+        await self._queue.join()
+        await self._results.join()
+        await self._flush()
+
+    async def close(self):
+        await self.drain()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # -----------------------------
+    # Fetching
+    # -----------------------------
+    async def _fetch_once(self, match_id):
+        loop = asyncio.get_running_loop()
+        await self.bucket.acquire()
+        start = time.perf_counter()
+        try:
+            events = await asyncio.wait_for(loop.run_in_executor(self._executor, self.fetch, match_id), self.timeout)
+        except asyncio.TimeoutError:
+            self._report(match_id, start, 'timeout')
+            raise
+        except Exception:
+            self._report(match_id, start, 'error')
+            raise
+        self._report(match_id, start, 'ok')
+        return events
+
+    def _report(self, match_id, start, outcome):
+        if self.on_fetch is not None:
+            self.on_fetch(match_id, time.perf_counter() - start, outcome)
+
+    async def _worker(self):
+        while True:
+            match_id = await self._queue.get()
+            try:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        events = await self._fetch_once(match_id)
+                    except Exception as e:
+                        error = e if not isinstance(e, asyncio.TimeoutError) else TimeoutError(f"no response after {self.timeout}s")
+                        if attempt == self.max_retries:
+                            self._fail(match_id, error)
+                            break
+                        await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max, self.rng))
+                    else:
+                        await self._results.put((match_id, events))
+                        break
+            finally:
+                self._queue.task_done()
+
+    def _fail(self, match_id, error):
+        print(f"Giving up on match {match_id} after {self.max_retries + 1} attempts: {error}")
+        self.pending.discard(match_id)
+        self.failed.append(match_id)
+        if self.on_failure is not None:
+            self.on_failure(match_id, error)
+
+    # -----------------------------
+    # Batching
+    # -----------------------------
+    async def _batcher(self):
+        while True:
+            timeout = None
+            if self.buffer:
+                timeout = max(0.0, self._oldest + self.max_batch_age - time.monotonic())
+            try:
+                item = await asyncio.wait_for(self._results.get(), timeout)
+            except asyncio.TimeoutError:
+                await self._flush()
+                continue
+
+            try:
+                if not self.buffer:
+                    self._oldest = time.monotonic()
+                self.buffer.append(item)
+                if len(self.buffer) >= self.batch_size:
+                    await self._flush()
+            finally:
+                self._results.task_done()
+
+    async def _flush(self):
+        async with self._flush_lock:
+            if not self.buffer:
+                return
+            batch, self.buffer = self.buffer, []
+            match_ids = [match_id for match_id, _ in batch]
+            try:
+                await asyncio.to_thread(self.on_batch, batch)
+            except Exception as e:
+                print(f"Failed to write batch {match_ids}: {e}")
+            finally:
+                self.pending.difference_update(match_ids)
+
+# -----------------------------
+# Stub client for local runs
+# -----------------------------
+class StubEventsClient:
+    """
+    Stand-in for the StatsBomb DataFrame client. ``events(match_id)`` blocks
+    for ``latency`` +/- ``jitter`` seconds and returns synthetic events. It
+    raises ConnectionError with probability ``failure_rate`` and stalls for
+    ``hang_seconds`` with probability ``hang_rate``, to exercise retries and
+    timeouts.
+    """
+
+    def __init__(self, latency=0.2, jitter=0.05, failure_rate=0.0, hang_rate=0.0, hang_seconds=5.0,
+                 events_per_match=200, seed=0):
+        self.latency          = latency
+        self.jitter           = jitter
+        self.failure_rate     = failure_rate
+        self.hang_rate        = hang_rate
+        self.hang_seconds     = hang_seconds
+        self.events_per_match = events_per_match
+        self.rng      = random.Random(seed)
+        self.lock     = threading.Lock()
+        self.calls    = 0
+        self.inflight = 0
+        self.max_inflight = 0
+
+    def events(self, match_id):
+        from source.synthetic_events import synthetic_events
+
+        with self.lock:
+            self.calls += 1
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+            roll = self.rng.random()
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+        try:
+            if roll < self.hang_rate:
+                time.sleep(self.hang_seconds)
+            time.sleep(delay)
+            if roll >= 1 - self.failure_rate:
+                raise ConnectionError(f"injected failure fetching match {match_id}")
+            events = synthetic_events(self.events_per_match, n_matches=1, seed=match_id)
+            return events.drop(columns='match_id')
+        finally:
+            with self.lock:
+                self.inflight -= 1
+
+def run_stub(n_matches=50, workers=FETCH_WORKERS, rate=RATE_LIMIT, burst=RATE_BURST, timeout=2.0,
+             batch_size=BATCH_SIZE, max_batch_age=MAX_BATCH_AGE, **client_args):
+    """Drive the scheduler against StubEventsClient and report what happened"""
+    client = StubEventsClient(**client_args)
+    batches, outcomes = [], {}
+
+    def on_batch(batch):
+        batches.append(pd.concat([events.assign(match_id=match_id) for match_id, events in batch], ignore_index=True))
+
+    def on_fetch(match_id, seconds, outcome):
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    async def _run():
+        scheduler = FetchScheduler(client.events, on_batch, workers=workers, rate=rate, burst=burst,
+                                   timeout=timeout, batch_size=batch_size, max_batch_age=max_batch_age,
+                                   backoff_base=0.05, on_fetch=on_fetch, seed=0)
+        async with scheduler:
+            scheduler.submit(range(1, n_matches + 1))
+        return scheduler
+
+    start = time.perf_counter()
+    scheduler = asyncio.run(_run())
+    elapsed = time.perf_counter() - start
+
+    fetched = sorted(int(match_id) for batch in batches for match_id in batch['match_id'].unique())
+    assert len(fetched) == len(set(fetched)), "a match was delivered twice"
+    assert set(fetched) | set(scheduler.failed) == set(range(1, n_matches + 1)), "a match went missing"
+
+    print(f"{n_matches} matches in {elapsed:.2f}s with {workers} workers at {rate:g} req/s: "
+          f"{len(fetched)} fetched in {len(batches)} batches, {len(scheduler.failed)} failed, "
+          f"{client.calls} calls {outcomes}, peak concurrency {client.max_inflight}")
+    print(f"Serial fetching would take at least {n_matches * client.latency:.2f}s")
+    return fetched, scheduler.failed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exercise the fetch scheduler against a stub StatsBomb client')
+    parser.add_argument('--matches', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=FETCH_WORKERS)
+    parser.add_argument('--rate', type=float, default=RATE_LIMIT)
+    parser.add_argument('--burst', type=int, default=RATE_BURST)
+    parser.add_argument('--timeout', type=float, default=2.0)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--max-batch-age', type=float, default=MAX_BATCH_AGE)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--failure-rate', type=float, default=0.1)
+    parser.add_argument('--hang-rate', type=float, default=0.02)
+    args = parser.parse_args()
+    run_stub(args.matches, args.workers, args.rate, args.burst, args.timeout, args.batch_size, args.max_batch_age,
+             latency=args.latency, failure_rate=args.failure_rate, hang_rate=args.hang_rate)
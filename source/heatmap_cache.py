@@ -0,0 +1,129 @@
+import os
+import json
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from source.heatmap_features import DEFAULT_OUTPUT_DIR, load_heatmap_features
+from source.heatmap_generator import RENDER_SETTINGS, render_heatmap_png, render_heatmaps_png
+
+DEFAULT_CACHE_DIR = 'data/heatmap_cache'
+DEFAULT_MAX_ITEMS = 256
+
+def heatmap_key(density_data, settings=RENDER_SETTINGS):
+    """
+    Content address of a rendered heatmap: a hash of the density vector plus the
+    render settings, so identical inputs always map to the same image
+    """
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(density_data, dtype=np.float64).tobytes())
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()[:32]
+
+class HeatmapCache:
+    """
+    Two-tier PNG cache for rendered heatmaps.
+
+    A bounded in-memory LRU sits in front of an on-disk store of
+    ``<cache_dir>/<key[:2]>/<key>.png`` files. Misses on both tiers are
+    rendered, written to disk and promoted into memory.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_items=DEFAULT_MAX_ITEMS, render=render_heatmap_png):
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self.render    = render
+        self.hits      = {'memory': 0, 'disk': 0}
+        self.misses    = 0
+        self._memory   = OrderedDict()
+        self._lock     = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.png")
+
+    def _remember(self, key, png):
+        with self._lock:
+            self._memory[key] = png
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def _write(self, key, png):
+        # Write to a temporary file first so readers never see a partial PNG
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, path)
+
+    def get(self, density_data, key=None):
+        """Return (key, png_bytes) for a density vector, rendering on a full miss"""
+        key = key or heatmap_key(density_data)
+
+        with self._lock:
+            png = self._memory.get(key)
+            if png is not None:
+                self._memory.move_to_end(key)
+                self.hits['memory'] += 1
+                return key, png
+
+        try:
+            with open(self._path(key), 'rb') as f:
+                png = f.read()
+            self.hits['disk'] += 1
+        except FileNotFoundError:
+            png = self.render(density_data)
+            self._write(key, png)
+            self.misses += 1
+
+        self._remember(key, png)
+        return key, png
+
+    def contains(self, key):
+        return key in self._memory or os.path.exists(self._path(key))
+
+    def stats(self):
+        return {'memory_items': len(self._memory),
+                'memory_hits': self.hits['memory'],
+                'disk_hits': self.hits['disk'],
+                'misses': self.misses}
+
+# -----------------------------
+# Batch pre-warm
+# -----------------------------
+PREWARM_BATCH_SIZE = 32
+
+def _prewarm_batch(args):
+    cache_dir, densities = args
+    cache = HeatmapCache(cache_dir=cache_dir, max_items=0)
+    keys = [heatmap_key(density) for density in densities]
+    missing = [(key, density) for key, density in zip(keys, densities) if not cache.contains(key)]
+    if missing:
+        # One vectorised render call for the whole batch
+        pngs = render_heatmaps_png([density for _, density in missing])
+        for (key, _), png in zip(missing, pngs):
+            cache._write(key, png)
+    return len(missing)
+
+def prewarm(features_path=DEFAULT_OUTPUT_DIR, cache_dir=DEFAULT_CACHE_DIR, workers=None):
+    """Render every player's heatmap features (arrays or JSON, see load_heatmap_features) into the disk tier"""
+    densities = load_heatmap_features(features_path).features
+    jobs = [(cache_dir, densities[i:i + PREWARM_BATCH_SIZE]) for i in range(0, len(densities), PREWARM_BATCH_SIZE)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rendered = sum(pool.map(_prewarm_batch, jobs))
+
+    print(f"Pre-warmed {len(densities)} heatmaps ({rendered} rendered, {len(densities) - rendered} already cached) in {cache_dir}")
+    return rendered
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pre-render heatmap PNGs into the on-disk cache')
+    parser.add_argument('--features', default=DEFAULT_OUTPUT_DIR, help='directory with the feature arrays, or a JSON export')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    prewarm(args.features, args.cache_dir, args.workers)
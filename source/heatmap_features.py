@@ -0,0 +1,333 @@
+import os
+import json
+import time
+import argparse
+from collections.abc import Mapping
+
+import numpy as np
+
+# pyarrow is only needed to build the features, so it is imported inside the
+# builder functions; loading them for serving stays NumPy-only
+
+DEFAULT_EVENTS_PATH = "/mnt/block/data/final_datasets/match_detail.parquet"
+DEFAULT_OUTPUT_DIR = "data"
+
+# Same choices as "3. Visualize Heatmap": on-the-ball event types, a 10x10
+# grid over Wyscout's 0-100 pitch coordinates and at least 5 positions
+INCLUDE_EVENTS = ["Pass", "Shot", "Others on the ball", "Duel", "Save attempt", "Goalkeeper leaving line"]
+GRID_SIZE = (10, 10)
+PITCH_RANGE = ((0, 100), (0, 100))
+MIN_POSITIONS = 5
+CHUNK_ROWS = 1_000_000
+
+FEATURES_FILE = 'heatmap_features.npy'
+IDS_FILE = 'heatmap_ids.npy'
+META_FILE = 'heatmap_meta.json'
+JSON_FILE = 'player_heatmap_features.json'
+
+def _first_positions(positions):
+    """
+    x, y of the first entry of each ``positions`` list, and a mask of the
+    rows that have one, read straight from the Arrow list offsets.
+    """
+    if hasattr(positions, 'combine_chunks'):  # ChunkedArray
+        positions = positions.combine_chunks()
+    offsets = positions.offsets.to_numpy()
+    valid = np.diff(offsets) > 0
+    if positions.null_count:
+        valid &= positions.is_valid().to_numpy(zero_copy_only=False)
+    values = positions.values
+    first = offsets[:-1][valid]
+    x = values.field('x').to_numpy(zero_copy_only=False)[first]
+    y = values.field('y').to_numpy(zero_copy_only=False)[first]
+    return x.astype(np.float64), y.astype(np.float64), valid
+
+def _cells(x, y, grid_size, pitch_range):
+    """
+    Flattened grid cell of each position, or -1 outside the pitch range.
+    Bin edges and edge handling match np.histogram2d, so a point on the
+    far edge falls in the last bin.
+    """
+    cells = np.zeros(len(x), dtype=np.int64)
+    inside = np.ones(len(x), dtype=bool)
+    for values, bins, (lo, hi), stride in ((x, grid_size[0], pitch_range[0], grid_size[1]),
+                                           (y, grid_size[1], pitch_range[1], 1)):
+        edges = np.linspace(lo, hi, bins + 1)
+        index = np.searchsorted(edges, values, side='right') - 1
+        index[values == hi] = bins - 1
+        inside &= (values >= lo) & (values <= hi)
+        cells += np.clip(index, 0, bins - 1) * stride
+    return np.where(inside, cells, -1)
+
+class DensityAccumulator:
+    """
+    Per-player position counts on the grid, built one chunk of events at a
+    time. Each chunk is a single np.bincount over ``player_row * n_cells +
+    cell``, so the cost is linear in events and independent of the number
+    of players.
+    """
+
+    def __init__(self, grid_size=GRID_SIZE, pitch_range=PITCH_RANGE):
+        self.grid_size   = tuple(grid_size)
+        self.pitch_range = pitch_range
+        self.n_cells     = grid_size[0] * grid_size[1]
+        self.rows        = {}  # playerId -> row in counts
+        self.counts      = np.zeros((0, self.n_cells), dtype=np.int64)
+        self.positions   = np.zeros(0, dtype=np.int64)  # every first position, in range or not
+
+    def _player_rows(self, player_ids):
+        unique, inverse = np.unique(player_ids, return_inverse=True)
+        for pid in unique.tolist():
+            self.rows.setdefault(pid, len(self.rows))
+        if len(self.rows) > len(self.counts):
+            grow = len(self.rows) - len(self.counts)
+            self.counts = np.vstack([self.counts, np.zeros((grow, self.n_cells), dtype=np.int64)])
+            self.positions = np.concatenate([self.positions, np.zeros(grow, dtype=np.int64)])
+        return np.array([self.rows[pid] for pid in unique.tolist()], dtype=np.int64)[inverse]
+
+    def add(self, player_ids, x, y):
+        if not len(player_ids):
+            return
+        rows = self._player_rows(np.asarray(player_ids, dtype=np.int64))
+        self.positions += np.bincount(rows, minlength=len(self.positions))
+        cells = _cells(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), self.grid_size, self.pitch_range)
+        inside = cells >= 0
+        flat = rows[inside] * self.n_cells + cells[inside]
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+
+    def add_batch(self, batch):
+        """Add an Arrow batch with ``playerId`` and Wyscout ``positions`` columns"""
+        x, y, valid = _first_positions(batch.column('positions'))
+        player_ids = batch.column('playerId').to_numpy(zero_copy_only=False)[valid]
+        self.add(player_ids, x, y)
+
+    def features(self, min_positions=MIN_POSITIONS):
+        """
+        (ids, features): sorted player ids and their grids flattened row-major
+        (x bin major, as histogram2d(...).flatten()) and normalised to sum to
+        one. Players with fewer than ``min_positions`` positions, or none on
+        the pitch, are left out.
+        """
+        ids = np.array(list(self.rows), dtype=np.int64)
+        rows = np.array(list(self.rows.values()), dtype=np.int64)
+        totals = self.counts[rows].sum(axis=1)
+        keep = (self.positions[rows] >= min_positions) & (totals > 0)
+        ids, rows, totals = ids[keep], rows[keep], totals[keep]
+
+        order = np.argsort(ids)
+        features = (self.counts[rows[order]] / totals[order, None]).astype(np.float32)
+        return ids[order], features
+
+def build_heatmap_features(events_path=DEFAULT_EVENTS_PATH, include_events=INCLUDE_EVENTS, grid_size=GRID_SIZE,
+                           pitch_range=PITCH_RANGE, min_positions=MIN_POSITIONS, chunk_rows=CHUNK_ROWS):
+    """
+    Stream the Wyscout event parquet (a file or a directory of them) and
+    return (ids, features) for every player, reading only the playerId,
+    eventName and positions columns of the included event types.
+    """
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(events_path, format='parquet')
+    row_filter = ds.field('eventName').isin(list(include_events)) if include_events else None
+    accumulator = DensityAccumulator(grid_size, pitch_range)
+    for batch in dataset.to_batches(columns=['playerId', 'positions'], filter=row_filter, batch_size=chunk_rows):
+        accumulator.add_batch(batch)
+    return accumulator.features(min_positions)
+
+# -----------------------------
+# Output formats
+# -----------------------------
+def _save_npy(path, array):
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+def save_features(ids, features, output_dir=DEFAULT_OUTPUT_DIR, **meta):
+    """
+    Write ``heatmap_features.npy`` (float32, one row per player, loadable
+    with mmap_mode='r') and ``heatmap_ids.npy`` (int64, aligned rows), plus
+    the build settings in ``heatmap_meta.json``.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    _save_npy(os.path.join(output_dir, FEATURES_FILE), np.ascontiguousarray(features, dtype=np.float32))
+    _save_npy(os.path.join(output_dir, IDS_FILE), np.asarray(ids, dtype=np.int64))
+    meta = {'n_players': len(ids), 'n_cells': int(features.shape[1]), **meta}
+    tmp_path = os.path.join(output_dir, f"{META_FILE}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(output_dir, META_FILE))
+
+def export_json(ids, features, path):
+    """The ``[{"playerId": ..., "features": [...]}]`` layout the notebook wrote"""
+    records = [{'playerId': int(pid), 'features': vector.astype(np.float64).tolist()} for pid, vector in zip(ids, features)]
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(records, f, indent=2)
+    os.replace(tmp_path, path)
+
+def convert_json(json_path, output_dir=DEFAULT_OUTPUT_DIR):
+    """Convert an existing JSON export into the binary arrays"""
+    features = HeatmapFeatures.from_json(json_path)
+    save_features(features.ids, features.features, output_dir, source=os.path.basename(json_path))
+    return features
+
+# -----------------------------
+# Loading
+# -----------------------------
+class HeatmapFeatures(Mapping):
+    """
+    Read-only ``playerId -> density vector`` mapping over one (n_players,
+    n_cells) float32 array. Loaded with mmap, every process that opens the
+    same file shares its page cache, and each lookup returns a view of a
+    row rather than a copy.
+    """
+
+    def __init__(self, ids, features):
+        self.ids      = np.asarray(ids, dtype=np.int64)
+        self.features = features
+        self.offsets  = {int(pid): offset for offset, pid in enumerate(self.ids)}
+
+    @classmethod
+    def load(cls, data_dir=DEFAULT_OUTPUT_DIR, mmap=True):
+        ids = np.load(os.path.join(data_dir, IDS_FILE))
+        features = np.load(os.path.join(data_dir, FEATURES_FILE), mmap_mode='r' if mmap else None)
+        return cls(ids, features)
+
+    @classmethod
+    def from_json(cls, json_path):
+        with open(json_path, 'r') as f:
+            records = json.load(f)
+        ids = np.array([record['playerId'] for record in records], dtype=np.int64)
+        # float32 like the binary file, so both give the same vectors and cache keys
+        features = np.array([record['features'] for record in records], dtype=np.float32)
+        return cls(ids, features.reshape(len(ids), -1))
+
+    def __getitem__(self, player_id):
+        return self.features[self.offsets[player_id]]
+
+    def __contains__(self, player_id):
+        return player_id in self.offsets
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.ids)
+
+def load_heatmap_features(path=DEFAULT_OUTPUT_DIR, mmap=True):
+    """
+    Heatmap features from ``path``: a directory holding the binary arrays, a
+    directory holding only the JSON export (the fallback), or a JSON file.
+    """
+    if os.path.isdir(path):
+        if os.path.exists(os.path.join(path, FEATURES_FILE)) and os.path.exists(os.path.join(path, IDS_FILE)):
+            return HeatmapFeatures.load(path, mmap)
+        path = os.path.join(path, JSON_FILE)
+    return HeatmapFeatures.from_json(path)
+
+# -----------------------------
+# Parity check and benchmark
+# -----------------------------
+def synthetic_wyscout_events(n_events, n_players=2000, seed=7):
+    """Wyscout-shaped events: playerId, eventName and a positions list of {x, y} structs"""
+    import pyarrow as pa
+
+    rng = np.random.default_rng(seed)
+    names = INCLUDE_EVENTS + ['Foul', 'Free Kick', 'Interruption']
+    event_names = np.array(names)[rng.integers(len(names), size=n_events)]
+    player_ids = rng.integers(1, n_players + 1, size=n_events)
+    lengths = rng.choice([0, 1, 2], size=n_events, p=[0.05, 0.15, 0.8])
+    coords = rng.integers(-2, 103, size=(int(lengths.sum()), 2))  # a few land off the pitch or on its edges
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int32)
+    points = pa.StructArray.from_arrays([pa.array(coords[:, 1]), pa.array(coords[:, 0])], names=['y', 'x'])
+    return pa.table({'playerId': pa.array(player_ids), 'eventName': pa.array(event_names),
+                     'positions': pa.ListArray.from_arrays(pa.array(offsets), points)})
+
+def reference_features(table, include_events=INCLUDE_EVENTS, grid_size=GRID_SIZE, min_positions=MIN_POSITIONS):
+    """The notebook's per-player loop, kept as the reference for check_parity"""
+    df = table.to_pandas()
+    df = df[df['eventName'].isin(include_events)]
+    features = {}
+    for player_id in df['playerId'].unique():
+        df_player = df[df['playerId'] == player_id]
+        positions = [(pos[0]['x'], pos[0]['y']) for pos in df_player['positions'].tolist() if pos is not None and len(pos) > 0]
+        if len(positions) < min_positions:
+            continue
+        x = [pos[0] for pos in positions]
+        y = [pos[1] for pos in positions]
+        vector, _, _ = np.histogram2d(x, y, bins=grid_size, range=[[0, 100], [0, 100]])
+        vector = vector.flatten()
+        if vector.sum() > 0:
+            features[int(player_id)] = vector / vector.sum()
+    return features
+
+def check_parity(table, chunk_rows=50_000):
+    import tempfile
+    import pyarrow.parquet as pq
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'events.parquet')
+        pq.write_table(table, path)
+        ids, features = build_heatmap_features(path, chunk_rows=chunk_rows)
+
+    reference = reference_features(table)
+    assert sorted(reference) == ids.tolist(), "different players"
+    expected = np.array([reference[pid] for pid in ids.tolist()])
+    np.testing.assert_allclose(features, expected, atol=1e-6)
+    return ids, features
+
+def benchmark(n_events, n_players, n_reference_events):
+    import tempfile
+    import pyarrow.parquet as pq
+
+    table = synthetic_wyscout_events(n_reference_events, n_players=min(n_players, 500))
+    check_parity(table)
+    start = time.perf_counter()
+    reference_features(table)
+    reference_seconds = time.perf_counter() - start
+    print(f"Parity OK on {n_reference_events:,} events; per-player loop {reference_seconds:.2f}s")
+
+    table = synthetic_wyscout_events(n_events, n_players=n_players)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'events.parquet')
+        pq.write_table(table, path)
+        del table
+        start = time.perf_counter()
+        ids, features = build_heatmap_features(path)
+        seconds = time.perf_counter() - start
+    print(f"{n_events:,} events, {len(ids):,} players: {seconds:.2f}s ({n_events / seconds / 1e6:.1f}M events/s)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build per-player spatial density features from the Wyscout events')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='stream the events and write the feature arrays')
+    build.add_argument('--events', default=DEFAULT_EVENTS_PATH)
+    build.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    build.add_argument('--grid', type=int, nargs=2, default=list(GRID_SIZE), metavar=('X_BINS', 'Y_BINS'))
+    build.add_argument('--include-events', nargs='+', default=INCLUDE_EVENTS)
+    build.add_argument('--min-positions', type=int, default=MIN_POSITIONS)
+    build.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    build.add_argument('--json', help='also export the notebook JSON layout to this path')
+    convert = subparsers.add_parser('convert', help='convert the JSON export into the binary arrays')
+    convert.add_argument('--json', default=os.path.join(DEFAULT_OUTPUT_DIR, JSON_FILE))
+    convert.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    bench = subparsers.add_parser('benchmark', help='check against the notebook loop and time the builder')
+    bench.add_argument('--events', type=int, default=5_000_000)
+    bench.add_argument('--players', type=int, default=5000)
+    bench.add_argument('--reference-events', type=int, default=100_000)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        ids, features = build_heatmap_features(args.events, args.include_events, tuple(args.grid),
+                                               min_positions=args.min_positions, chunk_rows=args.chunk_rows)
+        save_features(ids, features, args.output_dir, grid=args.grid, include_events=args.include_events,
+                      min_positions=args.min_positions)
+        if args.json:
+            export_json(ids, features, args.json)
+        print(f"Built {len(ids)} heatmap feature vectors in {time.perf_counter() - start:.2f}s into {args.output_dir}")
+    elif args.command == 'convert':
+        features = convert_json(args.json, args.output_dir)
+        print(f"Converted {len(features)} heatmap feature vectors from {args.json} into {args.output_dir}")
+    else:
+        benchmark(args.events, args.players, args.reference_events)
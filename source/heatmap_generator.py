@@ -1,69 +1,251 @@
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')  # Required for headless environments
-from mplsoccer import Pitch
-import numpy as np
 import io
+import os
 import base64
-from matplotlib.colors import LinearSegmentedColormap
+import threading
 
-def generate_heatmap(density_data, player_name, display_in_notebook = False):
-    """
-    Generate a football pitch heatmap from density data using transposed orientation
-    """
-    # Reshape and transpose the data
-    heatmap_data = np.array(density_data).reshape(10, 10).T
-    
-    # Create white-to-blue colormap
-    colors = ['white', 'lightblue', 'blue', 'darkblue']
-    cmap = LinearSegmentedColormap.from_list('white_to_blue', colors, N=256)
-    
+import numpy as np
+
+# matplotlib, mplsoccer and PIL are imported on first render (see _plotting),
+# so processes that only need RENDER_SETTINGS or heatmap keys never load them
+
+# Everything that changes the rendered pixels. Cached images are keyed on these
+# settings, so bump 'version' whenever the drawing code changes.
+# 'renderer' picks between drawing a fresh figure per heatmap ('legacy') and
+# reusing one pitch figure per process ('fast'); both produce the same pixels
+# (`python -m source.heatmap_generator compare` checks it on real densities).
+RENDER_SETTINGS = {
+    'version': 2,
+    'renderer': os.environ.get('HEATMAP_RENDERER', 'fast'),
+    'grid': [10, 10],
+    'colors': ['white', 'lightblue', 'blue', 'darkblue'],
+    'levels': 100,
+    'alpha': 0.5,
+    'figsize': [10, 6],
+    'dpi': 100,
+}
+
+_PLOTTING = None
+
+def _plotting():
+    """The plotting stack and colour map, imported and built once per process on first use"""
+    global _PLOTTING
+    if _PLOTTING is None:
+        import matplotlib
+        matplotlib.use('Agg')  # Required for headless environments
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import LinearSegmentedColormap
+        from mplsoccer import Pitch
+
+        cmap = LinearSegmentedColormap.from_list('white_to_blue', RENDER_SETTINGS['colors'], N=256)
+        _PLOTTING = {'plt': plt, 'Pitch': Pitch, 'cmap': cmap}
+    return _PLOTTING
+
+def _make_pitch():
     # Create pitch with white background and black lines
-    from mplsoccer import Pitch
-    pitch = Pitch(
-        pitch_type='wyscout', 
-        corner_arcs=True, 
+    return _plotting()['Pitch'](
+        pitch_type='wyscout',
+        corner_arcs=True,
         pitch_color='white',
         line_color='black',
         linewidth=1.5
     )
-    fig, ax = pitch.draw(figsize=(10, 6))
-    
+
+def _draw_heatmap(density_data):
+    """
+    Draw the transposed density grid onto a wyscout pitch and return the figure
+    """
+    # Reshape and transpose the data
+    heatmap_data = np.array(density_data).reshape(*RENDER_SETTINGS['grid']).T
+
+    fig, ax = _make_pitch().draw(figsize=tuple(RENDER_SETTINGS['figsize']))
+
     # Set figure background to white
     fig.patch.set_facecolor('white')
-    
+
     # Create coordinates and plot heatmap
-    x_coords = np.linspace(0, 100, 10)
-    y_coords = np.linspace(0, 100, 10)
+    x_coords = np.linspace(0, 100, RENDER_SETTINGS['grid'][1])
+    y_coords = np.linspace(0, 100, RENDER_SETTINGS['grid'][0])
     X, Y = np.meshgrid(x_coords, y_coords)
-    
-    ax.contourf(X, Y, heatmap_data, levels=100, cmap=cmap, alpha=0.5)
-    
-    # Display in notebook if requested
-    if display_in_notebook:
-        plt.show()
-    
-    # Convert to base64 with white background
+
+    ax.contourf(X, Y, heatmap_data, levels=RENDER_SETTINGS['levels'], cmap=_plotting()['cmap'], alpha=RENDER_SETTINGS['alpha'])
+
+    return fig
+
+def _figure_to_png(fig):
+    """Rasterise a figure to PNG bytes with a white background and close it"""
     buffer = io.BytesIO()
-    plt.savefig(
-        buffer, 
-        format='png', 
-        bbox_inches='tight', 
-        dpi=100, 
+    fig.savefig(
+        buffer,
+        format='png',
+        bbox_inches='tight',
+        dpi=RENDER_SETTINGS['dpi'],
         facecolor='white',
         edgecolor='none',
         transparent=False
     )
-    buffer.seek(0)
-    image_base64 = base64.b64encode(buffer.getvalue()).decode()
-    plt.close(fig)
-    
+    _plotting()['plt'].close(fig)
+    return buffer.getvalue()
+
+# -----------------------------
+# Fast path: one cached pitch figure per process
+# -----------------------------
+_PITCH_BACKGROUND = None
+_FIGURE_LOCK = threading.Lock()  # the cached figure is drawn by one thread at a time
+
+def _pitch_background():
+    """
+    Draw the pitch once per process and keep the figure, its axes, the
+    contour grid and the crop that savefig(bbox_inches='tight') would pick.
+    The tight box depends only on the pitch (the contours stay inside the
+    axes), so it is measured once, with a probe contour drawn as in
+    _draw_heatmap.
+    """
+    global _PITCH_BACKGROUND
+    if _PITCH_BACKGROUND is not None:
+        return _PITCH_BACKGROUND
+
+    n_rows, n_cols = RENDER_SETTINGS['grid']
+    fig, ax = _make_pitch().draw(figsize=tuple(RENDER_SETTINGS['figsize']))
+    fig.patch.set_facecolor('white')
+    x_coords = np.linspace(0, 100, n_cols)
+    y_coords = np.linspace(0, 100, n_rows)
+    X, Y = np.meshgrid(x_coords, y_coords)
+
+    probe = ax.contourf(X, Y, np.arange(n_rows * n_cols, dtype=float).reshape(n_cols, n_rows),
+                        levels=RENDER_SETTINGS['levels'], cmap=_plotting()['cmap'], alpha=RENDER_SETTINGS['alpha'])
+    fig.canvas.draw()
+    bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(0.1)
+    probe.remove()
+
+    dpi = RENDER_SETTINGS['dpi']
+    _PITCH_BACKGROUND = {
+        'fig': fig, 'ax': ax, 'X': X, 'Y': Y, 'bbox': bbox,
+        'shape': (int(round(bbox.height * dpi)), int(round(bbox.width * dpi)), 4),
+    }
+    return _PITCH_BACKGROUND
+
+def render_heatmaps_fast(density_batch):
+    """
+    Render N density vectors on the cached pitch figure.
+
+    Each contour is drawn and rasterised exactly as the legacy path draws
+    it, including the sub-pixel shift of the tight crop, so the pixels are
+    identical. Only the pitch setup, the tight-box measurement and the PNG
+    encoding are saved. Returns a uint8 RGBA array of shape (N, H, W, 4).
+    """
+    with _FIGURE_LOCK:
+        layer = _pitch_background()
+        fig, ax = layer['fig'], layer['ax']
+        images = np.empty((len(density_batch),) + layer['shape'], dtype=np.uint8)
+        for i, density in enumerate(density_batch):
+            # Same orientation as the contour path: reshape, then transpose so rows follow y
+            heatmap_data = np.array(density).reshape(*RENDER_SETTINGS['grid']).T
+            contours = ax.contourf(layer['X'], layer['Y'], heatmap_data, levels=RENDER_SETTINGS['levels'],
+                                   cmap=_plotting()['cmap'], alpha=RENDER_SETTINGS['alpha'])
+            buffer = io.BytesIO()
+            try:
+                fig.savefig(buffer, format='raw', bbox_inches=layer['bbox'], dpi=RENDER_SETTINGS['dpi'],
+                            facecolor='white', edgecolor='none', transparent=False)
+            finally:
+                contours.remove()
+            images[i] = np.frombuffer(buffer.getbuffer(), dtype=np.uint8).reshape(layer['shape'])
+    return images
+
+def _rgba_to_png(rgba):
+    from PIL import Image
+
+    # The figure is saved on white, so drop alpha and favour speed over size
+    buffer = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(rgba[..., :3]), 'RGB').save(buffer, format='png', compress_level=1)
+    return buffer.getvalue()
+
+def render_heatmaps_png(density_batch, renderer=None):
+    """Render many density vectors to PNG bytes, batching the fast path"""
+    renderer = renderer or RENDER_SETTINGS['renderer']
+    if renderer == 'legacy':
+        return [_figure_to_png(_draw_heatmap(density)) for density in density_batch]
+    if renderer != 'fast':
+        raise ValueError(f"Unknown heatmap renderer: {renderer}")
+    return [_rgba_to_png(image) for image in render_heatmaps_fast(density_batch)]
+
+def render_heatmap_png(density_data, renderer=None):
+    """
+    Render the pitch heatmap for a density vector and return the raw PNG bytes
+    """
+    return render_heatmaps_png([density_data], renderer)[0]
+
+def generate_heatmap(density_data, player_name, display_in_notebook = False):
+    """
+    Generate a football pitch heatmap from density data using transposed orientation
+    """
+    # Display in notebook if requested
+    if display_in_notebook:
+        fig = _draw_heatmap(density_data)
+        _plotting()['plt'].show()
+        png = _figure_to_png(fig)
+    else:
+        png = render_heatmap_png(density_data)
+
+    # Convert to base64 with white background
+    image_base64 = base64.b64encode(png).decode()
+
     image_url = f"data:image/png;base64,{image_base64}"
-    
+
     # Also display as HTML in notebook if requested
     if display_in_notebook:
         from IPython.display import HTML, display
         html_code = f'<img src="{image_url}" alt="Heatmap" style="max-width: 600px; border: 1px solid #ccc; background: white;">'
         display(HTML(html_code))
-    
+
     return image_url
+
+# -----------------------------
+# Renderer parity check
+# -----------------------------
+MAX_PIXEL_DIFF = 0  # largest per-channel difference allowed, out of 255: the paths must match exactly
+
+def _png_pixels(png):
+    from PIL import Image
+
+    return np.asarray(Image.open(io.BytesIO(png)).convert('RGB'), dtype=np.int16)
+
+def compare_renderers(densities):
+    """
+    Render each density vector with both paths and return a list of
+    (mean, max) per-channel pixel differences of the fast image from the
+    legacy one
+    """
+    fast = render_heatmaps_png(densities, 'fast')
+    diffs = []
+    for density, fast_png in zip(densities, fast):
+        legacy, candidate = _png_pixels(render_heatmap_png(density, 'legacy')), _png_pixels(fast_png)
+        if legacy.shape != candidate.shape:
+            diffs.append((255.0, 255))
+            continue
+        difference = np.abs(legacy - candidate)
+        diffs.append((float(difference.mean()), int(difference.max())))
+    return diffs
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+    from source.heatmap_features import load_heatmap_features
+
+    parser = argparse.ArgumentParser(description='Heatmap rendering tools')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compare = subparsers.add_parser('compare', help='check the fast renderer against the legacy contour images')
+    compare.add_argument('--features', default='data', help='heatmap features directory or JSON file')
+    compare.add_argument('--players', type=int, default=20, help='number of players to render')
+    compare.add_argument('--max-diff', type=int, default=MAX_PIXEL_DIFF)
+    args = parser.parse_args()
+
+    features = load_heatmap_features(args.features)
+    player_ids = list(features)[:args.players]
+    diffs = compare_renderers([features[pid] for pid in player_ids])
+    for pid, (mean, worst) in zip(player_ids, diffs):
+        print(f"player {pid}: mean {mean:.2f}/255, max {worst}/255")
+    failed = [pid for pid, (_, worst) in zip(player_ids, diffs) if worst > args.max_diff]
+    if failed:
+        print(f"FAIL: {len(failed)} of {len(player_ids)} renders differ by more than {args.max_diff}/255")
+        sys.exit(1)
+    print(f"OK: all {len(player_ids)} renders within {args.max_diff}/255")
@@ -0,0 +1,125 @@
+import os
+import glob
+import time
+import sqlite3
+import argparse
+import threading
+
+import pyarrow.parquet as pq
+
+from source.event_store import DEFAULT_EVENTS_DIR
+
+# Leading underscore keeps the manifest (and its WAL files) out of the
+# Parquet dataset scan in read_events
+MANIFEST_NAME = '_manifest.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    partition  TEXT NOT NULL UNIQUE,
+    n_events   INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS matches (
+    match_id  INTEGER PRIMARY KEY,
+    partition TEXT NOT NULL REFERENCES batches(partition)
+);
+"""
+
+class IngestLog:
+    """
+    Durable record of which matches have been ingested, and into which
+    partition of ``events_dir``.
+
+    A batch counts as ingested once its partition file has been atomically
+    renamed into place and its match ids committed here in one transaction.
+    A crash between the two leaves a complete partition with no manifest
+    rows; ``reconcile`` adopts it on the next start, so its matches are not
+    fetched again.
+    """
+
+    def __init__(self, events_dir=DEFAULT_EVENTS_DIR):
+        os.makedirs(events_dir, exist_ok=True)
+        self.events_dir = events_dir
+        self.path = os.path.join(events_dir, MANIFEST_NAME)
+        # Batches are committed from the scheduler's writer thread
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=FULL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __contains__(self, match_id):
+        with self.lock:
+            row = self.conn.execute('SELECT 1 FROM matches WHERE match_id = ?', (int(match_id),)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM matches').fetchone()[0]
+
+    def unprocessed(self, match_ids):
+        """The ids in ``match_ids`` that have not been ingested, in their original order"""
+        match_ids = [int(match_id) for match_id in match_ids]
+        with self.lock:
+            self.conn.execute('CREATE TEMP TABLE IF NOT EXISTS candidates (match_id INTEGER PRIMARY KEY)')
+            self.conn.execute('DELETE FROM candidates')
+            self.conn.executemany('INSERT OR IGNORE INTO candidates VALUES (?)', ((m,) for m in match_ids))
+            done = {row[0] for row in self.conn.execute(
+                'SELECT match_id FROM candidates JOIN matches USING (match_id)')}
+        return [match_id for match_id in match_ids if match_id not in done]
+
+    def commit_batch(self, partition, match_ids, n_events):
+        """Record a written partition and the matches it holds, atomically"""
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.conn.execute('INSERT OR IGNORE INTO batches (partition, n_events, created_at) VALUES (?, ?, ?)',
+                                  (partition, int(n_events), time.time()))
+                self.conn.executemany('INSERT OR REPLACE INTO matches VALUES (?, ?)',
+                                      ((int(match_id), partition) for match_id in match_ids))
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def partitions(self, after=0):
+        """``(seq, partition)`` for every committed batch with seq > ``after``, in commit order"""
+        with self.lock:
+            return self.conn.execute('SELECT seq, partition FROM batches WHERE seq > ? ORDER BY seq', (after,)).fetchall()
+
+    def partition_path(self, partition):
+        return os.path.join(self.events_dir, f"{partition}.parquet")
+
+    def reconcile(self):
+        """
+        Bring the manifest in line with the files on disk after a crash:
+        delete half-written temp files and adopt complete partitions that
+        were never committed. Returns the adopted partition names.
+        """
+        for tmp_path in glob.glob(os.path.join(self.events_dir, '.*.tmp')):
+            os.remove(tmp_path)
+
+        with self.lock:
+            known = {row[0] for row in self.conn.execute('SELECT partition FROM batches')}
+
+        adopted = []
+        for path in sorted(glob.glob(os.path.join(self.events_dir, '*.parquet'))):
+            partition = os.path.basename(path)[:-len('.parquet')]
+            if partition in known:
+                continue
+            match_ids = pq.read_table(path, columns=['match_id']).column('match_id').unique().to_pylist()
+            self.commit_batch(partition, [m for m in match_ids if m is not None], pq.ParquetFile(path).metadata.num_rows)
+            adopted.append(partition)
+        return adopted
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reconcile and summarise the ingestion manifest')
+    parser.add_argument('--events-dir', default=DEFAULT_EVENTS_DIR)
+    args = parser.parse_args()
+    log = IngestLog(args.events_dir)
+    adopted = log.reconcile()
+    print(f"{len(log)} matches in {len(log.partitions())} partitions in {args.events_dir} ({len(adopted)} adopted)")
@@ -0,0 +1,190 @@
+import re
+import time
+import bisect
+import argparse
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from source.neighbour_table import _summary
+from source.player_store import serialise
+
+MIN_QUERY_LENGTH = 2
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# Share of the query's trigrams a name must contain to be a typo match
+FUZZY_MIN_SCORE = 0.5
+
+# Letters NFKD does not decompose into a base letter and an accent
+_FOLD_TABLE = str.maketrans({'ø': 'o', 'ł': 'l', 'đ': 'd', 'ð': 'd', 'ı': 'i', 'ß': 'ss', 'æ': 'ae', 'œ': 'oe', 'þ': 'th'})
+_SEPARATORS = re.compile(r'[\W_]+')
+_END = chr(0x10FFFF)
+
+def fold(name):
+    """Lower-case, strip accents and collapse punctuation and spaces: 'Ødegaard, M.' -> 'odegaard m'"""
+    text = unicodedata.normalize('NFKD', str(name))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower().translate(_FOLD_TABLE)
+    return ' '.join(_SEPARATORS.sub(' ', text).split())
+
+def _trigrams(folded):
+    grams = set()
+    for token in folded.split():
+        padded = f" {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def _prefix_range(keys, prefix):
+    return bisect.bisect_left(keys, prefix), bisect.bisect_left(keys, prefix + _END)
+
+class NameIndex:
+    """
+    Player-name search over accent-folded, lower-cased names.
+
+    Two sorted key arrays answer prefix queries with a binary search each:
+    whole folded names, and every name token with its row. A query matches
+    a player when each of its tokens prefixes one of the player's tokens;
+    players whose whole name starts with the query come first, and ties go
+    to ``rank`` (market value, highest first). When nothing matches, a
+    trigram index scores names by the share of the query's trigrams they
+    contain, which tolerates typos.
+    """
+
+    def __init__(self, ids, names, summaries, rank):
+        self.ids       = np.asarray(ids, dtype=np.int64)
+        self.summaries = summaries
+        self.rank      = np.asarray(rank, dtype=np.int64)
+        self.folded    = [fold(name) for name in names]
+        self.tokens    = [folded.split() for folded in self.folded]
+
+        order = sorted(range(len(self.folded)), key=self.folded.__getitem__)
+        self.full_keys = [self.folded[row] for row in order]
+        self.full_rows = np.array(order, dtype=np.int64)
+
+        pairs = sorted((token, row) for row, tokens in enumerate(self.tokens) for token in tokens)
+        self.token_keys = [token for token, _ in pairs]
+        self.token_rows = np.array([row for _, row in pairs], dtype=np.int64)
+
+        postings = {}
+        for row, folded in enumerate(self.folded):
+            for gram in _trigrams(folded):
+                postings.setdefault(gram, []).append(row)
+        self.trigrams = {gram: np.array(rows, dtype=np.int64) for gram, rows in postings.items()}
+
+    @classmethod
+    def from_frame(cls, df):
+        """Index the ``full_name`` of every player in a final_player_df frame"""
+        df = df.drop_duplicates(subset='id', keep='first')
+        df = df[df['full_name'].notna()]
+        records = df.to_dict('records')
+        ids = [int(record['id']) for record in records]
+        names = [str(record['full_name']) for record in records]
+
+        value = pd.to_numeric(df['market_value_in_eur'], errors='coerce').fillna(0).to_numpy() if 'market_value_in_eur' in df else np.zeros(len(df))
+        order = np.lexsort((np.array([fold(name) for name in names], dtype=object), -value))
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+
+        summaries = [serialise(_summary(pid, record)) for pid, record in zip(ids, records)]
+        return cls(ids, names, summaries, rank)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _best(self, rows, limit):
+        """Up to ``limit`` distinct rows, best rank first"""
+        if len(rows) > 4 * limit:
+            rows = rows[np.argpartition(self.rank[rows], 4 * limit)[:4 * limit]]
+        rows = rows[np.argsort(self.rank[rows], kind='stable')]
+        return list(dict.fromkeys(rows.tolist()))[:limit]
+
+    def _token_matches(self, tokens):
+        ranges = sorted((_prefix_range(self.token_keys, token) for token in tokens), key=lambda r: r[1] - r[0])
+        lo, hi = ranges[0]
+        rows = self.token_rows[lo:hi]
+        for lo, hi in ranges[1:]:
+            # Scatter the other token's rows into a mask rather than sorting both sides
+            mask = np.zeros(len(self.ids), dtype=bool)
+            mask[self.token_rows[lo:hi]] = True
+            rows = rows[mask[rows]]
+        return rows
+
+    def _fuzzy(self, folded, limit):
+        grams = _trigrams(folded)
+        postings = [self.trigrams[gram] for gram in grams if gram in self.trigrams]
+        if not postings:
+            return []
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.ids))
+        rows = np.flatnonzero(shared >= FUZZY_MIN_SCORE * len(grams))
+        # Most shared trigrams first, then rank
+        rows = rows[np.lexsort((self.rank[rows], -shared[rows]))]
+        return rows[:limit].tolist()
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Matching row offsets, best first, and whether the typo fallback produced them"""
+        folded = fold(query)
+        if len(folded) < MIN_QUERY_LENGTH:
+            return [], False
+
+        lo, hi = _prefix_range(self.full_keys, folded)
+        whole = self._best(self.full_rows[lo:hi], limit)
+        exact = [row for row in whole if self.folded[row] == folded]
+        rows = list(dict.fromkeys(exact + whole))
+        if len(rows) < limit:
+            rows = list(dict.fromkeys(rows + self._best(self._token_matches(folded.split()), limit)))[:limit]
+        if rows:
+            return rows, False
+        return self._fuzzy(folded, limit), True
+
+    def search_json(self, query, limit=DEFAULT_LIMIT):
+        """Serialised ``{"fuzzy": ..., "results": [summary, ...]}`` for a query"""
+        rows, fuzzy = self.search(query, limit)
+        return (b'{"fuzzy":' + (b'true' if fuzzy else b'false') +
+                b',"results":[' + b','.join(self.summaries[row] for row in rows) + b']}')
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+_SYLLABLES = ['an', 'dré', 'ma', 'ri', 'o', 'lu', 'ka', 'sé', 'mü', 'ller', 'ø', 'de', 'gaard', 'ço', 'is', 'ta',
+              'ne', 'vić', 'ez', 'sán', 'chez', 'ber', 'to', 'li', 'ni', 'ham', 'son', 'ki', 'mi', 'ch']
+
+def synthetic_names(n, seed=7):
+    rng = np.random.default_rng(seed)
+    def word():
+        return ''.join(_SYLLABLES[i] for i in rng.integers(len(_SYLLABLES), size=rng.integers(2, 5))).capitalize()
+    return [f"{word()} {word()}" if rng.random() < 0.8 else f"{word()} {word()} {word()}" for _ in range(n)]
+
+def benchmark(n_names, n_queries=2000, seed=7):
+    names = synthetic_names(n_names, seed)
+    rng = np.random.default_rng(seed + 1)
+    df = pd.DataFrame({'id': np.arange(n_names), 'full_name': names, 'club': 'club', 'role': 'CM',
+                       'market_value_in_eur': rng.integers(0, 10**8, n_names)})
+
+    start = time.perf_counter()
+    index = NameIndex.from_frame(df)
+    print(f"Indexed {n_names:,} names in {time.perf_counter() - start:.2f}s")
+
+    picks = rng.integers(n_names, size=n_queries)
+    prefixes = [fold(names[i])[:int(rng.integers(2, 8))] for i in picks]
+    typos = []
+    for i in picks:
+        folded = fold(names[i])
+        at = int(rng.integers(1, len(folded) - 1))
+        typos.append(folded[:at] + 'x' + folded[at + 1:])
+
+    for label, queries in (('prefix', prefixes), ('typo', typos)):
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search_json(query)
+            timings.append(time.perf_counter() - start)
+        timings = np.array(timings) * 1000
+        print(f"{label:>6}: p50 {np.percentile(timings, 50):.3f}ms, p99 {np.percentile(timings, 99):.3f}ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time /search lookups on synthetic player names')
+    parser.add_argument('--names', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+    benchmark(args.names, args.queries)
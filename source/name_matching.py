@@ -0,0 +1,338 @@
+import os
+import json
+import time
+import zlib
+import argparse
+from difflib import SequenceMatcher
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from source.name_index import _trigrams, fold, synthetic_names
+
+DEFAULT_OUTPUT = 'data/player_data/mapping.csv'
+
+# Weights of the name, birth date and club similarity in a pair's score
+WEIGHTS = {'name': 0.75, 'birth_date': 0.15, 'club': 0.10}
+MIN_SCORE = 0.6
+
+# Name score given to 'm salah' against 'mohamed salah': same surname, same first initial
+INITIAL_SCORE = 0.85
+
+# MinHash LSH over name trigrams: names share a bucket when one band of
+# BAND_ROWS hash minima agrees. With 16 bands of 4, a pair with trigram
+# Jaccard 0.6 becomes a candidate 89% of the time, and one with 0.1 under 0.2%.
+N_BANDS = 16
+BAND_ROWS = 4
+_PRIME = (1 << 31) - 1
+_HASH_A, _HASH_B = (np.random.default_rng(0).integers(1, _PRIME, size=N_BANDS * BAND_ROWS, dtype=np.uint64)
+                    for _ in range(2))
+
+# Blocks bigger than this (a very common birth year and initial, say) are not expanded
+MAX_BLOCK = 1000
+
+# Candidates kept per left record for the one-to-one assignment
+KEEP_PER_RECORD = 3
+
+MAPPING_COLUMNS = ['WyScoutID', 'TMarketID', 'name_score', 'birth_date_match', 'club_score', 'score']
+
+# -----------------------------
+# Normalisation and blocking keys
+# -----------------------------
+def _minhash(grams):
+    """Signature of a trigram set: the minimum of each of the N_BANDS * BAND_ROWS hash functions"""
+    hashes = np.array([zlib.crc32(gram.encode()) for gram in grams], dtype=np.uint64)
+    return ((_HASH_A[:, None] * hashes[None, :] + _HASH_B[:, None]) % _PRIME).min(axis=1)
+
+def _dice(a, b):
+    return 2 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+def _date(value):
+    """'YYYY-MM-DD' from either source's birth date, or None"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    value = str(value)[:10]
+    return value if len(value) == 10 else None
+
+class PlayerRecords:
+    """
+    One side of the join, normalised once: folded names with their tokens
+    and trigrams, birth dates, folded club names and the blocking keys of
+    every record.
+    """
+
+    def __init__(self, ids, names, birth_dates, clubs):
+        self.ids         = np.asarray(ids, dtype=np.int64)
+        self.names       = [fold(name) if isinstance(name, str) else '' for name in names]
+        self.tokens      = [name.split() for name in self.names]
+        self.grams       = [_trigrams(name) for name in self.names]
+        self.birth_dates = [_date(value) for value in birth_dates]
+        self.clubs       = [fold(club) if isinstance(club, str) else '' for club in clubs]
+        self.club_grams  = [_trigrams(club) for club in self.clubs]
+
+    @classmethod
+    def from_frame(cls, df):
+        """From a frame with id, name, birth_date and club columns"""
+        return cls(df['id'], df['name'], df['birth_date'], df['club'] if 'club' in df else [None] * len(df))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def keys(self, row):
+        """Blocking keys of one record: birth date, surname initial by birth year, club by surname initial, LSH bands"""
+        tokens, birth_date, club = self.tokens[row], self.birth_dates[row], self.clubs[row]
+        if not tokens:
+            return []
+        initial = tokens[-1][0]
+        keys = []
+        if birth_date:
+            keys.append(('dob', birth_date))
+            keys.append(('year', birth_date[:4], initial))
+        if club:
+            keys.append(('club', club, initial))
+        signature = _minhash(self.grams[row])
+        keys.extend(('lsh', band, signature[band * BAND_ROWS:(band + 1) * BAND_ROWS].tobytes()) for band in range(N_BANDS))
+        return keys
+
+class BlockIndex:
+    """Blocking keys of the right-hand records, each mapped to the rows that carry it"""
+
+    def __init__(self, records):
+        self.records = records
+        blocks = {}
+        for row in range(len(records)):
+            for key in records.keys(row):
+                blocks.setdefault(key, []).append(row)
+        self.blocks = {key: rows for key, rows in blocks.items() if len(rows) <= MAX_BLOCK}
+
+    def candidates(self, keys):
+        rows = set()
+        for key in keys:
+            rows.update(self.blocks.get(key, ()))
+        return rows
+
+# -----------------------------
+# Scoring
+# -----------------------------
+def name_score(left, right, i, j):
+    """Trigram Dice of two folded names, raised to INITIAL_SCORE for an initial plus matching surname"""
+    score = _dice(left.grams[i], right.grams[j])
+    a, b = left.tokens[i], right.tokens[j]
+    if score < INITIAL_SCORE and len(a) > 1 and len(b) > 1 and a[-1] == b[-1] and a[0][0] == b[0][0]:
+        return INITIAL_SCORE
+    return score
+
+def score_pair(left, right, i, j):
+    """(name_score, birth_date_match, club_score, score) of left row i against right row j"""
+    name = name_score(left, right, i, j)
+    birth_date = float(left.birth_dates[i] is not None and left.birth_dates[i] == right.birth_dates[j])
+    club = _dice(left.club_grams[i], right.club_grams[j])
+    score = WEIGHTS['name'] * name + WEIGHTS['birth_date'] * birth_date + WEIGHTS['club'] * club
+    return name, birth_date, club, score
+
+def _match_rows(left, index, rows, min_score):
+    """Best few candidates of each of ``rows`` as (score, i, j, name, birth_date, club) tuples"""
+    found = []
+    for i in rows:
+        scored = []
+        for j in index.candidates(left.keys(i)):
+            name, birth_date, club, score = score_pair(left, index.records, i, j)
+            if score >= min_score:
+                scored.append((score, i, j, name, birth_date, club))
+        scored.sort(reverse=True)
+        found.extend(scored[:KEEP_PER_RECORD])
+    return found
+
+# Worker processes receive the left records and the block index once, through the initializer
+_worker = {}
+
+def _init_worker(left, index, min_score):
+    _worker.update(left=left, index=index, min_score=min_score)
+
+def _match_chunk(rows):
+    return _match_rows(_worker['left'], _worker['index'], rows, _worker['min_score'])
+
+def match_players(left_df, right_df, workers=None, min_score=MIN_SCORE, chunk_size=2000):
+    """
+    One-to-one mapping of ``left_df`` records to ``right_df`` records (both
+    with id, name, birth_date and club columns), best score first.
+
+    Each side is normalised once. The right side is indexed by blocking key,
+    and every left record is scored only against the right records that
+    share a key with it. Chunks of left records are scored in a process
+    pool when ``workers`` is more than one (all CPUs when None).
+    """
+    left, right = PlayerRecords.from_frame(left_df), PlayerRecords.from_frame(right_df)
+    index = BlockIndex(right)
+    chunks = [range(start, min(start + chunk_size, len(left))) for start in range(0, len(left), chunk_size)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(left, index, min_score)) as pool:
+            found = [pair for chunk in pool.map(_match_chunk, chunks) for pair in chunk]
+    else:
+        found = _match_rows(left, index, range(len(left)), min_score)
+
+    # Greedy one-to-one: the best remaining pair wins, ties to the lower row
+    found.sort(key=lambda pair: (-pair[0], pair[1], pair[2]))
+    used_left, used_right, mapping = set(), set(), []
+    for score, i, j, name, birth_date, club in found:
+        if i in used_left or j in used_right:
+            continue
+        used_left.add(i)
+        used_right.add(j)
+        mapping.append((left.ids[i], right.ids[j], round(name, 4), birth_date, round(club, 4), round(score, 4)))
+    return pd.DataFrame(mapping, columns=MAPPING_COLUMNS)
+
+def save_mapping(mapping, path=DEFAULT_OUTPUT):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    mapping.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+# -----------------------------
+# Sources
+# -----------------------------
+def _decode_unicode(text):
+    # Wyscout names arrive with literal \uXXXX escapes
+    if not isinstance(text, str):
+        return text
+    try:
+        return bytes(text, 'utf-8').decode('unicode_escape')
+    except Exception:
+        return text
+
+def wyscout_players(players_path, teams_path=None):
+    """Wyscout players.json as id, name, birth_date and club (from teams.json when given)"""
+    with open(players_path, 'r') as f:
+        data = json.load(f)
+    clubs = {}
+    if teams_path:
+        with open(teams_path, 'r') as f:
+            clubs = {team.get('wyId'): _decode_unicode(team.get('officialName') or team.get('name')) for team in json.load(f)}
+    return pd.DataFrame([{
+        'id': player.get('wyId'),
+        'name': f"{_decode_unicode(player.get('firstName') or '')} {_decode_unicode(player.get('lastName') or '')}",
+        'birth_date': player.get('birthDate'),
+        'club': clubs.get(player.get('currentTeamId')),
+    } for player in data])
+
+def transfermarkt_players(players_path):
+    """Transfermarkt players.txt as id, name, birth_date and club"""
+    df = pd.read_csv(players_path, usecols=['player_id', 'name', 'date_of_birth', 'current_club_name'])
+    return df.rename(columns={'player_id': 'id', 'date_of_birth': 'birth_date', 'current_club_name': 'club'})
+
+# -----------------------------
+# Benchmark against pairwise SequenceMatcher
+# -----------------------------
+def _perturb(name, rng):
+    """How the same player tends to differ between the two sources"""
+    tokens = name.split()
+    roll = rng.random()
+    if roll < 0.2 and len(tokens) > 1:
+        tokens[0] = tokens[0][0] + '.'
+    elif roll < 0.4 and len(tokens) > 2:
+        tokens = tokens[:1] + tokens[2:]
+    elif roll < 0.6:
+        token = int(rng.integers(len(tokens)))
+        at = int(rng.integers(len(tokens[token])))
+        tokens[token] = tokens[token][:at] + tokens[token][at + 1:] if len(tokens[token]) > 3 else tokens[token]
+    return ' '.join(tokens)
+
+def synthetic_sources(n_players, n_distractors=None, seed=7):
+    """
+    Wyscout-like and Transfermarkt-like frames over the same ``n_players``
+    (plus ``n_distractors`` Transfermarkt-only players), and the true
+    WyScoutID -> TMarketID mapping. A tenth of the Transfermarkt birth dates
+    are missing or off by one day, and half the clubs are missing.
+    """
+    rng = np.random.default_rng(seed)
+    n_distractors = n_players if n_distractors is None else n_distractors
+    names = synthetic_names(n_players + n_distractors, seed)
+    birth_dates = pd.Timestamp('1980-01-01') + pd.to_timedelta(rng.integers(0, 365 * 20, size=len(names)), unit='D')
+    clubs = [f"{word} fc" for word in synthetic_names(200, seed + 1)]
+    club = [clubs[i] for i in rng.integers(len(clubs), size=len(names))]
+
+    wyscout = pd.DataFrame({'id': np.arange(n_players) + 1000, 'name': names[:n_players],
+                            'birth_date': birth_dates[:n_players].strftime('%Y-%m-%d'), 'club': club[:n_players]})
+
+    tm_dates = pd.Series(birth_dates.strftime('%Y-%m-%d 00:00:00'))
+    noisy = rng.random(len(names)) < 0.1
+    tm_dates[noisy] = [None if rng.random() < 0.5 else (date + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+                       for date in birth_dates[noisy]]
+    tm_ids = rng.permutation(len(names)) + 500_000
+    transfermarkt = pd.DataFrame({'id': tm_ids,
+                                  'name': [_perturb(name, rng) for name in names[:n_players]] + names[n_players:],
+                                  'birth_date': tm_dates,
+                                  'club': [c if rng.random() < 0.5 else None for c in club]})
+    truth = dict(zip(wyscout['id'], tm_ids[:n_players]))
+    return wyscout, transfermarkt.sample(frac=1, random_state=seed).reset_index(drop=True), truth
+
+def sequence_matcher_mapping(left_df, right_df, threshold=0.8):
+    """The notebook approach: SequenceMatcher ratio of every name pair, best match above ``threshold``"""
+    right_names = [fold(name) for name in right_df['name']]
+    right_ids = right_df['id'].to_numpy()
+    rows = []
+    for left_id, name in zip(left_df['id'], left_df['name']):
+        matcher = SequenceMatcher(None, '', fold(name))
+        best, best_ratio = None, threshold
+        for j, other in enumerate(right_names):
+            matcher.set_seq1(other)
+            if matcher.real_quick_ratio() >= best_ratio and matcher.quick_ratio() >= best_ratio:
+                ratio = matcher.ratio()
+                if ratio >= best_ratio:
+                    best, best_ratio = right_ids[j], ratio
+        if best is not None:
+            rows.append((left_id, best))
+    return pd.DataFrame(rows, columns=['WyScoutID', 'TMarketID'])
+
+def mapping_quality(mapping, truth):
+    """Precision and recall of a WyScoutID -> TMarketID mapping"""
+    correct = sum(truth.get(left) == right for left, right in zip(mapping['WyScoutID'], mapping['TMarketID']))
+    return correct / max(len(mapping), 1), correct / max(len(truth), 1)
+
+def benchmark(n_players, workers=None, baseline_limit=2000, seed=7):
+    wyscout, transfermarkt, truth = synthetic_sources(n_players, seed=seed)
+    print(f"{len(wyscout):,} Wyscout players against {len(transfermarkt):,} Transfermarkt players")
+
+    start = time.perf_counter()
+    mapping = match_players(wyscout, transfermarkt, workers)
+    seconds = time.perf_counter() - start
+    precision, recall = mapping_quality(mapping, truth)
+    print(f"  blocked:          {seconds:.2f}s, precision {precision:.3f}, recall {recall:.3f}")
+
+    # The pairwise baseline grows quadratically; time it on a sample and scale up
+    sample = wyscout.iloc[:min(baseline_limit, len(wyscout))]
+    start = time.perf_counter()
+    baseline = sequence_matcher_mapping(sample, transfermarkt)
+    seconds = time.perf_counter() - start
+    precision, recall = mapping_quality(baseline, {key: truth[key] for key in sample['id']})
+    scale = len(wyscout) / len(sample)
+    print(f"  SequenceMatcher:  {seconds * scale:.2f}s{' (extrapolated)' if scale > 1 else ''}, "
+          f"precision {precision:.3f}, recall {recall:.3f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Match Wyscout players to Transfermarkt players by name, birth date and club')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    match = subparsers.add_parser('match', help='write the WyScoutID -> TMarketID mapping')
+    match.add_argument('--wyscout', required=True, help='Wyscout players.json')
+    match.add_argument('--teams', help='Wyscout teams.json, for club names')
+    match.add_argument('--transfermarkt', required=True, help='Transfermarkt players.txt')
+    match.add_argument('--output', default=DEFAULT_OUTPUT)
+    match.add_argument('--min-score', type=float, default=MIN_SCORE)
+    bench = subparsers.add_parser('benchmark', help='compare with pairwise SequenceMatcher on synthetic players')
+    bench.add_argument('--players', type=int, default=20_000)
+    bench.add_argument('--baseline-limit', type=int, default=500, help='Wyscout players the baseline is timed on')
+    for sub in (match, bench):
+        sub.add_argument('--workers', type=int, default=None, help='processes (default: all CPUs)')
+    args = parser.parse_args()
+
+    if args.command == 'match':
+        start = time.perf_counter()
+        wyscout = wyscout_players(args.wyscout, args.teams)
+        mapping = match_players(wyscout, transfermarkt_players(args.transfermarkt), args.workers, args.min_score)
+        save_mapping(mapping, args.output)
+        print(f"Matched {len(mapping):,} of {len(wyscout):,} Wyscout players in {time.perf_counter() - start:.1f}s -> {args.output}")
+    else:
+        benchmark(args.players, args.workers, args.baseline_limit)
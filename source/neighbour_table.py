@@ -0,0 +1,104 @@
+import logging
+
+import numpy as np
+
+from source.player_store import serialise
+
+SUMMARY_DEFAULTS = {'full_name': 'Unknown', 'club': 'Unknown', 'role': 'Unknown', 'image_url': ''}
+
+logger = logging.getLogger('pocket_scout.neighbour_table')
+
+def parse_knn_ids(value, invalid=None):
+    """
+    Parse a ``top_knn_ids`` cell into a list of ints. The CSV export writes
+    NumPy reprs such as "[ 12 345 678]"; the parquet export writes lists.
+    Tokens that are not integers are skipped (and appended to ``invalid``
+    when given), so one malformed cell only shortens that player's list.
+    """
+    if isinstance(value, str):
+        tokens = value.strip('[] ').replace(',', ' ').split()
+    elif hasattr(value, '__iter__'):
+        tokens = value
+    else:
+        return []
+    ids = []
+    for token in tokens:
+        try:
+            ids.append(int(token))
+        except (TypeError, ValueError):
+            if invalid is not None:
+                invalid.append(token)
+    return ids
+
+def _summary(player_id, record):
+    summary = {'id': player_id}
+    for column, default in SUMMARY_DEFAULTS.items():
+        value = record.get(column)
+        summary[column] = default if value is None or value != value else str(value)
+    return summary
+
+class NeighbourTable:
+    """
+    Pre-parsed nearest-neighbour lists.
+
+    ``neighbours`` is an (n_players, k) int32 matrix of offsets into
+    ``summaries``, padded with -1 and already stripped of the player itself
+    and of ids that are not in the pool. ``summaries`` holds each player's
+    id, name, club, role and image as serialised JSON bytes, so a response is
+    one row slice and one bytes join.
+    """
+
+    def __init__(self, ids, neighbours, counts, summaries):
+        self.ids        = np.asarray(ids, dtype=np.int64)
+        self.offsets    = {int(pid): offset for offset, pid in enumerate(self.ids)}
+        self.neighbours = neighbours
+        self.counts     = counts
+        self.summaries  = summaries
+
+    @property
+    def k(self):
+        return self.neighbours.shape[1]
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build the table from a player DataFrame with ``id`` and ``top_knn_ids`` columns"""
+        df = df.drop_duplicates(subset='id', keep='first')
+        records = df.to_dict('records')
+        ids = [int(record['id']) for record in records]
+        offsets = {pid: offset for offset, pid in enumerate(ids)}
+
+        neighbour_lists, malformed = [], []
+        for pid, record in zip(ids, records):
+            invalid = []
+            knn_ids = parse_knn_ids(record.get('top_knn_ids'), invalid)
+            if invalid:
+                malformed.append(pid)
+            neighbour_lists.append([offsets[sid] for sid in knn_ids if sid != pid and sid in offsets])
+        if malformed:
+            logger.warning("Skipped non-integer top_knn_ids entries for %d players (e.g. %s)",
+                           len(malformed), malformed[:5])
+
+        k = max((len(row) for row in neighbour_lists), default=0)
+        neighbours = np.full((len(ids), k), -1, dtype=np.int32)
+        counts = np.zeros(len(ids), dtype=np.int32)
+        for offset, row in enumerate(neighbour_lists):
+            neighbours[offset, :len(row)] = row
+            counts[offset] = len(row)
+
+        summaries = [serialise(_summary(pid, record)) for pid, record in zip(ids, records)]
+        return cls(ids, neighbours, counts, summaries)
+
+    def __contains__(self, player_id):
+        return player_id in self.offsets
+
+    def neighbour_offsets(self, player_id, k=None):
+        offset = self.offsets[player_id]
+        count = self.counts[offset] if k is None else min(k, self.counts[offset])
+        return self.neighbours[offset, :count]
+
+    def neighbour_ids(self, player_id, k=None):
+        return self.ids[self.neighbour_offsets(player_id, k)].tolist()
+
+    def similar_json(self, player_id, k=None):
+        """Serialised ``[summary, ...]`` list of a player's neighbours"""
+        return b'[' + b','.join(self.summaries[o] for o in self.neighbour_offsets(player_id, k)) + b']'
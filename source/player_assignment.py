@@ -0,0 +1,222 @@
+import os
+import json
+
+import numpy as np
+
+from source.similarity import (DEFAULT_INDEX_DIR, SimilarityIndex, _attributes, _build_hnsw, build_feature_matrix,
+                               hnswlib, save_json, save_npy, transform_features)
+
+# Neighbours kept per player, as in the top_knn_ids column of notebook 4
+TOP_K = 10
+
+# Cluster count used when a full rebuild refits KMeans and no count is given
+N_CLUSTERS = 21
+SEED = 7
+
+MATCHING_FILE = 'matching.json'
+
+# A batch of new or updated players triggers a full rebuild when any of these
+# is exceeded:
+#   out_of_range      share of their scaled stats outside the fitted [0, 1] range
+#   centroid_distance their mean distance to the assigned centroid, relative
+#                     to the pool's at the last rebuild
+#   churn             players added or updated since the last rebuild,
+#                     relative to the pool size at that rebuild
+DRIFT_THRESHOLDS = {'out_of_range': 0.05, 'centroid_distance': 1.5, 'churn': 0.25}
+
+def _sq_distances(a, b):
+    """(len(a), len(b)) squared L2 distances"""
+    d = np.einsum('ij,ij->i', a, a)[:, None] - 2 * (a @ b.T) + np.einsum('ij,ij->i', b, b)[None, :]
+    return np.maximum(d, 0)
+
+def cluster_centroids(features, labels):
+    """Mean feature vector of each cluster. Returns (cluster_ids, centroids)."""
+    cluster_ids = np.unique(labels)
+    centroids = np.stack([features[labels == c].mean(axis=0) for c in cluster_ids]).astype(np.float32)
+    return cluster_ids, centroids
+
+def nearest_centroid(features, cluster_ids, centroids):
+    """Cluster label and distance to its centroid for each row of ``features``"""
+    d = _sq_distances(np.asarray(features, dtype=np.float32), centroids)
+    nearest = d.argmin(axis=1)
+    return cluster_ids[nearest], np.sqrt(d[np.arange(len(d)), nearest])
+
+def within_cluster_knn(features, labels, offsets, k=TOP_K):
+    """
+    Top-k nearest offsets within the same cluster for each of ``offsets``,
+    nearest first, excluding the player itself and padded with -1.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    knn = np.full((len(offsets), k), -1, dtype=np.int64)
+    for cluster in np.unique(labels[offsets]):
+        rows = np.flatnonzero(labels[offsets] == cluster)
+        members = np.flatnonzero(labels == cluster)
+        d = _sq_distances(features[offsets[rows]], features[members])
+        d[members[None, :] == offsets[rows][:, None]] = np.inf
+        n = min(k, len(members) - 1)
+        if n <= 0:
+            continue
+        top = np.argpartition(d, n - 1, axis=1)[:, :n]
+        top = np.take_along_axis(top, np.argsort(np.take_along_axis(d, top, axis=1), axis=1), axis=1)
+        knn[rows, :n] = members[top]
+    return knn
+
+class PlayerMatcher:
+    """
+    Cluster labels and within-cluster top-k neighbours for every player in a
+    SimilarityIndex, kept up to date one batch of players at a time.
+
+    New or updated players are projected through the index's persisted
+    FeaturePipeline, labelled with the nearest stored centroid and upserted into
+    the index. Neighbour lists are then refreshed only for players whose
+    neighbourhood can have changed: the changed players themselves, players
+    whose list held one of them, and players in the same cluster that a
+    changed player now beats.
+    """
+
+    def __init__(self, index, labels, knn, cluster_ids, centroids, state):
+        self.index       = index
+        self.labels      = labels
+        self.knn         = knn
+        self.cluster_ids = cluster_ids
+        self.centroids   = centroids
+        self.state       = state
+
+    @property
+    def pipeline(self):
+        return self.index.pipeline
+
+    @property
+    def k(self):
+        return self.knn.shape[1]
+
+    @classmethod
+    def fit(cls, players_df, heatmap_dict, n_clusters=None, k=TOP_K, with_hnsw=True):
+        """
+        Build from scratch. An existing ``cluster`` column (from notebook 4)
+        is kept as it is; without it, or when ``n_clusters`` is given, KMeans
+        is refitted on the feature matrix. Every neighbour list is recomputed
+        on the feature matrix either way: the notebook's top_knn_ids were
+        ranked in its UMAP projection, and ``refresh`` could never reproduce
+        them, so every later batch would rewrite most of them.
+        """
+        ids, features, pipeline = build_feature_matrix(players_df, heatmap_dict)
+        hnsw = _build_hnsw(features) if with_hnsw and hnswlib is not None else None
+        index = SimilarityIndex(ids, features, _attributes(players_df, ids), hnsw, pipeline)
+
+        rows = players_df.drop_duplicates(subset='id', keep='first').set_index('id').loc[ids]
+        if n_clusters is None and 'cluster' in rows and rows['cluster'].notna().all():
+            labels = rows['cluster'].to_numpy(dtype=np.int64)
+        else:
+            from sklearn.cluster import KMeans
+            labels = KMeans(n_clusters=n_clusters or N_CLUSTERS, random_state=SEED, n_init=10).fit_predict(features)
+        knn = within_cluster_knn(features, labels, np.arange(len(ids)), k)
+
+        cluster_ids, centroids = cluster_centroids(features, labels)
+        _, distances = nearest_centroid(features, cluster_ids, centroids)
+        state = {'pool_at_rebuild': len(ids), 'changed_since_rebuild': 0,
+                 'baseline_centroid_distance': float(distances.mean())}
+        return cls(index, labels, knn, cluster_ids, centroids, state)
+
+    # -----------------------------
+    # Incremental assignment
+    # -----------------------------
+    def drift(self, features, distances):
+        """Drift metrics (see DRIFT_THRESHOLDS) for a projected batch"""
+        stats = features[:, :self.pipeline.n_stats]
+        return {
+            'out_of_range': float(((stats < 0) | (stats > 1)).mean()) if stats.size else 0.0,
+            'centroid_distance': float(distances.mean() / self.state['baseline_centroid_distance']) if len(distances) else 0.0,
+            'churn': (self.state['changed_since_rebuild'] + len(features)) / self.state['pool_at_rebuild'],
+        }
+
+    def assign(self, players_df, heatmap_dict, thresholds=DRIFT_THRESHOLDS):
+        """
+        Add or update the players in ``players_df``. Returns a report with
+        the drift metrics and, unless the drift is above ``thresholds`` (in
+        which case nothing is changed and ``rebuild`` is True), the changed
+        player ids and the ids whose neighbour list now differs.
+        """
+        ids, features = transform_features(players_df, heatmap_dict, self.pipeline)
+        labels, distances = nearest_centroid(features, self.cluster_ids, self.centroids)
+
+        # A player whose features did not move keeps its cluster, which may
+        # come from the notebook rather than the nearest centroid
+        existing = np.array([self.index.offsets.get(int(pid), -1) for pid in ids], dtype=np.int64)
+        for row in np.flatnonzero(existing >= 0):
+            if np.array_equal(self.index.features[existing[row]], features[row]):
+                labels[row] = self.labels[existing[row]]
+        drift = self.drift(features, distances)
+        exceeded = sorted(name for name, value in drift.items() if value > thresholds.get(name, np.inf))
+        report = {'drift': drift, 'exceeded': exceeded, 'rebuild': bool(exceeded),
+                  'skipped': sorted(set(players_df['id'].astype(int)) - set(ids.tolist()))}
+        if exceeded or not len(ids):
+            report.update(changed=[], refreshed=[])
+            return report
+
+        n_old = len(self.index.ids)
+        offsets = self.index.upsert(ids, features, _attributes(players_df, ids))
+        n_new = len(self.index.ids) - n_old
+        self.labels = np.concatenate([self.labels, np.zeros(n_new, dtype=self.labels.dtype)])
+        self.labels[offsets] = labels
+        self.knn = np.concatenate([self.knn, np.full((n_new, self.k), -1, dtype=self.knn.dtype)])
+
+        before = self.knn.copy()
+        affected = self.refresh(offsets)
+        refreshed = affected[(self.knn[affected] != before[affected]).any(axis=1)]
+        self.state['changed_since_rebuild'] += len(ids)
+        report.update(changed=ids.tolist(), refreshed=self.index.ids[refreshed].tolist())
+        return report
+
+    def refresh(self, changed):
+        """Recompute the neighbour lists that ``changed`` offsets can affect. Returns the refreshed offsets."""
+        features = np.asarray(self.index.features)
+        changed = np.asarray(changed, dtype=np.int64)
+
+        # Lists that hold a changed player, whose distance has moved
+        affected = [changed, np.flatnonzero(np.isin(self.knn, changed).any(axis=1))]
+
+        # Players a changed player now beats: closer than their farthest listed neighbour
+        for cluster in np.unique(self.labels[changed]):
+            members = np.flatnonzero(self.labels == cluster)
+            knn = self.knn[members]
+            listed = knn >= 0
+            farthest = np.where(listed, np.linalg.norm(features[members, None, :] - features[np.maximum(knn, 0)], axis=2), 0).max(axis=1)
+            farthest[listed.sum(axis=1) < self.k] = np.inf
+            movers = changed[self.labels[changed] == cluster]
+            closer = np.sqrt(_sq_distances(features[members], features[movers])) < farthest[:, None]
+            affected.append(members[closer.any(axis=1)])
+
+        affected = np.unique(np.concatenate(affected))
+        self.knn[affected] = within_cluster_knn(features, self.labels, affected, self.k)
+        return affected
+
+    def neighbour_ids(self, offsets):
+        """top_knn_ids lists for ``offsets``"""
+        return [[int(self.index.ids[o]) for o in row if o >= 0] for row in self.knn[offsets]]
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+    def save(self, index_dir=DEFAULT_INDEX_DIR):
+        self.index.save(index_dir)
+        save_npy(os.path.join(index_dir, 'clusters.npy'), self.labels)
+        save_npy(os.path.join(index_dir, 'knn.npy'), self.knn)
+        save_npy(os.path.join(index_dir, 'centroids.npy'), self.centroids)
+        save_json(os.path.join(index_dir, MATCHING_FILE), {**self.state, 'k': self.k, 'cluster_ids': self.cluster_ids.tolist()})
+
+    @classmethod
+    def load(cls, index_dir=DEFAULT_INDEX_DIR):
+        with open(os.path.join(index_dir, MATCHING_FILE), 'r') as f:
+            state = json.load(f)
+        index = SimilarityIndex.load(index_dir)
+        labels = np.load(os.path.join(index_dir, 'clusters.npy'))
+        knn = np.load(os.path.join(index_dir, 'knn.npy'))
+        centroids = np.load(os.path.join(index_dir, 'centroids.npy'))
+        cluster_ids = np.asarray(state.pop('cluster_ids'), dtype=labels.dtype)
+        state.pop('k', None)
+        return cls(index, labels, knn, cluster_ids, centroids, state)
+
+    @staticmethod
+    def exists(index_dir=DEFAULT_INDEX_DIR):
+        return os.path.exists(os.path.join(index_dir, MATCHING_FILE))
@@ -0,0 +1,132 @@
+import json
+import math
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from source.feature_pipeline import STAT_COLUMNS
+
+# Columns that are served by other endpoints and never appear in a profile
+PROFILE_EXCLUDED_COLUMNS = ['id', 'top_knn_ids']
+
+# The parquet export writes timestamps, the CSV export writes US-style dates
+CONTRACT_DATE_FORMATS = ['%Y-%m-%d %H:%M:%S', '%m/%d/%Y %H:%M']
+
+def clean_nan_values(obj):
+    """Recursively replace NaN values with None"""
+    if isinstance(obj, dict):
+        return {k: clean_nan_values(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [clean_nan_values(v) for v in obj]
+    elif pd.isna(obj) or (isinstance(obj, float) and math.isnan(obj)):
+        return None
+    else:
+        return obj
+
+def format_contract_date(contract_date):
+    if not contract_date or contract_date == 'NaN':
+        return "Unknown"
+    for date_format in CONTRACT_DATE_FORMATS:
+        try:
+            return datetime.strptime(str(contract_date), date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return "Unknown"
+
+def format_market_value(market_value):
+    if not market_value or market_value == 'NaN':
+        return "Unknown"
+    try:
+        return "€{:,.0f}".format(float(market_value))
+    except (TypeError, ValueError):
+        return "Unknown"
+
+def build_profile(record, density_plot_url=None):
+    """Turn a raw player row into the dict served by /player/<id>"""
+    row = {k: v for k, v in record.items() if k not in PROFILE_EXCLUDED_COLUMNS}
+    row = clean_nan_values(row)
+    row['density_plot_url'] = density_plot_url
+    row['contract_expiration_date'] = format_contract_date(row.get('contract_expiration_date'))
+    row['market_value_in_eur'] = format_market_value(row.get('market_value_in_eur'))
+    return row
+
+def stat_values(df, columns=STAT_COLUMNS):
+    """(n_players, len(columns)) float matrix of the stat columns, '12.5%' strings parsed and gaps left as NaN"""
+    values = np.full((len(df), len(columns)), np.nan)
+    for j, col in enumerate(columns):
+        if col in df:
+            values[:, j] = pd.to_numeric(df[col].astype(str).str.rstrip('%'), errors='coerce')
+    return values
+
+def serialise(obj):
+    """Serialise exactly like Flask's jsonify does outside debug mode"""
+    return json.dumps(obj, sort_keys=True, separators=(',', ':')).encode()
+
+class PlayerStore:
+    """
+    Read-only, startup-built player profiles.
+
+    Player ids map to dense offsets into ``records``, which holds each profile
+    already cleaned, formatted and serialised to JSON bytes, so serving a
+    profile is one dict lookup and one list index. ``stats`` keeps the
+    numeric stat columns per offset for comparisons.
+    """
+
+    def __init__(self, ids, records, full_names, stats=None, stat_columns=STAT_COLUMNS):
+        self.ids          = np.asarray(ids, dtype=np.int64)
+        self.offsets      = {int(pid): offset for offset, pid in enumerate(self.ids)}
+        self.records      = records
+        self.full_names   = full_names
+        self.stat_columns = list(stat_columns)
+        self.stats        = np.full((len(records), len(self.stat_columns)), np.nan) if stats is None else stats
+
+    @classmethod
+    def from_frame(cls, df, heatmap_url=None):
+        """
+        Build the store from a player DataFrame with an ``id`` column.
+
+        ``heatmap_url`` maps a player id to its heatmap URL, or None when the
+        player has no spatial data.
+        """
+        df = df.drop_duplicates(subset='id', keep='first')
+
+        ids, records, full_names = [], [], []
+        for record in df.to_dict('records'):
+            player_id = int(record['id'])
+            profile = build_profile(record, heatmap_url(player_id) if heatmap_url else None)
+            ids.append(player_id)
+            records.append(serialise(profile))
+            full_names.append(profile.get('full_name'))
+
+        return cls(ids, records, full_names, stat_values(df))
+
+    @classmethod
+    def from_csv(cls, path, heatmap_url=None):
+        return cls.from_frame(pd.read_csv(path), heatmap_url)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, player_id):
+        return player_id in self.offsets
+
+    def get_json(self, player_id):
+        """Serialised profile bytes for a player id, or None"""
+        offset = self.offsets.get(player_id)
+        return None if offset is None else self.records[offset]
+
+    def get(self, player_id):
+        """Profile dict for a player id, or None"""
+        data = self.get_json(player_id)
+        return None if data is None else json.loads(data)
+
+    def many_json(self, player_ids):
+        """Serialised ``{"<id>": profile, ...}`` bytes for the ids in the store, in order"""
+        return b'{' + b','.join(b'"%d":' % pid + self.records[self.offsets[pid]]
+                                for pid in player_ids if pid in self.offsets) + b'}'
+
+    def stat_diff(self, player_a, player_b):
+        """Per stat column, player_b's value minus player_a's (None where either is missing)"""
+        diff = self.stats[self.offsets[player_b]] - self.stats[self.offsets[player_a]]
+        return {col: None if np.isnan(value) else round(float(value), 4) for col, value in zip(self.stat_columns, diff)}
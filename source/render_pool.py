@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from source import render_worker
+from source.heatmap_cache import heatmap_key
+from source.heatmap_generator import RENDER_SETTINGS, render_heatmap_png
+
+DEFAULT_WORKERS = 2
+DEFAULT_NICE = 10        # added to the workers' niceness, so JSON requests win the CPU
+DEFAULT_MAX_PENDING = 64 # distinct renders queued or running before new ones are refused
+DEFAULT_TIMEOUT = 10.0   # seconds a request waits for its render
+
+class RenderUnavailable(RuntimeError):
+    """The render queue is full, the render did not finish in time or its worker died; the client should retry"""
+
+def _worker_context():
+    """
+    Workers are forked by a forkserver that imports only render_worker, so
+    none is ever forked from the threaded server, including the replacements
+    started after a crash. Like spawn, each worker still re-runs a script
+    __main__; app.py hands its development server to `flask run` for that.
+    """
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload([render_worker.__name__])
+    return context
+
+class RenderPool:
+    """
+    Heatmap rendering in a pool of worker processes.
+
+    Each worker keeps its own matplotlib state and a pre-drawn pitch, so
+    renders never touch pyplot in the serving process and never hold its
+    GIL. Concurrent requests for the same image share one render, at most
+    ``max_pending`` distinct renders are queued before ``render`` raises
+    RenderUnavailable, and the workers run ``nice`` steps below the server.
+
+    ``workers=0`` renders inline, one at a time, for single-process use.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, nice=DEFAULT_NICE, max_pending=DEFAULT_MAX_PENDING,
+                 timeout=DEFAULT_TIMEOUT):
+        self.workers      = workers
+        self.nice         = nice
+        self.max_pending  = max_pending
+        self.timeout      = timeout
+        self.counts       = {'rendered': 0, 'coalesced': 0, 'rejected': 0, 'timeouts': 0, 'crashed': 0, 'restarts': 0}
+        self._inflight    = {}
+        self._lock        = threading.Lock()
+        # Inline renders are serialised on their own lock, so stats() never waits for one
+        self._render_lock = threading.Lock()
+        self._executor    = None
+        if workers:
+            self._start()
+
+    def _start(self):
+        # Start every worker now, so they are warm before the first request
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_worker_context(),
+                                             initializer=render_worker.init, initargs=(self.nice,))
+        for _ in range(self.workers):
+            self._executor.submit(render_worker.ready)
+
+    def _restart(self, broken):
+        """
+        Replace ``broken`` after a worker died (OOM, segfault in a native
+        library). Called with the lock held, so only one request restarts it.
+        """
+        if self._executor is not broken:
+            return
+        self.counts['restarts'] += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._start()
+
+    def _finished(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def submit(self, density_data, key=None):
+        """Future of the PNG bytes for a density vector, joining an identical render already in flight"""
+        key = key or heatmap_key(density_data)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.counts['coalesced'] += 1
+                return future
+            if len(self._inflight) >= self.max_pending:
+                self.counts['rejected'] += 1
+                raise RenderUnavailable(f"render queue is full ({self.max_pending} pending)")
+            density = np.asarray(density_data, dtype=np.float64)
+            try:
+                future = self._executor.submit(render_worker.render, density)
+            except BrokenProcessPool:
+                self._restart(self._executor)
+                future = self._executor.submit(render_worker.render, density)
+            self._inflight[key] = future
+            self.counts['rendered'] += 1
+        future.add_done_callback(lambda _: self._finished(key))
+        return future
+
+    def render(self, density_data, key=None):
+        """PNG bytes for a density vector; raises RenderUnavailable under backpressure or on timeout"""
+        if not self.workers:
+            with self._lock:
+                self.counts['rendered'] += 1
+            with self._render_lock:
+                return render_heatmap_png(density_data)
+
+        future = self.submit(density_data, key)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self.counts['timeouts'] += 1
+            raise RenderUnavailable(f"render did not finish within {self.timeout:g}s") from None
+        except BrokenProcessPool:
+            # A worker died mid-render: every request waiting on the pool gets a
+            # retryable error, and the next submit replaces the pool
+            with self._lock:
+                self.counts['crashed'] += 1
+            raise RenderUnavailable("render worker died; the pool is being restarted") from None
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'pending': len(self._inflight), **self.counts}
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    @classmethod
+    def from_env(cls):
+        """Pool configured by HEATMAP_RENDER_WORKERS, _NICE, _QUEUE and _TIMEOUT"""
+        return cls(workers=int(os.environ.get('HEATMAP_RENDER_WORKERS', DEFAULT_WORKERS)),
+                   nice=int(os.environ.get('HEATMAP_RENDER_NICE', DEFAULT_NICE)),
+                   max_pending=int(os.environ.get('HEATMAP_RENDER_QUEUE', DEFAULT_MAX_PENDING)),
+                   timeout=float(os.environ.get('HEATMAP_RENDER_TIMEOUT', DEFAULT_TIMEOUT)))
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def _probe_latencies(stop, latencies, record):
+    """What a JSON endpoint does per request: serialise a player record. Timed back to back until stopped."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        json.dumps(record)
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.001)
+
+def _burst(pool, n_requests, n_players, concurrency, seed=0):
+    """Fire ``n_requests`` cold renders (``n_players`` distinct images) from ``concurrency`` threads while probing JSON latency"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    rng = np.random.default_rng(seed)
+    densities = rng.random((n_players, np.prod(RENDER_SETTINGS['grid'])))
+    requests = rng.integers(0, n_players, n_requests)
+    record = {f"stat_{i}": float(v) for i, v in enumerate(rng.random(40))}
+
+    stop, latencies = threading.Event(), []
+    probe = threading.Thread(target=_probe_latencies, args=(stop, latencies, record))
+    probe.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as threads:
+        pngs = list(threads.map(lambda i: pool.render(densities[i]), requests))
+    seconds = time.perf_counter() - start
+    stop.set()
+    probe.join()
+    return seconds, np.array(latencies) * 1000, pngs
+
+def benchmark(n_requests=200, n_players=50, concurrency=16, workers=DEFAULT_WORKERS):
+    warm = np.ones(np.prod(RENDER_SETTINGS['grid']))
+    inline = RenderPool(workers=0)
+    inline.render(warm)
+    inline_seconds, inline_latency, inline_pngs = _burst(inline, n_requests, n_players, concurrency)
+
+    pool = RenderPool(workers=workers, max_pending=n_requests)
+    pool.render(warm)  # wait for the workers to warm up
+    pool_seconds, pool_latency, pool_pngs = _burst(pool, n_requests, n_players, concurrency)
+    stats = pool.stats()
+    pool.close()
+
+    assert pool_pngs == inline_pngs, "pooled renders differ from inline renders"
+    for name, seconds, latency, rendered in [('inline', inline_seconds, inline_latency, inline.counts['rendered'] - 1),
+                                             (f'pool ({workers} workers)', pool_seconds, pool_latency, stats['rendered'] - 1)]:
+        print(f"{name}: {n_requests} requests, {rendered} renders in {seconds:.2f}s; "
+              f"JSON probe p50 {np.percentile(latency, 50):.3f}ms, p99 {np.percentile(latency, 99):.3f}ms, "
+              f"max {latency.max():.1f}ms")
+    print(f"Coalesced {stats['coalesced']} requests into in-flight renders, rejected {stats['rejected']}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the out-of-process heatmap render pool against inline rendering')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--players', type=int, default=50, help='distinct heatmaps among the requests')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+    benchmark(args.requests, args.players, args.concurrency, args.workers)
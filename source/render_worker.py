@@ -0,0 +1,37 @@
+"""
+Entry point of the heatmap render workers (see render_pool.RenderPool).
+
+The workers are started by a forkserver that has imported only this module,
+so a worker never inherits the serving process's threads, locks or data.
+Keep the imports here as light as the server's: the heavy plotting stack is
+loaded by ``init`` in each worker.
+"""
+import os
+import threading
+import multiprocessing
+
+from source.heatmap_generator import RENDER_SETTINGS, render_heatmap_png
+
+def _exit_with_server():
+    # A server killed without shutting the pool down would otherwise leave
+    # its workers, and the forkserver they keep alive, waiting for work
+    multiprocessing.parent_process().join()
+    os._exit(0)
+
+def init(nice):
+    """Lower the worker's priority and draw the pitch once, so the first request is already warm"""
+    threading.Thread(target=_exit_with_server, name='exit-with-server', daemon=True).start()
+    if nice:
+        os.nice(nice)
+    if RENDER_SETTINGS['renderer'] == 'fast':
+        from source.heatmap_generator import _pitch_background
+        _pitch_background()
+    else:
+        from source.heatmap_generator import _plotting
+        _plotting()
+
+def render(density_data):
+    return render_heatmap_png(density_data)
+
+def ready():
+    return os.getpid()
@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+import random
+import threading
+from collections import Counter
+
+DEFAULT_INTERVAL = 0.001  # seconds between samples
+DEFAULT_PROFILE_DIR = 'data/profiles'
+FLUSH_SECONDS = 10        # how often sampled traffic is written out
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def folded_stack(frame):
+    """A frame's call stack, outermost first, joined with ';' as flame graph tools expect"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+def write_folded(samples, path):
+    """Write ``stack count`` lines (flamegraph.pl, inferno and speedscope all read them) atomically"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    os.replace(tmp_path, path)
+    return path
+
+class SamplingProfiler:
+    """
+    Statistical profiler for chosen threads.
+
+    ``start`` registers the calling thread; a background thread then records
+    its Python stack every ``interval`` seconds until ``stop`` returns the
+    counted stacks. Nothing runs while no thread is registered.
+
+    The sampler needs the GIL to read a stack, so while anything is being
+    profiled the interpreter's switch interval is lowered to ``interval / 2``
+    so that short CPU-bound requests are sampled too.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval         = interval
+        self._active          = {}
+        self._next_token      = 0
+        self._switch_interval = None
+        self._lock            = threading.Lock()
+        self._wake            = threading.Event()
+        self._thread          = None
+
+    def start(self, thread_id=None):
+        """Begin sampling ``thread_id`` (the calling thread by default); returns a token for ``stop``"""
+        with self._lock:
+            token, self._next_token = self._next_token, self._next_token + 1
+            self._active[token] = (thread_id or threading.get_ident(), Counter())
+            if len(self._active) == 1:
+                self._switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(self._switch_interval, self.interval / 2))
+                self._wake.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+        return token
+
+    def stop(self, token):
+        """Stop sampling and return a Counter of folded stacks"""
+        with self._lock:
+            _, samples = self._active.pop(token)
+            if not self._active:
+                self._wake.clear()
+                sys.setswitchinterval(self._switch_interval)
+        return samples
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, samples in self._active.values():
+                    frame = frames.get(thread_id)
+                    if frame is not None and thread_id != own_id:
+                        samples[folded_stack(frame)] += 1
+
+class RequestProfiler:
+    """
+    Chooses which requests to profile and writes their stacks.
+
+    A request is profiled when its X-Profile header equals ``token`` (the
+    stacks go to their own file, named in the X-Profile-Output response
+    header), or at random with probability ``sample_rate`` (stacks are added
+    to one running file per worker, written every FLUSH_SECONDS). Each stack
+    is rooted at the request's route so one flame graph splits by endpoint.
+    Disabled unless a token or a rate is configured.
+    """
+
+    def __init__(self, sample_rate=0.0, token=None, profile_dir=DEFAULT_PROFILE_DIR, interval=DEFAULT_INTERVAL):
+        self.sample_rate = sample_rate
+        self.token       = token or None
+        self.profile_dir = profile_dir
+        self.profiler    = SamplingProfiler(interval)
+        self.sampled     = Counter()
+        self.profiled    = 0
+        self._last_flush = time.time()
+        self._lock       = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.sample_rate) or self.token is not None
+
+    def begin(self, header_value=None):
+        """Start profiling the calling thread if this request is selected; returns a handle for ``end``, else None"""
+        if not self.enabled:
+            return None
+        explicit = self.token is not None and header_value == self.token
+        if not explicit and not (self.sample_rate and random.random() < self.sample_rate):
+            return None
+        return explicit, self.profiler.start()
+
+    def end(self, handle, route):
+        """Stop profiling and record the stacks under ``route``; returns the file written for an explicit request"""
+        explicit, token = handle
+        samples = Counter({f"{route};{stack}": count for stack, count in self.profiler.stop(token).items()})
+        with self._lock:
+            self.profiled += 1
+            if not explicit:
+                self.sampled.update(samples)
+                if time.time() - self._last_flush >= FLUSH_SECONDS:
+                    self._flush()
+                return None
+        name = f"request-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{token}.folded"
+        return write_folded(samples, os.path.join(self.profile_dir, name))
+
+    def _flush(self):
+        self._last_flush = time.time()
+        if self.sampled:
+            write_folded(self.sampled, os.path.join(self.profile_dir, f"sampled-{os.getpid()}.folded"))
+
+    def flush(self):
+        """Write the sampled-traffic stacks now (called on shutdown)"""
+        with self._lock:
+            self._flush()
+
+    @classmethod
+    def from_env(cls):
+        """Profiler configured by PROFILE_SAMPLE_RATE, PROFILE_TOKEN, PROFILE_DIR and PROFILE_INTERVAL_MS"""
+        return cls(sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+                   token=os.environ.get('PROFILE_TOKEN'),
+                   profile_dir=os.environ.get('PROFILE_DIR', DEFAULT_PROFILE_DIR),
+                   interval=float(os.environ.get('PROFILE_INTERVAL_MS', DEFAULT_INTERVAL * 1000)) / 1000)
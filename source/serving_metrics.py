@@ -0,0 +1,92 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, ProcessCollector, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Most JSON routes answer in well under a millisecond; cold heatmaps take
+# tens to hundreds of milliseconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _StateCollector:
+    """Reads the heatmap cache, render pool and snapshot manager at scrape time"""
+
+    def __init__(self, heatmap_cache, render_pool, snapshots):
+        self.heatmap_cache = heatmap_cache
+        self.render_pool   = render_pool
+        self.snapshots     = snapshots
+
+    def collect(self):
+        cache = self.heatmap_cache.stats()
+        hits = CounterMetricFamily('heatmap_cache_hits', 'Heatmap PNGs served from the cache', labels=['tier'])
+        hits.add_metric(['memory'], cache['memory_hits'])
+        hits.add_metric(['disk'], cache['disk_hits'])
+        yield hits
+        yield CounterMetricFamily('heatmap_cache_misses', 'Heatmap PNGs that had to be rendered', value=cache['misses'])
+        lookups = cache['memory_hits'] + cache['disk_hits'] + cache['misses']
+        yield GaugeMetricFamily('heatmap_cache_hit_ratio', 'Share of heatmap cache lookups served without rendering',
+                                value=(cache['memory_hits'] + cache['disk_hits']) / lookups if lookups else 0.0)
+        yield GaugeMetricFamily('heatmap_cache_memory_items', 'PNGs held in the in-memory tier', value=cache['memory_items'])
+
+        pool = self.render_pool.stats()
+        yield GaugeMetricFamily('heatmap_render_pending', 'Distinct renders queued or running', value=pool['pending'])
+        renders = CounterMetricFamily('heatmap_render_requests', 'Render requests by outcome', labels=['outcome'])
+        for outcome in ('rendered', 'coalesced', 'rejected', 'timeouts', 'crashed', 'restarts'):
+            renders.add_metric([outcome], pool[outcome])
+        yield renders
+
+        snapshot = self.snapshots.stats()
+        info = GaugeMetricFamily('data_snapshot_info', 'Data snapshot being served', labels=['version'])
+        info.add_metric([str(snapshot['version'])], 1)
+        yield info
+        yield GaugeMetricFamily('data_snapshot_loaded_timestamp_seconds', 'When the served snapshot was built',
+                                value=snapshot['loaded_at'] or 0)
+        yield GaugeMetricFamily('data_snapshot_players', 'Players in the served snapshot', value=snapshot['players'])
+        yield CounterMetricFamily('data_snapshot_reloads', 'Snapshots swapped in', value=snapshot['reloads'])
+        yield CounterMetricFamily('data_snapshot_reload_failures', 'Snapshot builds that failed', value=snapshot['reload_failures'])
+        if snapshot['last_reload_seconds'] is not None:
+            yield GaugeMetricFamily('data_snapshot_last_reload_seconds', 'Build time of the last reload',
+                                    value=snapshot['last_reload_seconds'])
+            yield GaugeMetricFamily('data_snapshot_last_reload_rss_delta_bytes',
+                                    'RSS growth during the last reload, while both snapshots were live',
+                                    value=snapshot['last_reload_rss_delta_mb'] * 2**20)
+        yield GaugeMetricFamily('data_snapshot_retired_alive', 'Replaced snapshots still held by in-flight requests',
+                                value=snapshot['retired_alive'])
+
+class ServingMetrics:
+    """
+    Prometheus metrics of one serving process: request latency per route,
+    the time spent in each stage of a request (lookup, render, serialise),
+    heatmap cache and render pool counters, the data snapshot being served,
+    and the process collector's memory and CPU figures for the worker.
+
+    Each worker keeps its own registry; scrape each worker (one port per
+    worker) to see all of them.
+    """
+
+    content_type = CONTENT_TYPE_LATEST
+
+    def __init__(self, heatmap_cache, render_pool, snapshots):
+        self.registry = CollectorRegistry()
+        ProcessCollector(registry=self.registry)
+        self.requests = Histogram('http_request_duration_seconds', 'Request latency by route and status',
+                                  ['route', 'status'], buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.stages = Histogram('http_request_stage_seconds', 'Time spent in one stage of a request',
+                                ['route', 'stage'], buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.not_modified = Counter('heatmap_not_modified', 'Heatmap requests answered 304 from the client cache',
+                                    registry=self.registry)
+        self.registry.register(_StateCollector(heatmap_cache, render_pool, snapshots))
+
+    def observe(self, route, status, seconds):
+        self.requests.labels(route, str(status)).observe(seconds)
+
+    @contextmanager
+    def stage(self, route, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.labels(route, name).observe(time.perf_counter() - start)
+
+    def exposition(self):
+        return generate_latest(self.registry)
@@ -0,0 +1,268 @@
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+try:
+    import hnswlib
+except ImportError:  # exact search still works without the ANN index
+    hnswlib = None
+
+from source.feature_pipeline import STAT_COLUMNS, WEIGHT_FACTOR, FeaturePipeline, _numeric
+
+DEFAULT_INDEX_DIR = 'data/similarity'
+
+# Largest k a query is asked for (/similar caps k at this)
+MAX_QUERY_K = 100
+
+# HNSW build/query parameters, matching the notebook's ef_construction and M.
+# The search breadth is set once, wide enough for MAX_QUERY_K, and never
+# changed per query: it is shared by every thread querying the index.
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 100
+HNSW_EF_SEARCH = max(64, MAX_QUERY_K + 1)
+
+# Below this share of the pool passing the filters, an exact scan of the
+# surviving rows is cheaper than steering the graph search around them
+FILTERED_ANN_MIN_SELECTIVITY = 0.05
+
+def transform_features(players_df, heatmap_dict, pipeline):
+    """
+    Project players through an already fitted ``pipeline`` (a FeaturePipeline,
+    or the scaler dict of an older index), without refitting. Players without
+    spatial data are dropped. Returns (ids, features).
+    """
+    if isinstance(pipeline, dict):
+        pipeline = FeaturePipeline.from_dict(pipeline)
+    return pipeline.transform_frame(players_df, heatmap_dict)
+
+def build_feature_matrix(players_df, heatmap_dict, stat_columns=STAT_COLUMNS, weight_factor=WEIGHT_FACTOR):
+    """
+    Build the similarity features for every player that has spatial data.
+
+    Returns (ids, features, pipeline) where ``pipeline`` is the fitted
+    FeaturePipeline that produced them.
+    """
+    df = players_df.drop_duplicates(subset='id', keep='first')
+    df = df[df['id'].isin(heatmap_dict)]
+    stats = np.column_stack([_numeric(df[col]) for col in stat_columns])
+    spatial = np.array([heatmap_dict[pid] for pid in df['id']], dtype=np.float64).reshape(len(df), -1)
+    pipeline = FeaturePipeline.fit(stats, spatial, stat_columns, weight_factor)
+    return df['id'].to_numpy(dtype=np.int64), pipeline.transform(stats, spatial), pipeline
+
+def _attributes(players_df, ids):
+    """Per-row filter attributes, aligned with ``ids``"""
+    df = players_df.drop_duplicates(subset='id', keep='first').set_index('id').loc[ids]
+    return {
+        'role': df['role'].fillna('').astype(str).to_numpy(dtype='U8'),
+        'club': df['club'].fillna('').astype(str).to_numpy(dtype='U64'),
+        'age': pd.to_numeric(df['age'], errors='coerce').fillna(-1).to_numpy(dtype=np.float32),
+        'market_value': pd.to_numeric(df['market_value_in_eur'], errors='coerce').to_numpy(dtype=np.float64),
+    }
+
+def save_npy(path, array):
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+def save_json(path, obj):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f, indent=2)
+    os.replace(tmp_path, path)
+
+class SimilarityIndex:
+    """
+    Filtered top-k nearest-neighbour search over the player feature matrix.
+
+    Unfiltered and loosely filtered queries go through the HNSW graph when
+    hnswlib is available; tightly filtered queries, and every query without
+    the graph, do an exact L2 scan of only the rows that pass the filters.
+
+    ``pipeline`` is the FeaturePipeline the features were built with, saved
+    and loaded alongside them so new players can be projected consistently.
+    """
+
+    def __init__(self, ids, features, attributes, hnsw=None, pipeline=None):
+        self.ids        = np.asarray(ids, dtype=np.int64)
+        self.offsets    = {int(pid): offset for offset, pid in enumerate(self.ids)}
+        self.features   = features
+        self.attributes = attributes
+        self.hnsw       = hnsw
+        self.pipeline   = pipeline
+        self.sq_norms   = np.einsum('ij,ij->i', features, features)
+
+    @classmethod
+    def build(cls, players_df, heatmap_dict, with_hnsw=True):
+        ids, features, pipeline = build_feature_matrix(players_df, heatmap_dict)
+        hnsw = _build_hnsw(features) if with_hnsw and hnswlib is not None else None
+        return cls(ids, features, _attributes(players_df, ids), hnsw, pipeline)
+
+    def save(self, index_dir):
+        # Every file is replaced atomically, so a process that has the old
+        # index memory-mapped keeps reading the old arrays
+        os.makedirs(index_dir, exist_ok=True)
+        save_npy(os.path.join(index_dir, 'ids.npy'), self.ids)
+        save_npy(os.path.join(index_dir, 'features.npy'), self.features)
+        for name, values in self.attributes.items():
+            save_npy(os.path.join(index_dir, f'attr_{name}.npy'), values)
+        if self.hnsw is not None:
+            tmp_path = os.path.join(index_dir, 'index.hnsw.tmp')
+            self.hnsw.save_index(tmp_path)
+            os.replace(tmp_path, os.path.join(index_dir, 'index.hnsw'))
+        if self.pipeline is not None:
+            self.pipeline.save(index_dir)
+        meta = {'n_players': len(self.ids), 'dim': int(self.features.shape[1]), 'hnsw': self.hnsw is not None,
+                'attributes': sorted(self.attributes),
+                'pipeline_version': self.pipeline.version if self.pipeline is not None else None}
+        save_json(os.path.join(index_dir, 'meta.json'), meta)
+
+    @classmethod
+    def load(cls, index_dir=DEFAULT_INDEX_DIR):
+        """Load a saved index, memory-mapping the feature matrix and attributes"""
+        with open(os.path.join(index_dir, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+
+        ids = np.load(os.path.join(index_dir, 'ids.npy'))
+        features = np.load(os.path.join(index_dir, 'features.npy'), mmap_mode='r')
+        attributes = {name: np.load(os.path.join(index_dir, f'attr_{name}.npy'), mmap_mode='r')
+                      for name in meta['attributes']}
+
+        hnsw = None
+        if meta['hnsw'] and hnswlib is not None:
+            hnsw = hnswlib.Index(space='l2', dim=meta['dim'])
+            hnsw.load_index(os.path.join(index_dir, 'index.hnsw'), max_elements=meta['n_players'])
+            hnsw.set_ef(HNSW_EF_SEARCH)
+        return cls(ids, features, attributes, hnsw, FeaturePipeline.load(index_dir))
+
+    def __contains__(self, player_id):
+        return player_id in self.offsets
+
+    def upsert(self, ids, features, attributes):
+        """
+        Overwrite the features of players already in the index and append the
+        rest, keeping existing offsets stable. Returns the offsets of ``ids``.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        existing = np.array([int(pid) in self.offsets for pid in ids], dtype=bool)
+        n_old, n_new = len(self.ids), int((~existing).sum())
+
+        self.features = np.concatenate([np.asarray(self.features), features[~existing]])
+        self.attributes = {name: np.concatenate([np.asarray(values), attributes[name][~existing]])
+                           for name, values in self.attributes.items()}
+        self.ids = np.concatenate([self.ids, ids[~existing]])
+        self.offsets.update({int(pid): n_old + i for i, pid in enumerate(ids[~existing])})
+
+        offsets = np.array([self.offsets[int(pid)] for pid in ids], dtype=np.int64)
+        self.features[offsets] = features
+        for name, values in self.attributes.items():
+            values[offsets] = attributes[name]
+        self.sq_norms = np.einsum('ij,ij->i', self.features, self.features)
+
+        if self.hnsw is not None:
+            if n_new:
+                self.hnsw.resize_index(n_old + n_new)
+            # hnswlib updates the vector in place when a label already exists
+            self.hnsw.add_items(features, offsets)
+        return offsets
+
+    def _filter_mask(self, role=None, max_age=None, max_market_value=None, exclude_club=None):
+        mask = np.ones(len(self.ids), dtype=bool)
+        if role:
+            mask &= self.attributes['role'] == role
+        if max_age is not None:
+            mask &= (self.attributes['age'] >= 0) & (self.attributes['age'] <= max_age)
+        if max_market_value is not None:
+            # Unknown market values never pass a budget filter
+            mask &= self.attributes['market_value'] <= max_market_value
+        if exclude_club:
+            mask &= self.attributes['club'] != exclude_club
+        return mask
+
+    def _exact(self, query, mask, k):
+        # ||a - q||^2 = ||a||^2 - 2 a.q + ||q||^2. Dense masks scan everything and
+        # blank out rejects; sparse masks only touch the surviving rows.
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        if mask.mean() > 0.5:
+            candidates = None
+            distances = self.sq_norms - 2 * (self.features @ query)
+            distances[~mask] = np.inf
+        else:
+            candidates = np.flatnonzero(mask)
+            distances = self.sq_norms[candidates] - 2 * (self.features[candidates] @ query)
+        distances = distances + query @ query
+
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        offsets = top if candidates is None else candidates[top]
+        return offsets, np.sqrt(np.maximum(distances[top], 0))
+
+    def query(self, player_id, k=10, **filters):
+        """
+        Top-k most similar players to ``player_id`` that pass the filters
+        (role, max_age, max_market_value, exclude_club).
+
+        Returns (player_ids, distances), nearest first, never including the
+        player itself.
+        """
+        offset = self.offsets[player_id]
+        query = np.asarray(self.features[offset], dtype=np.float32)
+
+        mask = self._filter_mask(**filters)
+        mask[offset] = False
+        n_candidates = int(mask.sum())
+        k = min(k, n_candidates)
+        if k == 0:
+            return [], []
+
+        if self.hnsw is not None and n_candidates >= FILTERED_ANN_MIN_SELECTIVITY * len(self.ids):
+            unfiltered = n_candidates == len(self.ids) - 1
+            try:
+                if unfiltered:
+                    # Cheaper to ask for one extra and drop the player itself
+                    labels, distances = self.hnsw.knn_query(query, k=k + 1)
+                    keep = labels[0] != offset
+                    labels, distances = labels[0][keep][:k], distances[0][keep][:k]
+                else:
+                    labels, distances = self.hnsw.knn_query(query, k=k, filter=lambda label: bool(mask[label]))
+                    labels, distances = labels[0], distances[0]
+                return self.ids[labels].tolist(), np.sqrt(distances).tolist()
+            except RuntimeError:
+                # The graph search could not reach k filtered neighbours
+                pass
+
+        offsets, distances = self._exact(query, mask, k)
+        return self.ids[offsets].tolist(), distances.tolist()
+
+def _build_hnsw(features):
+    index = hnswlib.Index(space='l2', dim=features.shape[1])
+    index.init_index(max_elements=len(features), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+    index.add_items(features, np.arange(len(features)))
+    index.set_ef(HNSW_EF_SEARCH)
+    return index
+
+def build_index(players_path, features_path, index_dir=DEFAULT_INDEX_DIR):
+    """Offline build: features, filter attributes and HNSW graph written to ``index_dir``"""
+    from source.heatmap_features import load_heatmap_features
+
+    players_df = pd.read_csv(players_path)
+    heatmap_dict = load_heatmap_features(features_path)
+
+    ids, features, pipeline = build_feature_matrix(players_df, heatmap_dict)
+    hnsw = _build_hnsw(features) if hnswlib is not None else None
+    index = SimilarityIndex(ids, features, _attributes(players_df, ids), hnsw, pipeline)
+    index.save(index_dir)
+    print(f"Built similarity index for {len(ids)} players ({features.shape[1]} dims, hnsw={hnsw is not None}) in {index_dir}")
+    return index
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the similarity index served by /similar')
+    parser.add_argument('--players', default='data/final_player_df.csv')
+    parser.add_argument('--features', default='data', help='directory with the heatmap feature arrays, or a JSON export')
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR)
+    args = parser.parse_args()
+    build_index(args.players, args.features, args.index_dir)
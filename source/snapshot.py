@@ -0,0 +1,345 @@
+import os
+import time
+import shutil
+import logging
+import argparse
+import threading
+import weakref
+from datetime import datetime, timezone
+
+from source.heatmap_cache import heatmap_key
+from source.heatmap_features import FEATURES_FILE, IDS_FILE, META_FILE, JSON_FILE, load_heatmap_features
+
+DEFAULT_SNAPSHOT_DIR = 'data/snapshots'
+CURRENT_FILE = 'CURRENT'
+PLAYERS_FILE = 'final_player_df.csv'
+SIMILARITY_SUBDIR = 'similarity'
+DEFAULT_KEEP = 3
+
+# Snapshot used when no versioned snapshot has been published: the files the
+# app has always read from data/
+LEGACY_VERSION = 'data'
+
+logger = logging.getLogger('pocket_scout.snapshot')
+
+def _rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+class Snapshot:
+    """
+    Every lookup structure the app serves from, built together from one
+    version of the data. A snapshot is never modified after it is built;
+    a refresh builds a new one and swaps the reference.
+    """
+
+    def __init__(self, version, heatmap_dict, player_store, neighbour_table, name_index, similarity_index):
+        self.version          = version
+        self.heatmap_dict     = heatmap_dict
+        self.player_store     = player_store
+        self.neighbour_table  = neighbour_table
+        self.name_index       = name_index
+        self.similarity_index = similarity_index
+        # The feature pipeline the index was built with: projects a player
+        # record or a batch of stats into the index's feature space
+        self.feature_pipeline = similarity_index.pipeline
+        self.player_dict      = {name: int(pid) for pid, name in zip(player_store.ids, player_store.full_names)}
+        # Rendered heatmaps are content-addressed, so the ETag is known before rendering
+        self.heatmap_etags    = {pid: heatmap_key(features) for pid, features in heatmap_dict.items()}
+        self.loaded_at        = time.time()
+
+    @classmethod
+    def build(cls, version, players_path, features_path, similarity_dir):
+        """
+        Load the players CSV and heatmap features and build the profile store,
+        neighbour table, name index and similarity index. The prebuilt index
+        in ``similarity_dir`` is used when present and covers only players in
+        the CSV; otherwise an exact one is built in memory.
+        """
+        import numpy as np
+        import pandas as pd
+        from source.player_store import PlayerStore
+        from source.neighbour_table import NeighbourTable
+        from source.name_index import NameIndex
+        from source.similarity import SimilarityIndex
+
+        heatmap_dict = load_heatmap_features(features_path)
+        players_df = pd.read_csv(players_path)
+        player_store = PlayerStore.from_frame(
+            players_df,
+            heatmap_url=lambda pid: f"/heatmap/{pid}.png" if pid in heatmap_dict else None
+        )
+        neighbour_table = NeighbourTable.from_frame(players_df)
+        similarity_index = None
+        if os.path.exists(os.path.join(similarity_dir, 'meta.json')):
+            similarity_index = SimilarityIndex.load(similarity_dir)
+            # An index built from an older players CSV would return ids the
+            # neighbour table cannot describe
+            unknown = np.setdiff1d(similarity_index.ids, neighbour_table.ids)
+            if len(unknown):
+                logger.warning("%s has %d players missing from %s (e.g. %s); building an exact index instead",
+                               similarity_dir, len(unknown), players_path, unknown[:5].tolist())
+                similarity_index = None
+        if similarity_index is None:
+            similarity_index = SimilarityIndex.build(players_df, heatmap_dict, with_hnsw=False)
+        if similarity_index.pipeline is None:
+            logger.warning("%s has no feature pipeline; rebuild it with python -m source.similarity", similarity_dir)
+
+        return cls(version, heatmap_dict, player_store, neighbour_table, NameIndex.from_frame(players_df),
+                   similarity_index)
+
+# -----------------------------
+# Publishing
+# -----------------------------
+def current_version(snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+    """Version named by ``<snapshot_dir>/CURRENT``, or None when nothing is published"""
+    try:
+        with open(os.path.join(snapshot_dir, CURRENT_FILE), 'r') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def publish(players_path, features_dir=None, similarity_dir=None, snapshot_dir=DEFAULT_SNAPSHOT_DIR,
+            version=None, keep=DEFAULT_KEEP):
+    """
+    Copy a pipeline run's outputs into ``<snapshot_dir>/<version>/`` and then
+    point CURRENT at it. Serving processes only ever see complete snapshots:
+    the directory is assembled under a temporary name and renamed, and
+    CURRENT is replaced atomically. Keeps the ``keep`` most recently
+    published versions.
+    """
+    version = version or datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    target = os.path.join(snapshot_dir, version)
+    if os.path.exists(target):
+        raise FileExistsError(f"snapshot {version} already exists in {snapshot_dir}")
+
+    tmp_dir = os.path.join(snapshot_dir, f".{version}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    shutil.copy2(players_path, os.path.join(tmp_dir, PLAYERS_FILE))
+    if features_dir:
+        for name in (FEATURES_FILE, IDS_FILE, META_FILE, JSON_FILE):
+            if os.path.exists(os.path.join(features_dir, name)):
+                shutil.copy2(os.path.join(features_dir, name), os.path.join(tmp_dir, name))
+    if similarity_dir and os.path.exists(os.path.join(similarity_dir, 'meta.json')):
+        shutil.copytree(similarity_dir, os.path.join(tmp_dir, SIMILARITY_SUBDIR))
+    os.replace(tmp_dir, target)
+    # The directory's mtime records when it was published, which is the
+    # order old versions are pruned in (names need not sort that way)
+    os.utime(target)
+
+    current_path = os.path.join(snapshot_dir, CURRENT_FILE)
+    with open(f"{current_path}.tmp", 'w') as f:
+        f.write(version + '\n')
+    os.replace(f"{current_path}.tmp", current_path)
+
+    # Processes still serving an older version keep their open files: on
+    # Linux a deleted memory-mapped file stays readable until unmapped
+    versions = sorted((name for name in os.listdir(snapshot_dir)
+                       if not name.startswith('.') and os.path.isdir(os.path.join(snapshot_dir, name))),
+                      key=lambda name: os.stat(os.path.join(snapshot_dir, name)).st_mtime_ns)
+    for old in versions[:-keep] if keep else []:
+        if old != version:
+            shutil.rmtree(os.path.join(snapshot_dir, old), ignore_errors=True)
+
+    print(f"Published snapshot {version} to {snapshot_dir}")
+    return version
+
+# -----------------------------
+# Serving side
+# -----------------------------
+class SnapshotManager:
+    """
+    Holds the snapshot the app is serving and swaps in new ones.
+
+    ``current`` is a single attribute, so replacing it is atomic: a request
+    that read it keeps a consistent snapshot to the end even if a reload
+    lands meanwhile, and the old snapshot is released when the last such
+    request drops its reference. ``watch`` polls CURRENT from a background
+    thread and builds new versions there, off the request path.
+
+    Until a snapshot is published, the legacy paths (``players_path``,
+    ``features_dir``, ``similarity_dir``) are served.
+    """
+
+    def __init__(self, snapshot_dir=DEFAULT_SNAPSHOT_DIR, players_path='data/final_player_df.csv',
+                 features_dir='data', similarity_dir='data/similarity'):
+        self.snapshot_dir   = snapshot_dir
+        self.players_path   = players_path
+        self.features_dir   = features_dir
+        self.similarity_dir = similarity_dir
+        self.current        = None
+        self.metrics        = {'reloads': 0, 'reload_failures': 0, 'last_reload_seconds': None,
+                               'last_reload_rss_delta_mb': None, 'retired': 0}
+        self.releases       = {'released': 0, 'last_release_seconds': None}
+        self._lock          = threading.Lock()  # metrics
+        # releases: taken by _released, which the garbage collector can run
+        # in any thread at any point, including inside this very lock
+        self._release_lock  = threading.RLock()
+        self._building      = threading.Lock()  # one reload at a time
+        self._stop          = threading.Event()
+        self._thread        = None
+
+    def _paths(self, version):
+        """(players CSV, heatmap features, similarity index dir) of a version"""
+        if version == LEGACY_VERSION:
+            return self.players_path, self.features_dir, self.similarity_dir
+        base = os.path.join(self.snapshot_dir, version)
+        has_features = any(os.path.exists(os.path.join(base, name)) for name in (FEATURES_FILE, JSON_FILE))
+        return (os.path.join(base, PLAYERS_FILE), base if has_features else self.features_dir,
+                os.path.join(base, SIMILARITY_SUBDIR))
+
+    def load(self):
+        """Build the published snapshot (or the legacy data) synchronously; used at startup"""
+        version = current_version(self.snapshot_dir) or LEGACY_VERSION
+        self.current = Snapshot.build(version, *self._paths(version))
+        return self.current
+
+    def _released(self, version, retired_at):
+        # Runs wherever the last reference is dropped, possibly inside a
+        # section holding self._lock, so it only takes the reentrant release lock
+        with self._release_lock:
+            self.releases['released'] += 1
+            self.releases['last_release_seconds'] = time.time() - retired_at
+        logger.info("Released snapshot %s", version)
+
+    def reload(self):
+        """Build and swap in the published version if it differs from the one being served. True if swapped."""
+        version = current_version(self.snapshot_dir)
+        if version is None or (self.current is not None and version == self.current.version):
+            return False
+
+        with self._building:
+            start, rss_before = time.perf_counter(), _rss_mb()
+            try:
+                snapshot = Snapshot.build(version, *self._paths(version))
+                if not len(snapshot.player_store):
+                    raise ValueError(f"snapshot {version} has no players")
+            except Exception:
+                with self._lock:
+                    self.metrics['reload_failures'] += 1
+                logger.exception("Reloading snapshot %s failed; still serving %s", version,
+                                 self.current.version if self.current else None)
+                return False
+            seconds = time.perf_counter() - start
+            # Both snapshots are alive here, so this is the reload's memory overhead
+            rss_delta = _rss_mb() - rss_before
+
+            old, self.current = self.current, snapshot
+            with self._lock:
+                if old is not None:
+                    self.metrics['retired'] += 1
+                self.metrics['reloads'] += 1
+                self.metrics['last_reload_seconds'] = seconds
+                self.metrics['last_reload_rss_delta_mb'] = rss_delta
+            if old is not None:
+                weakref.finalize(old, self._released, old.version, time.time())
+            del old
+
+        logger.warning("Swapped in snapshot %s (%d players) in %.2fs, RSS +%.0f MB while both are live",
+                       version, len(snapshot.player_store), seconds, self.metrics['last_reload_rss_delta_mb'])
+        return True
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            self.reload()
+
+    def watch(self, interval):
+        """Poll for a new published version every ``interval`` seconds in a daemon thread"""
+        if self._thread is None and interval > 0:
+            self._thread = threading.Thread(target=self._watch, args=(interval,), name='snapshot-watcher', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._release_lock:
+            releases = dict(self.releases)
+        with self._lock:
+            metrics = dict(self.metrics)
+        current = self.current
+        return {'version': current.version if current else None,
+                'loaded_at': current.loaded_at if current else None,
+                'players': len(current.player_store) if current else 0,
+                'rss_mb': _rss_mb(), **metrics, **releases,
+                'retired_alive': metrics['retired'] - releases['released']}
+
+    @classmethod
+    def from_env(cls):
+        """Manager over SNAPSHOT_DIR, falling back to the HEATMAP_FEATURES_DIR / SIMILARITY_INDEX_DIR layout"""
+        return cls(snapshot_dir=os.environ.get('SNAPSHOT_DIR', DEFAULT_SNAPSHOT_DIR),
+                   features_dir=os.environ.get('HEATMAP_FEATURES_DIR', 'data'),
+                   similarity_dir=os.environ.get('SIMILARITY_INDEX_DIR', 'data/similarity'))
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def benchmark(players_path, features_dir, duration=None):
+    """
+    Serve profile lookups from a thread while a new snapshot is published and
+    swapped in, and report the reload time, its memory overhead, the worst
+    lookup latency during the reload and whether any lookup failed
+    """
+    import tempfile
+    import numpy as np
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        snapshot_dir = os.path.join(tmp_dir, 'snapshots')
+        publish(players_path, features_dir, snapshot_dir=snapshot_dir, version='v1')
+        manager = SnapshotManager(snapshot_dir, similarity_dir=os.path.join(tmp_dir, 'none'))
+        manager.load()
+        player_ids = [int(pid) for pid in manager.current.player_store.ids[:100]]
+
+        stop, latencies, errors = threading.Event(), [], []
+        def serve():
+            while not stop.is_set():
+                for pid in player_ids:
+                    start = time.perf_counter()
+                    snapshot = manager.current
+                    if snapshot.player_store.get_json(pid) is None or pid not in snapshot.neighbour_table:
+                        errors.append(pid)
+                    latencies.append(time.perf_counter() - start)
+                time.sleep(0.001)
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        time.sleep(0.5)
+        publish(players_path, features_dir, snapshot_dir=snapshot_dir, version='v2')
+        swapped = manager.reload()
+        time.sleep(duration or 0.5)
+        stop.set()
+        thread.join()
+
+    stats = manager.stats()
+    latencies = np.array(latencies) * 1000
+    print(f"Reload to {stats['version']} (swapped={swapped}): {stats['last_reload_seconds']:.2f}s, "
+          f"RSS +{stats['last_reload_rss_delta_mb']:.0f} MB while both snapshots were live")
+    print(f"{len(latencies):,} lookups during the test: p50 {np.percentile(latencies, 50):.4f}ms, "
+          f"p99 {np.percentile(latencies, 99):.4f}ms, max {latencies.max():.1f}ms, {len(errors)} failed")
+    print(f"Old snapshot released: {stats['retired_alive'] == 0} "
+          f"({stats['last_release_seconds'] or 0:.3f}s after the swap)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Publish versioned data snapshots for the app to hot-reload')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    publish_parser = subparsers.add_parser('publish', help='copy a pipeline run into a new snapshot and make it current')
+    publish_parser.add_argument('--players', default='data/final_player_df.csv')
+    publish_parser.add_argument('--features', default='data', help='directory with the heatmap feature arrays or JSON export')
+    publish_parser.add_argument('--similarity', default='data/similarity', help='prebuilt similarity index directory')
+    publish_parser.add_argument('--snapshot-dir', default=DEFAULT_SNAPSHOT_DIR)
+    publish_parser.add_argument('--version', default=None, help='defaults to the current UTC timestamp')
+    publish_parser.add_argument('--keep', type=int, default=DEFAULT_KEEP, help='published versions to keep')
+    subparsers.add_parser('status', help='print the current version').add_argument('--snapshot-dir', default=DEFAULT_SNAPSHOT_DIR)
+    bench = subparsers.add_parser('benchmark', help='time a hot reload under lookup load')
+    bench.add_argument('--players', default='data/final_player_df.csv')
+    bench.add_argument('--features', default='data')
+    args = parser.parse_args()
+
+    if args.command == 'publish':
+        publish(args.players, args.features, args.similarity, args.snapshot_dir, args.version, args.keep)
+    elif args.command == 'status':
+        print(current_version(args.snapshot_dir) or f"no snapshot published in {args.snapshot_dir}")
+    else:
+        logging.basicConfig(level=logging.WARNING)
+        benchmark(args.players, args.features)
@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, '.github', 'startup_baseline.json')
+
+# Libraries the serving process must not import until a request needs them.
+# pyarrow is not listed: pandas 3 imports it itself
+HEAVY_MODULES = ['matplotlib', 'mplsoccer', 'PIL', 'scipy', 'sklearn', 'umap', 'faiss']
+
+# Allowed growth over the baseline before `check` fails. Import time is too
+# noisy across machines to compare with a stored number; it is only gated
+# against a reference checkout booted on the same machine (--reference)
+TOLERANCE = {'rss_mb': 0.2}
+TIME_TOLERANCE = 0.5
+
+# Runs in a fresh interpreter: import the app the way a worker boots it
+_PROBE = r'''
+import json, os, resource, sys, time
+start = time.perf_counter()
+import app
+seconds = time.perf_counter() - start
+with open('/proc/self/statm') as f:
+    rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+print(json.dumps({'import_seconds': seconds, 'rss_mb': rss / 2**20,
+                  'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  'modules': sorted({name.split('.')[0] for name in sys.modules})}))
+'''
+
+def synthetic_features(players_path, output_dir, seed=7):
+    """Heatmap feature arrays for every player in ``players_path``, for checkouts without the real data"""
+    import pandas as pd
+    from source.heatmap_features import save_features
+
+    ids = np.unique(pd.read_csv(players_path, usecols=['id'])['id'].to_numpy(dtype=np.int64))
+    features = np.random.default_rng(seed).random((len(ids), 100)).astype(np.float32)
+    save_features(ids, features / features.sum(axis=1, keepdims=True), output_dir)
+
+def _probe(root, env):
+    out = subprocess.run([sys.executable, '-c', _PROBE], cwd=root, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"importing app from {root} failed:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def _environment(root, tmp_dir, synthetic):
+    """Environment booting the app of the checkout at ``root``, with its caches under ``tmp_dir``"""
+    env = {**os.environ, 'HEATMAP_CACHE_DIR': os.path.join(tmp_dir, 'heatmap_cache'),
+           'PYTHONPATH': os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')]))}
+    if synthetic:
+        # Both trees get the same features, made from this tree's players
+        synthetic_features(os.path.join(ROOT, 'data', 'final_player_df.csv'), tmp_dir)
+        env.update(HEATMAP_FEATURES_DIR=tmp_dir, SIMILARITY_INDEX_DIR=os.path.join(tmp_dir, 'similarity'),
+                   SNAPSHOT_DIR=os.path.join(tmp_dir, 'snapshots'))
+    return env
+
+def measure(runs=5, synthetic=False, reference=None):
+    """
+    Boot the app in ``runs`` fresh interpreters and report the median import
+    time and RSS after import, with the heavy modules that got loaded.
+
+    With ``reference`` (the root of another checkout, e.g. the base of a
+    pull request), its app is booted too, alternating with this one so both
+    see the same machine load. Returns (result, reference result) then.
+    """
+    roots = [ROOT] + ([os.path.abspath(reference)] if reference else [])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        envs = []
+        for n, root in enumerate(roots):
+            os.makedirs(os.path.join(tmp_dir, str(n)))
+            envs.append(_environment(root, os.path.join(tmp_dir, str(n)), synthetic))
+        samples = [[] for _ in roots]
+        for _ in range(runs):
+            for root, env, found in zip(roots, envs, samples):
+                found.append(_probe(root, env))
+
+    results = [_summarise(found) for found in samples]
+    return tuple(results) if reference else results[0]
+
+def _summarise(samples):
+    return {
+        'import_seconds': float(np.median([s['import_seconds'] for s in samples])),
+        'rss_mb': float(np.median([s['rss_mb'] for s in samples])),
+        'peak_rss_mb': float(np.median([s['peak_rss_mb'] for s in samples])),
+        'heavy_modules': [name for name in HEAVY_MODULES if name in samples[0]['modules']],
+        'python': sys.version.split()[0],
+    }
+
+def regressions(result, baseline, tolerance=TOLERANCE, reference=None, time_tolerance=TIME_TOLERANCE):
+    """
+    Messages for every metric above baseline * (1 + tolerance), every newly
+    imported heavy module and, given a ``reference`` measured alongside
+    ``result``, an import time above the reference's * (1 + time_tolerance)
+    """
+    found = []
+    for metric, allowed in tolerance.items():
+        limit = baseline[metric] * (1 + allowed)
+        if result[metric] > limit:
+            found.append(f"{metric} {result[metric]:.3f} is above {limit:.3f} (baseline {baseline[metric]:.3f} + {allowed:.0%})")
+    for name in sorted(set(result['heavy_modules']) - set(baseline['heavy_modules'])):
+        found.append(f"{name} is now imported at startup")
+    if reference is not None:
+        limit = reference['import_seconds'] * (1 + time_tolerance)
+        if result['import_seconds'] > limit:
+            found.append(f"import_seconds {result['import_seconds']:.3f} is above {limit:.3f} "
+                         f"(reference {reference['import_seconds']:.3f} + {time_tolerance:.0%})")
+    return found
+
+def _report(result, label='import app'):
+    heavy = ', '.join(result['heavy_modules']) or 'none'
+    print(f"{label}: {result['import_seconds'] * 1000:.0f}ms, RSS {result['rss_mb']:.0f} MB "
+          f"(peak {result['peak_rss_mb']:.0f} MB), heavy modules: {heavy}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the serving process boot: import time, RSS and heavy imports')
+    parser.add_argument('command', choices=['measure', 'check'],
+                        help='measure: print (and with --save, store) the numbers; check: fail on a regression')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--synthetic', action='store_true', help='boot on synthetic heatmap features (no real data needed)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save', action='store_true', help='write the measurement as the new baseline')
+    parser.add_argument('--reference', help='another checkout to boot alongside, whose import time check compares against')
+    args = parser.parse_args()
+
+    reference = None
+    if args.reference:
+        try:
+            result, reference = measure(args.runs, args.synthetic, args.reference)
+            _report(reference, f"reference ({args.reference})")
+        except (RuntimeError, OSError) as error:
+            # A reference that does not boot says nothing about this tree
+            print(f"Skipping the import time comparison: {error}")
+    if reference is None:
+        result = measure(args.runs, args.synthetic)
+    _report(result)
+    if args.command == 'measure' and args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(result, f, indent=2)
+            f.write('\n')
+        print(f"Saved baseline to {args.baseline}")
+    elif args.command == 'check':
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        problems = regressions(result, baseline, reference=reference)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        sys.exit(1 if problems else 0)
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from source.event_stats import COUNT_COLUMNS, FLAT_COLUMNS, compute_player_stats, event_counts, stats_from_counts
+from source.event_store import DEFAULT_EVENTS_DIR, read_events
+
+DEFAULT_STATE_PATH = os.path.join(os.path.dirname(DEFAULT_EVENTS_DIR), 'player_stat_state.parquet')
+
+STATE_COLUMNS = COUNT_COLUMNS + ['matches_played']
+
+class StatAggregator:
+    """
+    Running per-player totals of the additive counters behind STATS_COLUMNS.
+
+    ``counts`` holds COUNT_COLUMNS plus 'matches_played' per Id. Folding new
+    events only groups those events and adds the result in, so one matchday
+    costs time in its own events, not the whole history. The ratio columns
+    are derived from the totals on demand by ``stats``.
+
+    ``match_ids`` records every folded match. Events of a match that has
+    already been folded are skipped, which keeps 'Matches Played' additive
+    and makes folding the same partition twice harmless. ``last_seq`` is the
+    last IngestLog batch folded by ``update``.
+    """
+
+    def __init__(self, counts=None, match_ids=(), last_seq=0):
+        if counts is None:
+            counts = pd.DataFrame({col: pd.Series(dtype=np.int64) for col in STATE_COLUMNS})
+            counts.index = pd.Index([], dtype=np.int64, name='Id')
+        self.counts    = counts
+        self.match_ids = set(int(match_id) for match_id in match_ids)
+        self.last_seq  = last_seq
+
+    def __len__(self):
+        return len(self.counts)
+
+    def fold(self, flat):
+        """Add a flat event frame (FLAT_COLUMNS) to the totals. Returns the number of events folded."""
+        seen = flat['match_id'].isin(self.match_ids).to_numpy(dtype=bool)
+        if seen.any():
+            flat = flat[~seen]
+        if flat.empty:
+            return 0
+
+        counts, appearances = event_counts(flat)
+        counts = counts.assign(matches_played=appearances.groupby('Id').size().reindex(counts.index, fill_value=0))
+        self.counts = pd.concat([self.counts, counts.astype(np.int64)]).groupby(level='Id').sum()
+        self.match_ids.update(int(match_id) for match_id in flat['match_id'].dropna().unique())
+        return len(flat)
+
+    def fold_partitions(self, paths):
+        """Fold Parquet event partitions, reading only the columns the stats need"""
+        return self.fold(read_events(list(paths), columns=FLAT_COLUMNS)) if paths else 0
+
+    def update(self, ingest_log):
+        """Fold every partition committed to ``ingest_log`` since the last update"""
+        batches = ingest_log.partitions(after=self.last_seq)
+        if not batches:
+            return 0
+        n_events = self.fold_partitions([ingest_log.partition_path(partition) for _, partition in batches])
+        self.last_seq = batches[-1][0]
+        return n_events
+
+    def stats(self):
+        """STATS_COLUMNS frame, as process_data returns for the same events"""
+        return stats_from_counts(self.counts[COUNT_COLUMNS], self.counts['matches_played'])
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+    def save(self, path=DEFAULT_STATE_PATH):
+        """Write the totals and bookkeeping to one Parquet file, atomically"""
+        table = pa.Table.from_pandas(self.counts.reset_index(), preserve_index=False)
+        meta = {'last_seq': self.last_seq, 'match_ids': sorted(self.match_ids)}
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'stat_state': json.dumps(meta).encode()})
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_STATE_PATH):
+        """Load saved totals, or start empty when ``path`` does not exist yet"""
+        if not os.path.exists(path):
+            return cls()
+        table = pq.read_table(path)
+        meta = json.loads(table.schema.metadata[b'stat_state'])
+        counts = table.to_pandas().set_index('Id')[STATE_COLUMNS].astype(np.int64)
+        return cls(counts, meta['match_ids'], meta['last_seq'])
+
+def update_stats(events_dir=DEFAULT_EVENTS_DIR, state_path=DEFAULT_STATE_PATH):
+    """Fold newly ingested partitions into the saved totals and return the refreshed stats"""
+    from source.ingest_log import IngestLog
+
+    aggregator = StatAggregator.load(state_path)
+    n_events = aggregator.update(IngestLog(events_dir))
+    if n_events:
+        aggregator.save(state_path)
+    print(f"Folded {n_events} new events; {len(aggregator)} players over {len(aggregator.match_ids)} matches")
+    return aggregator.stats()
+
+# -----------------------------
+# Consistency check and benchmark
+# -----------------------------
+def check_consistency(aggregator, events):
+    """Assert that the incremental totals give the same stats as a full recompute over ``events``"""
+    full = compute_player_stats(events)
+    pd.testing.assert_frame_equal(
+        full.reset_index(drop=True).astype(float),
+        aggregator.stats().reset_index(drop=True).astype(float),
+        check_exact=False
+    )
+    return full
+
+def benchmark(n_matchdays, matches_per_day, events_per_match):
+    """Fold synthetic matchdays one at a time, timing the fold against a full recompute each day"""
+    from source.event_stats import flatten_events
+    from source.synthetic_events import synthetic_events
+
+    aggregator = StatAggregator()
+    history = []
+    for day in range(n_matchdays):
+        events = synthetic_events(matches_per_day * events_per_match, n_matches=matches_per_day, seed=day)
+        flat = flatten_events(events)
+        flat['match_id'] = flat['match_id'] + day * matches_per_day
+        history.append(flat)
+
+        start = time.perf_counter()
+        aggregator.fold(flat)
+        aggregator.stats()
+        incremental_seconds = time.perf_counter() - start
+
+        everything = pd.concat(history, ignore_index=True)
+        start = time.perf_counter()
+        compute_player_stats(everything)
+        full_seconds = time.perf_counter() - start
+        print(f"Matchday {day + 1}: {len(everything):,} events so far, incremental {incremental_seconds * 1000:.0f}ms, "
+              f"full recompute {full_seconds * 1000:.0f}ms")
+
+    # Refolding a matchday must not change anything
+    aggregator.fold(history[-1])
+    check_consistency(aggregator, everything)
+    print(f"Consistent with a full recompute over {len(everything):,} events")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Incremental player stats over the streamed event partitions')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    update = subparsers.add_parser('update', help='fold newly ingested partitions into the saved totals')
+    check = subparsers.add_parser('check', help='compare the saved totals with a full recompute')
+    for sub in (update, check):
+        sub.add_argument('--events-dir', default=DEFAULT_EVENTS_DIR)
+        sub.add_argument('--state', default=DEFAULT_STATE_PATH)
+    bench = subparsers.add_parser('benchmark', help='time incremental folds against full recomputes on synthetic data')
+    bench.add_argument('--matchdays', type=int, default=10)
+    bench.add_argument('--matches-per-day', type=int, default=10)
+    bench.add_argument('--events-per-match', type=int, default=3500)
+    args = parser.parse_args()
+
+    if args.command == 'update':
+        update_stats(args.events_dir, args.state)
+    elif args.command == 'check':
+        from source.ingest_log import IngestLog
+
+        aggregator = StatAggregator.load(args.state)
+        log = IngestLog(args.events_dir)
+        paths = [log.partition_path(partition) for seq, partition in log.partitions() if seq <= aggregator.last_seq]
+        check_consistency(aggregator, read_events(paths, columns=FLAT_COLUMNS))
+        print(f"Saved totals match a full recompute over {len(paths)} partitions")
+    else:
+        benchmark(args.matchdays, args.matches_per_day, args.events_per_match)
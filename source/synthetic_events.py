@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+# Relative frequencies loosely follow a real StatsBomb match
+EVENT_TYPES = {
+    'Pass': 0.30, 'Ball Receipt*': 0.27, 'Carry': 0.22, 'Pressure': 0.07, 'Ball Recovery': 0.02,
+    'Duel': 0.02, 'Clearance': 0.01, 'Shot': 0.01, 'Dribble': 0.01, 'Block': 0.01,
+    'Interception': 0.01, 'Goal Keeper': 0.01, 'Half Start': 0.02, 'Starting XI': 0.02,
+}
+
+# Event types that carry no player
+TEAM_EVENTS = {'Half Start', 'Starting XI'}
+
+SHOT_OUTCOMES = ['Goal', 'Saved', 'Off T', 'Blocked', 'Wayward', 'Post', 'On Target', 'Own Goal']
+SHOT_TYPES = ['Open Play', 'Penalty', 'Free Kick', 'Corner']
+PASS_OUTCOMES = [None, None, None, None, 'Incomplete', 'Out', 'Unknown']
+PASS_TYPES = [None, None, None, 'Free Kick', 'Throw-in', 'Corner', 'Goal Kick', 'Key Pass']
+PASS_HEIGHTS = ['Ground Pass', 'Low Pass', 'High Pass']
+DUEL_TYPES = ['Aerial Duel', 'Tackle', 'Ground defending duel', 'Loose Ball', 'Aerial Lost']
+DUEL_OUTCOMES = [None, 'Won', 'Lost', 'Success In Play']
+DRIBBLE_OUTCOMES = ['Complete', 'Incomplete']
+GK_TYPES = ['Shot Saved', 'Collected', 'Punch', 'Keeper Sweeper', 'Goal Conceded']
+GK_OUTCOMES = [None, 'Success', 'Claim', 'Fail', 'In Play Safe']
+
+def _named(name):
+    return None if name is None else {'id': len(name), 'name': name}
+
+def _pick(rng, choices):
+    # Index rather than rng.choice so names stay plain str and repr cleanly
+    return choices[rng.integers(len(choices))]
+
+def _nested(event_type, rng):
+    """The type-specific sub-dict of one event, keyed by its StatsBomb column"""
+    if event_type == 'Shot':
+        return 'shot', {'outcome': _named(_pick(rng, SHOT_OUTCOMES)), 'type': _named(_pick(rng, SHOT_TYPES)),
+                        'statsbomb_xg': float(rng.random())}
+    if event_type == 'Pass':
+        body = {'length': float(rng.random() * 60), 'height': _named(_pick(rng, PASS_HEIGHTS)),
+                'recipient': {'id': int(rng.integers(1, 500)), 'name': 'recipient'}}
+        for key, choices in (('outcome', PASS_OUTCOMES), ('type', PASS_TYPES)):
+            name = _pick(rng, choices)
+            if name is not None:
+                body[key] = _named(name)
+        if rng.random() < 0.01:
+            body['goal_assist'] = True
+        return 'pass', body
+    if event_type == 'Duel':
+        body = {'type': _named(_pick(rng, DUEL_TYPES))}
+        outcome = _pick(rng, DUEL_OUTCOMES)
+        if outcome is not None:
+            body['outcome'] = _named(outcome)
+        return 'duel', body
+    if event_type == 'Dribble':
+        return 'dribble', {'outcome': _named(_pick(rng, DRIBBLE_OUTCOMES))}
+    if event_type == 'Goal Keeper':
+        body = {'type': _named(_pick(rng, GK_TYPES))}
+        outcome = _pick(rng, GK_OUTCOMES)
+        if outcome is not None:
+            body['outcome'] = _named(outcome)
+        return 'goalkeeper', body
+    if event_type == 'Carry':
+        return 'carry', {'end_location': [float(rng.random() * 120), float(rng.random() * 80)]}
+    return None, None
+
+def synthetic_events(n_events, n_players=500, n_matches=None, seed=7):
+    """
+    StatsBomb-shaped event frame with nested dict columns, as produced by the
+    statsbombapi DataFrame decoder in "1b. live_data.py".
+    """
+    rng = np.random.default_rng(seed)
+    n_matches = n_matches or max(1, n_events // 3500)
+
+    names = list(EVENT_TYPES)
+    weights = np.array(list(EVENT_TYPES.values()))
+    event_types = rng.choice(names, size=n_events, p=weights / weights.sum())
+    player_ids = rng.integers(1, n_players + 1, size=n_events)
+    match_ids = np.sort(rng.integers(1, n_matches + 1, size=n_events))
+
+    rows = []
+    for index, (event_type, player_id, match_id) in enumerate(zip(event_types, player_ids, match_ids)):
+        row = {
+            'id': f"evt-{index}",
+            'index': index,
+            'match_id': int(match_id),
+            'type': {'id': names.index(event_type), 'name': str(event_type)},
+            'location': [float(rng.random() * 120), float(rng.random() * 80)],
+        }
+        if event_type not in TEAM_EVENTS:
+            row['player'] = {'id': int(player_id), 'name': f"player {player_id}"}
+        column, body = _nested(event_type, rng)
+        if column is not None:
+            row[column] = body
+        rows.append(row)
+
+    return pd.DataFrame(rows)
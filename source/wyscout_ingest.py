@@ -0,0 +1,306 @@
+import os
+import json
+import glob
+import time
+import argparse
+import resource
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DEFAULT_OUTPUT_DIR = "/mnt/block/data/final_datasets/match_detail"
+DEFAULT_TAGS_PATH = "/mnt/block/data/raw_data/tags2name.csv"
+
+# Read size of the incremental parser and rows per written row group
+READ_CHARS = 1 << 22
+BATCH_ROWS = 50_000
+PROGRESS_SECONDS = 10
+
+# Seconds added to eventSec so it runs on across periods, as in "1a. Data Preparation"
+PERIOD_OFFSETS = {'2H': 2700, 'E1': 5400, 'E2': 6300, 'P': 7200}
+
+# Wyscout events carry at most six tags; the notebook spreads them over
+# tag_1..tag_6 with a tag_<n>_name column each
+MAX_TAGS = 6
+
+_POSITION = pa.struct([('y', pa.int64()), ('x', pa.int64())])
+
+# The match_detail columns of notebook 1a, with the types fixed up front
+# rather than inferred per file
+MATCH_DETAIL_SCHEMA = pa.schema(
+    [('matchId', pa.int64()), ('matchPeriod', pa.string()), ('eventSec', pa.float64()),
+     ('eventId', pa.int32()), ('eventName', pa.string()), ('subEventId', pa.int32()), ('subEventName', pa.string()),
+     ('id', pa.int64()), ('playerId', pa.int64()), ('teamId', pa.int64()), ('positions', pa.list_(_POSITION))]
+    + [(f'tag_{i}', pa.int32()) for i in range(1, MAX_TAGS + 1)]
+    + [(f'tag_{i}_name', pa.string()) for i in range(1, MAX_TAGS + 1)]
+)
+
+_SCALAR_COLUMNS = ['matchId', 'matchPeriod', 'eventId', 'eventName', 'subEventId', 'subEventName', 'id', 'playerId', 'teamId']
+
+# -----------------------------
+# Incremental JSON parsing
+# -----------------------------
+def iter_json_array(path, read_chars=READ_CHARS, progress=None):
+    """
+    Yield the elements of a top-level JSON array one at a time, holding
+    only ``read_chars`` of text plus the element being decoded in memory.
+    ``progress(chars_read)`` is called after every read.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer, pos, chars_read, eof = '', 0, 0, False
+        started = False
+
+        def refill():
+            nonlocal buffer, pos, chars_read, eof
+            chunk = f.read(read_chars)
+            chars_read += len(chunk)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            if progress is not None:
+                progress(chars_read)
+
+        while True:
+            # Skip whitespace, and the separators between elements
+            skip = ' \t\r\n,' if started else ' \t\r\n'
+            while pos < len(buffer) and buffer[pos] in skip:
+                pos += 1
+            if pos == len(buffer):
+                if eof:
+                    raise ValueError(f"{path}: unexpected end of file")
+                refill()
+                continue
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError(f"{path}: expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Most likely the element runs past the buffer; read on, unless there is nothing left
+                if eof:
+                    raise
+                refill()
+                continue
+            if end == len(buffer) and not eof:
+                # A number cut off by the buffer end would decode short; make sure it is complete
+                refill()
+                continue
+            pos = end
+            yield element
+
+# -----------------------------
+# Flattening
+# -----------------------------
+def competition_name(path):
+    """'events_European_Championship.json' -> 'European_Championship'"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return name[len('events_'):] if name.startswith('events_') else name
+
+def load_tag_names(path=DEFAULT_TAGS_PATH):
+    """Tag id -> description from tags2name.csv, or {} when it is missing"""
+    if not path or not os.path.exists(path):
+        return {}
+    import pandas as pd
+    tags = pd.read_csv(path)
+    return dict(zip(tags['Tag'].astype(int), tags['Description']))
+
+class _Columns:
+    """Column lists of one record batch in MATCH_DETAIL_SCHEMA order"""
+
+    def __init__(self, tag_names):
+        self.tag_names = tag_names
+        self.clear()
+
+    def clear(self):
+        self.columns = {name: [] for name in MATCH_DETAIL_SCHEMA.names}
+        self.rows = 0
+
+    def add(self, event):
+        columns = self.columns
+        for name in _SCALAR_COLUMNS:
+            columns[name].append(event.get(name))
+        columns['eventSec'].append(event.get('eventSec', 0.0) + PERIOD_OFFSETS.get(event.get('matchPeriod'), 0))
+        columns['positions'].append(event.get('positions') or [])
+
+        tags = [tag.get('id') for tag in event.get('tags') or () if isinstance(tag, dict)]
+        if len(tags) > MAX_TAGS:
+            raise ValueError(f"event {event.get('id')} has {len(tags)} tags; the schema holds {MAX_TAGS}")
+        tags += [None] * (MAX_TAGS - len(tags))
+        for i, tag in enumerate(tags, start=1):
+            columns[f'tag_{i}'].append(tag)
+            columns[f'tag_{i}_name'].append(self.tag_names.get(tag) if tag is not None else None)
+        self.rows += 1
+
+    def to_batch(self):
+        return pa.RecordBatch.from_pydict(self.columns, schema=MATCH_DETAIL_SCHEMA)
+
+# -----------------------------
+# Ingestion
+# -----------------------------
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def ingest_file(json_path, output_dir=DEFAULT_OUTPUT_DIR, tag_names=None, batch_rows=BATCH_ROWS,
+                read_chars=READ_CHARS, progress_seconds=PROGRESS_SECONDS):
+    """
+    Stream one events_<Competition>.json into
+    ``<output_dir>/competition=<Competition>/part-0.parquet``, one row group
+    per ``batch_rows`` events. The file appears atomically once complete.
+    Returns a summary with the event count, throughput and peak RSS.
+    """
+    competition = competition_name(json_path)
+    partition_dir = os.path.join(output_dir, f"competition={competition}")
+    os.makedirs(partition_dir, exist_ok=True)
+    path = os.path.join(partition_dir, 'part-0.parquet')
+    # Dot-prefixed so dataset scans skip it while it is being written
+    tmp_path = os.path.join(partition_dir, '.part-0.parquet.tmp')
+
+    size = os.path.getsize(json_path)
+    start = last_report = time.perf_counter()
+    columns = _Columns(tag_names if tag_names is not None else {})
+    n_events = 0
+
+    def progress(chars_read):
+        nonlocal last_report
+        now = time.perf_counter()
+        if now - last_report >= progress_seconds:
+            last_report = now
+            print(f"  {competition}: {min(chars_read / size, 1):.0%} read, {n_events:,} events, "
+                  f"{n_events / (now - start):,.0f} events/s", flush=True)
+
+    with pq.ParquetWriter(tmp_path, MATCH_DETAIL_SCHEMA, compression='zstd') as writer:
+        for event in iter_json_array(json_path, read_chars, progress):
+            columns.add(event)
+            n_events += 1
+            if columns.rows >= batch_rows:
+                writer.write_batch(columns.to_batch())
+                columns.clear()
+        if columns.rows:
+            writer.write_batch(columns.to_batch())
+    os.replace(tmp_path, path)
+
+    seconds = time.perf_counter() - start
+    return {'competition': competition, 'path': path, 'events': n_events, 'seconds': seconds,
+            'mb_per_second': size / 1e6 / seconds, 'events_per_second': n_events / seconds,
+            'peak_rss_mb': _peak_rss_mb()}
+
+def _report(summary):
+    print(f"{summary['competition']}: {summary['events']:,} events in {summary['seconds']:.1f}s "
+          f"({summary['events_per_second']:,.0f} events/s, {summary['mb_per_second']:.1f} MB/s), "
+          f"peak RSS {summary['peak_rss_mb']:.0f} MB", flush=True)
+
+def ingest(json_paths, output_dir=DEFAULT_OUTPUT_DIR, tags_path=DEFAULT_TAGS_PATH, workers=None, **kwargs):
+    """
+    Ingest several competition files concurrently, one process per file.
+    Each worker process handles a single file, so its peak RSS is that
+    file's alone. Returns the per-file summaries.
+    """
+    tag_names = load_tag_names(tags_path)
+    workers = min(workers or os.cpu_count() or 1, len(json_paths))
+    start = time.perf_counter()
+    summaries = []
+    with ProcessPoolExecutor(workers, max_tasks_per_child=1) as pool:
+        futures = [pool.submit(ingest_file, path, output_dir, tag_names, **kwargs) for path in json_paths]
+        for future in as_completed(futures):
+            summaries.append(future.result())
+            _report(summaries[-1])
+
+    seconds = time.perf_counter() - start
+    n_events = sum(summary['events'] for summary in summaries)
+    print(f"Ingested {n_events:,} events from {len(json_paths)} files in {seconds:.1f}s "
+          f"({n_events / seconds:,.0f} events/s) into {output_dir}")
+    return summaries
+
+def read_match_detail(output_dir=DEFAULT_OUTPUT_DIR, columns=None, competitions=None):
+    """Read the partitioned match_detail back as a table, optionally for some competitions only"""
+    dataset = ds.dataset(output_dir, format='parquet', partitioning='hive')
+    row_filter = ds.field('competition').isin(list(competitions)) if competitions else None
+    return dataset.to_table(columns=columns, filter=row_filter)
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def write_synthetic_events(path, n_events, n_matches=50, seed=7):
+    """A Wyscout-shaped events file, written one event at a time"""
+    rng = np.random.default_rng(seed)
+    names = ['Pass', 'Duel', 'Others on the ball', 'Shot', 'Free Kick', 'Foul']
+    periods = ['1H', '2H', '1H', '2H', 'E1']
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for i in range(n_events):
+            event = {
+                'eventId': int(rng.integers(1, 10)), 'subEventName': 'Simple pass',
+                'tags': [{'id': int(tag)} for tag in rng.choice([101, 1801, 1802, 703, 1401], size=rng.integers(0, 4), replace=False)],
+                'playerId': int(rng.integers(0, 5000)),
+                'positions': [{'y': int(rng.integers(0, 101)), 'x': int(rng.integers(0, 101))} for _ in range(rng.integers(1, 3))],
+                'matchId': int(i * n_matches // n_events) + 2_500_000, 'eventName': names[rng.integers(len(names))],
+                'teamId': int(rng.integers(1, 40)), 'matchPeriod': periods[rng.integers(len(periods))],
+                'eventSec': float(rng.random() * 2700), 'subEventId': int(rng.integers(10, 90)), 'id': 180_000_000 + i,
+            }
+            f.write((',\n' if i else '') + json.dumps(event))
+        f.write(']\n')
+
+def _json_load_peak(path):
+    """Peak RSS of the notebook approach: json.load the whole file and build a frame from it"""
+    import pandas as pd
+    with open(path, 'r') as f:
+        data = json.load(f)
+    pd.DataFrame(data)
+    return len(data), _peak_rss_mb()
+
+def check_parity(json_path, parquet_path, tag_names):
+    """Assert that the streamed table holds exactly the rows a json.load of the file gives"""
+    with open(json_path, 'r') as f:
+        columns = _Columns(tag_names)
+        for event in json.load(f):
+            columns.add(event)
+    expected = pa.Table.from_batches([columns.to_batch()])
+    assert pq.read_table(parquet_path).equals(expected), "streamed table differs from json.load"
+
+def benchmark(n_files, n_events, workers=None):
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = [os.path.join(tmp_dir, f'events_Competition_{i}.json') for i in range(n_files)]
+        for i, path in enumerate(paths):
+            write_synthetic_events(path, n_events, seed=i)
+        print(f"{n_files} files of {n_events:,} events, {os.path.getsize(paths[0]) / 1e6:.0f} MB each")
+
+        output_dir = os.path.join(tmp_dir, 'match_detail')
+        ingest(paths, output_dir, tags_path=None, workers=workers)
+        check_parity(paths[0], os.path.join(output_dir, f"competition={competition_name(paths[0])}", 'part-0.parquet'), {})
+        print(f"Parity with json.load OK; {read_match_detail(output_dir, columns=['id']).num_rows:,} rows read back")
+
+        with ProcessPoolExecutor(1) as pool:
+            _, peak = pool.submit(_json_load_peak, paths[0]).result()
+        print(f"json.load + DataFrame of one file: peak RSS {peak:.0f} MB")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stream the Wyscout events_<Competition>.json files into partitioned Parquet')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run = subparsers.add_parser('ingest', help='ingest event files into match_detail/competition=<name>/')
+    run.add_argument('files', nargs='+', help='events_<Competition>.json files or glob patterns')
+    run.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    run.add_argument('--tags', default=DEFAULT_TAGS_PATH, help='tags2name.csv, for the tag_<n>_name columns')
+    run.add_argument('--batch-rows', type=int, default=BATCH_ROWS)
+    bench = subparsers.add_parser('benchmark', help='ingest synthetic files and compare peak memory with json.load')
+    bench.add_argument('--files', type=int, default=2)
+    bench.add_argument('--events', type=int, default=500_000)
+    for sub in (run, bench):
+        sub.add_argument('--workers', type=int, default=None, help='processes (default: all CPUs)')
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        paths = sorted({path for pattern in args.files for path in glob.glob(pattern)})
+        ingest(paths, args.output_dir, args.tags, args.workers, batch_rows=args.batch_rows)
+    else:
+        benchmark(args.files, args.events, args.workers)
@@ -0,0 +1,37 @@
+"""The blocked matcher against the pairwise SequenceMatcher baseline on synthetic sources"""
+import pytest
+
+from source.name_matching import MAPPING_COLUMNS, mapping_quality, match_players, sequence_matcher_mapping, synthetic_sources
+
+@pytest.fixture(scope='module')
+def sources():
+    return synthetic_sources(1_000)
+
+@pytest.fixture(scope='module')
+def mapping(sources):
+    wyscout, transfermarkt, _ = sources
+    return match_players(wyscout, transfermarkt, workers=1)
+
+def test_mapping_is_one_to_one(mapping):
+    assert list(mapping.columns) == MAPPING_COLUMNS
+    assert mapping['WyScoutID'].is_unique and mapping['TMarketID'].is_unique
+
+def test_blocked_matcher_is_accurate(sources, mapping):
+    precision, recall = mapping_quality(mapping, sources[2])
+    assert precision >= 0.99 and recall >= 0.98
+
+def test_at_least_as_good_as_sequence_matcher(sources, mapping):
+    wyscout, transfermarkt, truth = sources
+    sample = wyscout.iloc[:200]
+    baseline = sequence_matcher_mapping(sample, transfermarkt)
+    sampled = mapping[mapping['WyScoutID'].isin(sample['id'])]
+    sample_truth = {key: truth[key] for key in sample['id']}
+
+    precision, recall = mapping_quality(sampled, sample_truth)
+    baseline_precision, baseline_recall = mapping_quality(baseline, sample_truth)
+    assert precision >= baseline_precision and recall >= baseline_recall
+
+def test_process_pool_gives_the_same_mapping(sources, mapping):
+    wyscout, transfermarkt, _ = sources
+    pooled = match_players(wyscout, transfermarkt, workers=2, chunk_size=300)
+    assert pooled.equals(mapping)
@@ -0,0 +1,43 @@
+"""Incremental cluster and neighbour assignment against a full fit"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from source.heatmap_features import load_heatmap_features
+from source.player_assignment import PlayerMatcher, within_cluster_knn
+
+@pytest.fixture(scope='module')
+def players():
+    return pd.read_csv('data/final_player_df.csv'), load_heatmap_features('data')
+
+@pytest.fixture
+def matcher(players):
+    return PlayerMatcher.fit(*players, with_hnsw=False)
+
+def test_fit_lists_match_refresh_space(matcher):
+    features = np.asarray(matcher.index.features)
+    expected = within_cluster_knn(features, matcher.labels, np.arange(len(matcher.index.ids)), matcher.k)
+    np.testing.assert_array_equal(matcher.knn, expected)
+
+def test_noop_reassign_refreshes_nothing(players, matcher):
+    players_df, heatmap_dict = players
+    labels, knn = matcher.labels.copy(), matcher.knn.copy()
+    batch = players_df[players_df['id'].isin(matcher.index.ids[:50])]
+
+    report = matcher.assign(batch, heatmap_dict)
+    assert not report['rebuild']
+    assert len(report['changed']) == 50
+    assert report['refreshed'] == []
+    np.testing.assert_array_equal(matcher.labels, labels)
+    np.testing.assert_array_equal(matcher.knn, knn)
+
+def test_incremental_lists_match_a_full_recompute(players, matcher):
+    players_df, heatmap_dict = players
+    batch = players_df[players_df['id'].isin(matcher.index.ids[:6])].copy()
+    batch['goals'] = batch['goals'] + 3
+
+    report = matcher.assign(batch, heatmap_dict)
+    assert not report['rebuild'] and report['refreshed']
+    features = np.asarray(matcher.index.features)
+    expected = within_cluster_knn(features, matcher.labels, np.arange(len(matcher.index.ids)), matcher.k)
+    np.testing.assert_array_equal(matcher.knn, expected)
@@ -0,0 +1,30 @@
+"""Publishing and hot-reloading data snapshots"""
+import gc
+import os
+
+from source.snapshot import SnapshotManager, current_version, publish
+
+PLAYERS = 'data/final_player_df.csv'
+
+def test_prunes_in_publish_order(tmp_path):
+    # v10 sorts before v9 by name but was published after it
+    for n in range(8, 12):
+        publish(PLAYERS, snapshot_dir=str(tmp_path), version=f"v{n}", keep=2)
+    assert current_version(str(tmp_path)) == 'v11'
+    assert sorted(name for name in os.listdir(tmp_path) if name.startswith('v')) == ['v10', 'v11']
+
+def test_retired_snapshot_is_released(tmp_path):
+    snapshot_dir = str(tmp_path / 'snapshots')
+    publish(PLAYERS, 'data', snapshot_dir=snapshot_dir, version='v1')
+    manager = SnapshotManager(snapshot_dir, similarity_dir=str(tmp_path / 'none'))
+    manager.load()
+
+    held = manager.current
+    publish(PLAYERS, 'data', snapshot_dir=snapshot_dir, version='v2')
+    assert manager.reload()
+    assert manager.stats()['retired_alive'] == 1
+
+    del held
+    gc.collect()
+    stats = manager.stats()
+    assert (stats['version'], stats['retired'], stats['retired_alive']) == ('v2', 1, 0)
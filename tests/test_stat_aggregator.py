@@ -0,0 +1,41 @@
+"""Incremental stat totals against a full recompute"""
+import pandas as pd
+import pytest
+
+from source.event_stats import flatten_events
+from source.stat_aggregator import StatAggregator, check_consistency
+from source.synthetic_events import synthetic_events
+
+MATCHES_PER_DAY = 5
+
+@pytest.fixture(scope='module')
+def matchdays():
+    days = []
+    for day in range(3):
+        flat = flatten_events(synthetic_events(MATCHES_PER_DAY * 1_000, n_players=200, n_matches=MATCHES_PER_DAY, seed=day))
+        flat['match_id'] = flat['match_id'] + day * MATCHES_PER_DAY
+        days.append(flat)
+    return days
+
+def test_folded_matchdays_match_full_recompute(matchdays):
+    aggregator = StatAggregator()
+    for flat in matchdays:
+        aggregator.fold(flat)
+    check_consistency(aggregator, pd.concat(matchdays, ignore_index=True))
+
+def test_refolding_a_matchday_changes_nothing(matchdays):
+    aggregator = StatAggregator()
+    for flat in matchdays:
+        aggregator.fold(flat)
+    assert aggregator.fold(matchdays[-1]) == 0
+    check_consistency(aggregator, pd.concat(matchdays, ignore_index=True))
+
+def test_saved_totals_reload(matchdays, tmp_path):
+    aggregator = StatAggregator()
+    aggregator.fold(matchdays[0])
+    aggregator.save(tmp_path / 'state.parquet')
+
+    reloaded = StatAggregator.load(tmp_path / 'state.parquet')
+    reloaded.fold(matchdays[1])
+    assert reloaded.match_ids == set(pd.concat(matchdays[:2])['match_id'].dropna().astype(int))
+    check_consistency(reloaded, pd.concat(matchdays[:2], ignore_index=True))